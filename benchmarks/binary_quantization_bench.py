@@ -0,0 +1,107 @@
+"""
+Benchmark de VECTOR_SEARCH_MODE=binary_rerank (ver ingest/indexes.py).
+
+Compara, para cada consulta, el top-K por coseno exacto sobre todo el
+catálogo con la búsqueda en dos pasadas: top-C por distancia de Hamming
+sobre los códigos binarios (1 bit por dimensión, ``binary_quantize``) y
+re-ranking por coseno exacto de esos C. Informa recall@K y latencia por
+consulta (NumPy en proceso, sin índices: mide el coste relativo del
+escaneo, no el de HNSW en Postgres).
+
+Datos:
+- por defecto, embeddings sintéticos agrupados (centroides + ruido), que
+  imitan la estructura de un catálogo (muchas variantes por producto);
+- con ``--embeddings export.npy`` (matriz N×dim, p.ej. exportada de
+  ``productos.embedding``), las consultas son filas del catálogo con ruido.
+
+Uso:
+    python benchmarks/binary_quantization_bench.py
+    python benchmarks/binary_quantization_bench.py --embeddings productos.npy --k 25
+"""
+import argparse
+import time
+
+import numpy as np
+
+CANDIDATES = [100, 200, 400, 800, 1600]
+
+
+def synthetic_catalog(n: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    x = centroids[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    # Los embeddings de OpenAI no están centrados: sesgo común por dimensión
+    x += 0.5 * rng.standard_normal(dim).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def make_queries(catalog: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = catalog[rng.integers(0, len(catalog), n)]
+    q = base + 0.03 * rng.standard_normal(base.shape).astype(np.float32)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def pack(x: np.ndarray) -> np.ndarray:
+    """Bit a 1 si la componente es > 0 (como binary_quantize), 8 por byte."""
+    return np.packbits(x > 0, axis=1)
+
+
+def hamming(codes: np.ndarray, q_code: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(codes ^ q_code).sum(axis=1, dtype=np.int32)
+
+
+def exact_topk(catalog: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    sims = catalog @ q
+    top = np.argpartition(-sims, k)[:k]
+    return top[np.argsort(-sims[top])]
+
+
+def rerank_topk(catalog, codes, q, k: int, c: int) -> np.ndarray:
+    dist = hamming(codes, pack(q[None, :])[0])
+    cand = np.argpartition(dist, c)[:c]
+    sims = catalog[cand] @ q
+    top = np.argpartition(-sims, k)[:k]
+    return cand[top[np.argsort(-sims[top])]]
+
+
+def run(catalog: np.ndarray, queries: np.ndarray, k: int) -> None:
+    codes = pack(catalog)
+    n, dim = catalog.shape
+    print(
+        f"{n:,} productos × {dim} dims | float32 {catalog.nbytes / 2**20:,.1f} MB, "
+        f"bit {codes.nbytes / 2**20:,.1f} MB | {len(queries)} consultas | K={k}"
+    )
+
+    t0 = time.perf_counter()
+    truth = [exact_topk(catalog, q, k) for q in queries]
+    exact_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"{'exacto':>10} | recall@{k} 1.000 | {exact_ms:7.2f} ms/consulta")
+
+    for c in CANDIDATES:
+        if c >= n:
+            break
+        t0 = time.perf_counter()
+        found = [rerank_topk(catalog, codes, q, k, c) for q in queries]
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        recall = np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)])
+        print(f"{'C=' + str(c):>10} | recall@{k} {recall:.3f} | {ms:7.2f} ms/consulta")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings", help="matriz .npy N×dim exportada del catálogo")
+    parser.add_argument("--n", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=25)
+    args = parser.parse_args()
+
+    if args.embeddings:
+        catalog = np.load(args.embeddings).astype(np.float32)
+        catalog /= np.linalg.norm(catalog, axis=1, keepdims=True)
+    else:
+        catalog = synthetic_catalog(args.n, args.dim, args.clusters)
+    run(catalog, make_queries(catalog, args.queries), args.k)
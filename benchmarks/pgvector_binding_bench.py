@@ -0,0 +1,97 @@
+"""
+Benchmark del envío de embeddings a Postgres (utils/pgvector_binary.py).
+
+Compara, por consulta, los bytes del parámetro embedding que viajan al
+servidor en cada modo:
+
+- ``str``:    ``str(embedding)`` (ruta Text-to-SQL anterior)
+- ``list``:   la lista de floats → literal ``float8[]`` + CAST (ruta híbrida anterior)
+- ``text``:   VectorParam sin tipo vector registrado (literal de pgvector)
+- ``binary``: VectorParam con envío binario (4 + 4·dim bytes)
+
+Con ``PGVECTOR_BENCH_URL`` (Postgres con la extensión vector) mide además,
+para cada modo, la latencia de ``SELECT CAST(%s AS vector) <=> CAST(%s AS
+vector)`` con el mismo parámetro dos veces: incluye el parseo/conversión
+del literal en el servidor, que es lo que desaparece con el binario.
+``EXPLAIN`` no separa ese coste, así que la diferencia entre modos sobre
+la misma conexión es la medida.
+
+Uso:
+    python benchmarks/pgvector_binding_bench.py            # solo bytes
+    PGVECTOR_BENCH_URL=postgresql://... python benchmarks/pgvector_binding_bench.py
+"""
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+from psycopg.adapt import PyFormat, Transformer  # noqa: E402
+
+from utils.pgvector_binary import VectorBinaryDumper, VectorParam, register_vector_binary  # noqa: E402
+
+DIM = 1536
+
+
+def synthetic_embedding(seed: int):
+    # Como los devuelve la API de OpenAI: floats de ~9 decimales
+    rng = random.Random(seed)
+    return [round(rng.gauss(0, 0.025), 9) for _ in range(DIM)]
+
+
+def _params(embedding):
+    return {
+        "str": str(embedding),
+        "list": embedding,
+        "text": VectorParam(embedding),
+    }
+
+
+def wire_bytes(n: int = 50) -> None:
+    tx = Transformer()
+    sizes = {"str": [], "list": [], "text": [], "binary": []}
+    for seed in range(n):
+        embedding = synthetic_embedding(seed)
+        for mode, value in _params(embedding).items():
+            sizes[mode].append(len(tx.get_dumper(value, PyFormat.AUTO).dump(value)))
+        sizes["binary"].append(len(VectorBinaryDumper(VectorParam).dump(VectorParam(embedding))))
+    for mode, values in sizes.items():
+        print(f"{mode:>7} | {np.mean(values):9,.0f} bytes/parámetro")
+
+
+def roundtrip(url: str, repeats: int = 200) -> None:
+    import psycopg
+
+    sql = "SELECT CAST(%(e)s AS vector) <=> CAST(%(e)s AS vector)"
+    embeddings = [synthetic_embedding(seed) for seed in range(repeats)]
+    with psycopg.connect(url, autocommit=True) as conn:
+        modes = dict(_params(embeddings[0]))
+        results = {}
+        for mode in list(modes) + ["binary"]:
+            if mode == "binary" and not register_vector_binary(conn):
+                print("   (sin extensión vector: se omite binary)")
+                continue
+            latencies = []
+            for embedding in embeddings:
+                value = VectorParam(embedding) if mode in ("text", "binary") else _params(embedding)[mode]
+                t0 = time.perf_counter()
+                conn.execute(sql, {"e": value}).fetchone()
+                latencies.append((time.perf_counter() - t0) * 1000)
+            results[mode] = np.array(latencies)
+        for mode, lat in results.items():
+            print(
+                f"{mode:>7} | p50 {np.percentile(lat, 50):7.3f} ms | "
+                f"p95 {np.percentile(lat, 95):7.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    print(f"Bytes del parámetro embedding ({DIM} dims):")
+    wire_bytes()
+    url = os.getenv("PGVECTOR_BENCH_URL")
+    if url:
+        print("\nRound trip (parseo + conversión en el servidor):")
+        roundtrip(url.replace("postgresql+psycopg://", "postgresql://", 1))
@@ -0,0 +1,76 @@
+"""
+Benchmark del índice trigram en proceso (utils/trigram_index.py).
+
+Genera nombres de producto sintéticos, construye el índice y mide la
+latencia de búsqueda con el umbral de pg_trgm (0.3).
+
+Uso:
+    python benchmarks/trigram_index_bench.py                  # 100k, 1M, 10M
+    python benchmarks/trigram_index_bench.py 100000 1000000   # tamaños a medida
+
+10M nombres necesitan varios GB de RAM y minutos de construcción
+(la extracción de trigramas es Python puro).
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+
+from utils.trigram_index import TrigramIndex  # noqa: E402
+
+_PRODUCTOS = [
+    "queso", "leche", "aceite", "crema", "mantequilla", "tortilla", "jamón", "salchicha",
+    "yogur", "harina", "azúcar", "arroz", "frijol", "café", "chocolate", "galleta",
+    "pan", "atún", "sardina", "mayonesa", "mostaza", "cátsup", "vinagre", "sal",
+]
+_VARIANTES = [
+    "panela", "oaxaca", "manchego", "entera", "deslactosada", "ácida", "de oliva",
+    "vegetal", "de maíz", "de pavo", "natural", "integral", "refinada", "molido",
+    "extra virgen", "light", "orgánico", "sin sal", "con chile", "en aceite",
+]
+_MARCAS = ["Lala", "Alpura", "Gloria", "Nutrioli", "Bimbo", "Herdez", "La Costeña",
+           "Sabori", "Fud", "Nestlé", "Maseca", "Verde Valle", "Dolores", "McCormick"]
+_QUERIES = ["queso panela", "aceite de oliva", "leche deslactosada", "jamon pavo",
+            "cafe molido", "tortillas", "mayonesa mccormick", "atun en aceite"]
+
+
+def synthetic_names(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        yield (
+            f"{rng.choice(_PRODUCTOS)} {rng.choice(_VARIANTES)} {rng.choice(_MARCAS)} "
+            f"{rng.randint(1, 5000)}{rng.choice(['g', 'ml', 'kg', 'L'])}"
+        )
+
+
+def bench(n: int, repeats: int = 20) -> None:
+    names = list(synthetic_names(n))
+    t0 = time.perf_counter()
+    index = TrigramIndex(names, range(n))
+    build_s = time.perf_counter() - t0
+    del names
+
+    latencies, matches = [], 0
+    for _ in range(repeats):
+        for q in _QUERIES:
+            t0 = time.perf_counter()
+            ids, _ = index.search(q, threshold=0.3)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            matches += len(ids)
+
+    lat = np.array(latencies)
+    print(
+        f"{n:>11,} nombres | build {build_s:7.1f}s | postings {index.nbytes / 2**20:8.1f} MiB | "
+        f"p50 {np.percentile(lat, 50):8.2f} ms | p95 {np.percentile(lat, 95):8.2f} ms | "
+        f"matches/consulta {matches / len(latencies):,.0f}"
+    )
+
+
+if __name__ == "__main__":
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000]
+    for size in sizes:
+        bench(size)
@@ -22,6 +22,8 @@ from chat.agent.graph import (
     get_agent_graph,
 )
 from chat.config.settings import settings
+from chat.services.session_candidates import session_candidates
+from chat.services.tool_memo import tool_memo
 
 logger = logging.getLogger(__name__)
 
@@ -119,6 +121,8 @@ class Chatbot:
     def reset(self):
         """Reset conversation state."""
         logger.info(f"🔄 Resetting session: {self.session_id[:8]}…")
+        session_candidates.clear(self.session_id)
+        tool_memo.clear(self.session_id)
         self.state = create_initial_agent_state(
             session_id=self.session_id,
             user_phone=self.user_phone,
@@ -3,6 +3,9 @@ Agent Graph — 2-node tool-calling agent built with LangGraph.
 
 Loop: agent (LLM decides) → tools (execute) → agent (evaluate) → … → END
 
+Terminal tools (output marked final-render, e.g. the provider card) go
+tools → render → END instead: no second LLM pass just to echo them.
+
 The LLM autonomously decides routing via tool selection.
 """
 import logging
@@ -13,7 +16,6 @@ from operator import add
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import (
     AIMessage,
     BaseMessage,
@@ -22,8 +24,11 @@ from langchain_core.messages import (
 )
 
 from chat.config.settings import settings
-from chat.agent.tools import ALL_TOOLS
+from chat.graph.state import SearchCursor
+from chat.services.tool_memo import tool_memo
+from chat.agent.tools import ALL_TOOLS, FINAL_RENDER
 from chat.agent.prompts import build_agent_system_prompt, PLATFORM_STRONG
+from utils.llm_clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +41,7 @@ class AgentState(TypedDict, total=False):
     turn_number: int
     user_phone: Optional[str]
     platform_exhausted: bool
+    search_cursor: Optional[SearchCursor]  # Última búsqueda, para "mostrar más" por id
 
 
 def create_initial_agent_state(
@@ -49,6 +55,7 @@ def create_initial_agent_state(
         turn_number=0,
         user_phone=user_phone,
         platform_exhausted=False,
+        search_cursor=None,
     )
 
 
@@ -62,7 +69,7 @@ _PLATFORM_BLOCK_MSG = (
 
 
 # ── LLM with tools bound ───────────────────────────────────────────
-_llm = ChatOpenAI(model=settings.ROUTER_MODEL, temperature=0.3)
+_llm = get_chat_model(settings.ROUTER_MODEL, temperature=0.3)
 _llm_with_tools = _llm.bind_tools(ALL_TOOLS)
 
 
@@ -100,24 +107,61 @@ def agent_node(state: AgentState) -> Dict[str, Any]:
              if isinstance(m, ToolMessage) and "DETALLE_PROVEEDOR:" in (m.content or "")),
             None,
         )
+        _prov_name = None
         if _detail_msg:
             # Extract provider name from "📋 **Nombre**"
             import re
             _name_match = re.search(r"📋 \*\*(.+?)\*\*", _detail_msg.content or "")
             _prov_name = _name_match.group(1) if _name_match else "este proveedor"
-            response.content += (
-                f"\n\n💡 ¿Sabías que en nuestra plataforma {settings.PLATFORM_URL} "
-                f"podrás encontrar todos los productos de *{_prov_name}* con los mejores "
-                f"precios del mercado? Y no solo de este proveedor, sino de todos los "
-                f"proveedores especializados para el sector gastronómico en la CDMX."
-            )
-
-        if turn >= settings.CONSULTAS_ANTES_DERIVACION:
-            response.content += PLATFORM_STRONG
+        response.content = _with_platform_suffix(response.content, turn, _prov_name)
 
     return {"messages": [response]}
 
 
+def _with_platform_suffix(content: str, turn: int, provider_name: Optional[str] = None) -> str:
+    """Deterministic suffixes of a final answer: provider CTA and PLATFORM_STRONG."""
+    if provider_name:
+        content += (
+            f"\n\n💡 ¿Sabías que en nuestra plataforma {settings.PLATFORM_URL} "
+            f"podrás encontrar todos los productos de *{provider_name}* con los mejores "
+            f"precios del mercado? Y no solo de este proveedor, sino de todos los "
+            f"proveedores especializados para el sector gastronómico en la CDMX."
+        )
+    if turn >= settings.CONSULTAS_ANTES_DERIVACION:
+        content += PLATFORM_STRONG
+    return content
+
+
+def _last_tool_messages(state: AgentState) -> List[ToolMessage]:
+    """ToolMessages produced by the last tools step (after the last AIMessage)."""
+    out: List[ToolMessage] = []
+    for m in reversed(state.get("messages", [])):
+        if not isinstance(m, ToolMessage):
+            break
+        out.append(m)
+    return out[::-1]
+
+
+def _is_final_render(m: ToolMessage) -> bool:
+    return isinstance(m.artifact, dict) and bool(m.artifact.get(FINAL_RENDER))
+
+
+def render_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Terminal tools node: the tool output is the answer (e.g. the provider
+    card from detalle_proveedor). No LLM call — only the deterministic
+    suffixes the agent node would add.
+    """
+    tool_msgs = _last_tool_messages(state)
+    content = "\n\n".join(m.artifact[FINAL_RENDER] for m in tool_msgs)
+    provider_name = next(
+        (m.artifact["proveedor"] for m in tool_msgs if m.artifact.get("proveedor")), None
+    )
+    logger.info(f"🪪 Terminal tool output rendered verbatim ({len(tool_msgs)} tool message(s), 0 tokens)")
+    content = _with_platform_suffix(content, state.get("turn_number", 0), provider_name)
+    return {"messages": [AIMessage(content=content)]}
+
+
 def should_continue(state: AgentState) -> Literal["tools", "__end__"]:
     """Route: if the LLM issued tool calls → execute them; else → END."""
     last = state["messages"][-1]
@@ -126,24 +170,37 @@ def should_continue(state: AgentState) -> Literal["tools", "__end__"]:
     return END
 
 
+def after_tools(state: AgentState) -> Literal["agent", "render"]:
+    """Route: every result of the tools step is final-render → render; else → agent."""
+    tool_msgs = _last_tool_messages(state)
+    if tool_msgs and all(_is_final_render(m) for m in tool_msgs):
+        return "render"
+    return "agent"
+
+
 # ── Build graph ─────────────────────────────────────────────────────
 def create_agent_graph() -> StateGraph:
     """Create the 2-node tool-calling agent graph.
 
     Graph:
         START → agent → [tool_calls?]
-                         ├─ yes → tools → agent (loop)
+                         ├─ yes → tools → [final-render output?]
+                         │                 ├─ yes → render → END
+                         │                 └─ no  → agent (loop)
                          └─ no  → END
     """
     logger.info("🔧 Building agent graph (2-node tool-calling)…")
 
     graph = StateGraph(AgentState)
     graph.add_node("agent", agent_node)
-    graph.add_node("tools", ToolNode(ALL_TOOLS))
+    # Repeated identical tool calls are served from tool_memo
+    graph.add_node("tools", ToolNode(ALL_TOOLS, wrap_tool_call=tool_memo.wrap))
 
     graph.add_edge(START, "agent")
     graph.add_conditional_edges("agent", should_continue, ["tools", END])
-    graph.add_edge("tools", "agent")
+    graph.add_node("render", render_node)
+    graph.add_conditional_edges("tools", after_tools, ["agent", "render"])
+    graph.add_edge("render", END)
 
     logger.info("✅ Agent graph built successfully")
     return graph.compile()
@@ -5,17 +5,26 @@ Each tool is a LangChain @tool that the agent LLM can choose to call.
 """
 import logging
 import re
-from typing import Optional, Literal
+from typing import Annotated, Optional, Literal, Tuple, Union
 
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import InjectedToolCallId, tool
+from langgraph.prebuilt import InjectedState
+from langgraph.types import Command
 
 from chat.config.settings import settings
+from chat.services.brand_facets import format_facets, total_proveedores
 from chat.services.data_transformer import DataTransformer
-from chat.services.whatsapp_formatter import WhatsAppFormatter
 from chat.services.email_service import email_service
+from chat.services.prefetch import prefetch_key, prefetcher
+from chat.services.provider_directory import provider_directory
+from chat.services.query_planner import query_planner, QueryPath
+from chat.services.search_cursor import build_search_cursor, next_page, provider_id_for, remaining
+from chat.services.session_candidates import filter_by_brand, session_candidates
 from chat.graph.state import RelevanciaLevel, SearchResults, ProveedorResult
 from chat.graph.nodes.query import QueryNode
+from utils.llm_clients import get_chat_model
+from utils.spell_corrector import get_spell_corrector
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +32,115 @@ logger = logging.getLogger(__name__)
 _qn = QueryNode()
 _transformer = DataTransformer()
 
-# ── Relevance threshold (same as query.py) ──────────────────────────
-_RELEVANCE_THRESHOLD = 0.55
+# ── Relevance threshold (applied in the hybrid SQL) ─────────────────
+_RELEVANCE_THRESHOLD = settings.RELEVANCE_THRESHOLD
+
+# Rows fetched by the first search of a product: with session candidates
+# they back the brand / price / "mostrar más" follow-ups in memory
+_SEARCH_TOP_K = settings.SESSION_CANDIDATES_TOP_K if settings.SESSION_CANDIDATES_ENABLED else 25
+
+
+def _spell_check(producto: str) -> Tuple[str, Optional[str]]:
+    """
+    Fallback query for a search that found nothing: misspellings corrected
+    against the catalog vocabulary (no LLM call) and, if it changed, a note
+    for the agent. Only used after the original query came back empty, so
+    correctly spelled products the catalog doesn't carry ("pulpo") are not
+    swapped for a neighbour ("pulpa").
+    """
+    corrector = get_spell_corrector()
+    correction = corrector.correct(producto) if corrector else None
+    if correction is None:
+        return producto, None
+    corrected = correction["corrected"]
+    return corrected, (
+        f"CORRECCIÓN: no hubo resultados para '{producto}'; se buscó '{corrected}'. "
+        f"Menciónalo al usuario (\"¿Quisiste decir {corrected}?\")."
+    )
+
+
+def _search_product_rows(producto: str, marca: Optional[str], session_id: Optional[str]) -> list:
+    """Rows for buscar_productos: session candidates, brand facets, planner / race, brand-less retry."""
+    entities = {"producto": producto}
+    if marca:
+        entities["marca"] = marca
+
+    rows = []
+    used_llm_sql = False
+
+    # 0) Same product as this session's last search: reuse its candidate
+    #    set (brand filter in memory, no embedding, no catalog search)
+    candidates = session_candidates.get(session_id, producto)
+    if candidates is not None:
+        rows = filter_by_brand(candidates, marca) if marca else candidates
+
+    # 0b) Brand picked from a BRANDS_FOUND list: filter the cached candidate
+    #     set of that listing in memory instead of searching again
+    if not rows and marca:
+        rows = _qn._execute_brand_search(producto, marca, min_score=_RELEVANCE_THRESHOLD) or []
+
+    if not rows:
+        # 1) Planner: pre-vetted SQL template (no LLM) for common shapes
+        plan = query_planner.plan(entities)
+        if plan:
+            query_planner.record(QueryPath.TEMPLATE)
+            rows = _qn._execute_plan(plan, min_score=_RELEVANCE_THRESHOLD, top_k=_SEARCH_TOP_K)
+        else:
+            # 1b) Shapes the planner can't express: race Text-to-SQL vs hybrid
+            query_planner.record(QueryPath.LLM_SQL)
+            race = _qn._race_llm_and_hybrid(
+                producto, entities, min_score=_RELEVANCE_THRESHOLD, marca=marca
+            )
+            rows = race["rows"]
+            used_llm_sql = race["winner"] == "llm_sql"
+        if rows and not marca and not used_llm_sql:
+            session_candidates.put(session_id, producto, rows)
+
+    # 2) Fallback: if no results with brand filter, retry without
+    if not rows and marca:
+        rows = _qn._execute_hybrid_search(
+            search_query=producto, marca=None, min_score=_RELEVANCE_THRESHOLD
+        )
+
+    return rows
+
+
+def _price_entries(
+    producto: str, marca: Optional[str], precio_max: Optional[float], session_id: Optional[str]
+) -> list:
+    """
+    Price entries for filtrar_por_precio: prefetched or price search. Not
+    from session candidates: those rows are capped per provider and by
+    relevance, so the cheapest match can be missing from them.
+    """
+    # 1) Prefetched right after buscar_productos (same product and brand)
+    if precio_max is None:
+        precios = prefetcher.take(session_id, "precios", prefetch_key(producto, marca))
+        if precios:
+            return precios
+    # 2) Uncapped price search (result cache keyed by product / brand / range)
+    return _qn._execute_price_search(producto, marca, precio_max=precio_max)
+
+
+def _prefetch_follow_ups(
+    session_id: Optional[str], producto: str, marca: Optional[str], shown: list
+) -> None:
+    """
+    Warm the turn the prompt steers to ("¿Quieres ver precios?" / "¿Info
+    de contacto?") in the background; see chat/services/prefetch.py.
+    """
+    prefetcher.schedule(
+        session_id, "precios", prefetch_key(producto, marca),
+        lambda: _qn._execute_price_search(producto, marca),
+    )
+    if provider_directory.ready():
+        return  # cards are already served from memory
+    # Keyed by id: detalle_proveedor maps the typed name back to it (provider_id_for)
+    for p in shown:
+        prefetcher.schedule(
+            session_id, "detalle", prefetch_key(str(p["proveedor_id"])),
+            lambda nombre=p["proveedor"]: _qn._provider_entry(nombre),
+        )
 
 
 # ─────────────────────────────────────────────────────────────────────
@@ -33,8 +149,10 @@ _RELEVANCE_THRESHOLD = 0.55
 @tool
 def buscar_productos(
     producto: str,
+    tool_call_id: Annotated[str, InjectedToolCallId],
     marca: Optional[str] = None,
-) -> str:
+    state: Annotated[Optional[dict], InjectedState] = None,
+) -> Union[str, Command]:
     """Busca productos y proveedores en la base de datos gastronómica.
 
     Usa esta herramienta cuando el usuario busca un producto, ingrediente
@@ -46,37 +164,19 @@ def buscar_productos(
         marca: Marca específica si el usuario la menciona (ej: "Capullo").
     """
     logger.info(f"🔧 TOOL buscar_productos: producto='{producto}', marca={marca}")
-
-    # 1) Intentar Text-to-SQL
-    entities = {"producto": producto}
-    if marca:
-        entities["marca"] = marca
-
-    rows = []
-    used_llm_sql = False
-
-    result = _qn._generate_sql_with_llm(producto, entities)
-    if result:
-        sql, params = result
-        rows = _qn._execute_llm_sql(sql, params)
-        if rows:
-            rows = [r for r in rows if hasattr(r, "score") and float(r.score) >= _RELEVANCE_THRESHOLD]
-            if rows:
-                used_llm_sql = True
-
-    # 2) Fallback: hybrid search
+    session_id = (state or {}).get("session_id")
+    rows = _search_product_rows(producto, marca, session_id)
+    correccion = None
     if not rows:
-        rows = _qn._execute_hybrid_search(search_query=producto, marca=marca)
-        if rows:
-            rows = [r for r in rows if hasattr(r, "score") and float(r.score) >= _RELEVANCE_THRESHOLD]
-        # If no results with brand filter, retry without
-        if not rows and marca:
-            rows = _qn._execute_hybrid_search(search_query=producto, marca=None)
-            if rows:
-                rows = [r for r in rows if hasattr(r, "score") and float(r.score) >= _RELEVANCE_THRESHOLD]
+        # Nothing for the words as typed: retry once with the spelling fixed
+        corrected, correccion = _spell_check(producto)
+        if correccion:
+            producto = corrected
+            rows = _search_product_rows(producto, marca, session_id)
 
     if not rows:
-        return f"NO_RESULTS: No se encontraron proveedores de '{producto}' en la base de datos."
+        no_results = f"NO_RESULTS: No se encontraron proveedores de '{producto}' en la base de datos."
+        return f"{no_results}\n{correccion}" if correccion else no_results
 
     # 3) Format results
     productos_list = [_transformer.row_to_producto(r) for r in rows]
@@ -87,18 +187,33 @@ def buscar_productos(
 
     # ── Branch: multiple brands and no brand filter → show brands only ──
     if len(marcas) > 1 and not marca:
-        shown_marcas = marcas[:10]
-        extra = len(marcas) - len(shown_marcas)
+        # Facets over the whole candidate set (not just these rows); their
+        # ids also answer the follow-up search once a brand is picked
+        facets = None
+        if settings.BRAND_FACETS_ENABLED:
+            try:
+                facets = _qn._execute_brand_facets(producto, min_score=_RELEVANCE_THRESHOLD)
+            except Exception as e:
+                logger.warning(f"⚠️  Brand facets failed, using fetched rows: {e}")
+        if facets:
+            marcas = [f["marca"] for f in facets]
+            total = max(total, total_proveedores(facets))
+            marcas_txt = format_facets(facets[:10])
+        else:
+            marcas_txt = ", ".join(marcas[:10])
+        extra = len(marcas) - min(len(marcas), 10)
         lines = [
             f"BRANDS_FOUND: Se encontraron {total} proveedores de '{producto}' "
             f"en {len(marcas)} marcas distintas.",
             "",
-            f"Marcas disponibles: {', '.join(shown_marcas)}"
+            f"Marcas disponibles: {marcas_txt}"
             + (f" y {extra} más" if extra > 0 else ""),
             "",
             "INSTRUCCIÓN: Presenta las marcas al usuario y pregunta si tiene "
             "preferencia de marca. NO muestres proveedores ni precios todavía.",
         ]
+        if correccion:
+            lines.insert(0, correccion)
         return "\n".join(lines)
 
     # ── Single brand or brand already filtered → show providers (NO prices) ──
@@ -107,6 +222,8 @@ def buscar_productos(
     hidden_count = total - show_max
 
     lines = [f"Se encontraron {total} proveedores de '{producto}'."]
+    if correccion:
+        lines.insert(0, correccion)
     if marcas:
         lines.append(f"Marca(s): {', '.join(marcas[:8])}")
     lines.append("")
@@ -129,7 +246,13 @@ def buscar_productos(
         "productos encontrados. Ofrece '¿Quieres ver precios?' o '¿Info de contacto?'"
     )
 
-    return "\n".join(lines)
+    # Cursor for "mostrar más": next pages are fetched by id, not re-searched
+    cursor = build_search_cursor(producto, marca, proveedores, productos_list, shown=show_max)
+    _prefetch_follow_ups(session_id, producto, marca, shown)
+    return Command(update={
+        "search_cursor": cursor,
+        "messages": [ToolMessage(content="\n".join(lines), tool_call_id=tool_call_id)],
+    })
 
 
 # ─────────────────────────────────────────────────────────────────────
@@ -140,6 +263,7 @@ def filtrar_por_precio(
     producto: str,
     marca: Optional[str] = None,
     precio_max: Optional[float] = None,
+    state: Annotated[Optional[dict], InjectedState] = None,
 ) -> str:
     """Busca y ordena proveedores por precio para un producto.
 
@@ -152,15 +276,22 @@ def filtrar_por_precio(
         precio_max: Precio máximo si el usuario lo menciona.
     """
     logger.info(f"🔧 TOOL filtrar_por_precio: '{producto}', marca={marca}, max={precio_max}")
-
-    precios = _qn._execute_price_search(producto, marca)
-    if precio_max is not None:
-        precios = [p for p in precios if p["precio_unidad"] <= precio_max]
+    session_id = (state or {}).get("session_id")
+    precios = _price_entries(producto, marca, precio_max, session_id)
+    correccion = None
+    if not precios:
+        # Nothing for the words as typed: retry once with the spelling fixed
+        corrected, correccion = _spell_check(producto)
+        if correccion:
+            producto = corrected
+            precios = _price_entries(producto, marca, precio_max, session_id)
 
     if not precios:
         return f"No encontré precios para '{producto}'. Prueba buscando el producto primero con buscar_productos."
 
     lines = [f"Precios de '{producto}' (ordenados de menor a mayor):"]
+    if correccion:
+        lines.insert(0, correccion)
     for p in precios:
         prod_name = p.get("producto", "")
         marca_p = p.get("marca", "")
@@ -176,8 +307,16 @@ def filtrar_por_precio(
 # ─────────────────────────────────────────────────────────────────────
 # Tool 3 – Provider detail
 # ─────────────────────────────────────────────────────────────────────
-@tool
-def detalle_proveedor(nombre_proveedor: str) -> str:
+# Terminal tools: a ToolMessage whose artifact holds FINAL_RENDER is shown
+# to the user as-is; the graph skips the second agent pass (see graph.py)
+FINAL_RENDER = "final_render"
+
+
+@tool(response_format="content_and_artifact")
+def detalle_proveedor(
+    nombre_proveedor: str,
+    state: Annotated[Optional[dict], InjectedState] = None,
+) -> Tuple[str, Optional[dict]]:
     """Obtiene información detallada y contacto de un proveedor específico.
 
     Usa cuando el usuario pide más info, contacto o datos de un proveedor.
@@ -188,80 +327,40 @@ def detalle_proveedor(nombre_proveedor: str) -> str:
     """
     logger.info(f"🔧 TOOL detalle_proveedor: '{nombre_proveedor}'")
 
-    from sqlalchemy import text as sa_text
-
-    sql = sa_text("""
-        SELECT pr.id_proveedor, pr.nombre_comercial, pr.descripcion,
-               pr.nombre_ejecutivo_ventas, pr.whatsapp_ventas, pr.pagina_web,
-               pr.nivel_membresia, pr.calificacion_usuarios,
-               similarity(pr.nombre_comercial, :nombre) as sim
-        FROM proveedores pr
-        WHERE similarity(pr.nombre_comercial, :nombre) > 0.3
-        ORDER BY similarity(pr.nombre_comercial, :nombre) DESC
-        LIMIT 1
-    """)
-
     try:
-        with _qn.engine.connect() as conn:
-            row = conn.execute(sql, {"nombre": nombre_proveedor}).fetchone()
-
-        if not row:
-            return f"No encontré un proveedor llamado '{nombre_proveedor}'. Verifica el nombre."
-
-        whatsapp_list, whatsapp_links = WhatsAppFormatter.format_numbers(row.whatsapp_ventas)
-
-        def _fmt_phone(num: str) -> str:
-            if len(num) >= 12 and num.startswith("52"):
-                return f"+{num[:2]} {num[2:4]} {num[4:8]} {num[8:]}"
-            return num
-
-        # ── Rich formatting (deterministic — LLM must return verbatim) ──
-        lines = [f"📋 **{row.nombre_comercial}**\n"]
-
-        descripcion = row.descripcion or ""
-        if descripcion and descripcion != "Sin descripción disponible":
-            lines.append(f"📝 *Descripción:* {descripcion}\n")
-
-        lines.append("📞 **Información de contacto:**")
-
-        ejecutivo = row.nombre_ejecutivo_ventas or "No especificado"
-        if ejecutivo and ejecutivo != "No especificado":
-            lines.append(f"· Ejecutivo de ventas: {ejecutivo}")
-
-        if whatsapp_list:
-            whatsapp_text = ", ".join(_fmt_phone(n) for n in whatsapp_list)
-            lines.append(f"· WhatsApp: {whatsapp_text}")
-            if whatsapp_links:
-                lines.append(f"· 💬 Contactar: {whatsapp_links[0]}")
-        else:
-            lines.append("· WhatsApp: No disponible")
-
-        if row.pagina_web:
-            lines.append(f"· 🌐 Web: {row.pagina_web}")
-
-        if row.calificacion_usuarios and row.calificacion_usuarios > 0:
-            cal = float(row.calificacion_usuarios)
-            stars = "⭐" * int(cal)
-            lines.append(f"\n⭐ Calificación: {stars} ({cal}/5)")
-
-        lines.append("\n¿Te gustaría ver los productos de este proveedor o contactarlo directamente?")
-
-        return (
+        entry = None
+        # A provider from the last search may have its card prefetched
+        proveedor_id = provider_id_for((state or {}).get("search_cursor"), nombre_proveedor)
+        if proveedor_id is not None:
+            entry = prefetcher.take(
+                (state or {}).get("session_id"), "detalle", prefetch_key(str(proveedor_id))
+            )
+        entry = entry or _qn._provider_entry(nombre_proveedor)
+
+        if not entry:
+            return f"No encontré un proveedor llamado '{nombre_proveedor}'. Verifica el nombre.", None
+
+        content = (
             "DETALLE_PROVEEDOR:\n"
-            + "\n".join(lines)
+            + entry["card"]
             + "\n\nINSTRUCCIÓN: Muestra esta tarjeta TAL CUAL al usuario, sin modificarla."
         )
+        return content, {FINAL_RENDER: entry["card"], "proveedor": entry["nombre"]}
 
     except Exception as e:
         logger.error(f"❌ detalle_proveedor error: {e}")
-        return f"Error al buscar información del proveedor: {e}"
+        return f"Error al buscar información del proveedor: {e}", None
 
 
 # ─────────────────────────────────────────────────────────────────────
 # Tool 4 – Show more providers
 # ─────────────────────────────────────────────────────────────────────
 @tool
-def mostrar_mas_proveedores(producto: str) -> str:
+def mostrar_mas_proveedores(
+    producto: str,
+    state: Annotated[dict, InjectedState],
+    tool_call_id: Annotated[str, InjectedToolCallId],
+) -> Union[str, Command]:
     """Muestra proveedores adicionales para un producto ya buscado.
 
     Usa cuando el usuario dice "muéstrame más", "hay más proveedores?",
@@ -272,9 +371,52 @@ def mostrar_mas_proveedores(producto: str) -> str:
     """
     logger.info(f"🔧 TOOL mostrar_mas_proveedores: '{producto}'")
 
-    rows = _qn._execute_hybrid_search(search_query=producto, marca=None)
-    if rows:
-        rows = [r for r in rows if hasattr(r, "score") and float(r.score) >= _RELEVANCE_THRESHOLD]
+    page = next_page(
+        state.get("search_cursor"), producto,
+        page_size=settings.SHOW_MORE_PAGE_SIZE, ttl_seconds=settings.SEARCH_CURSOR_TTL,
+    )
+    if page is None:
+        # No usable cursor (expired, other product, LLM-SQL path) → search again
+        return _mostrar_mas_por_busqueda(producto, state.get("session_id"))
+
+    provider_ids, product_ids, cursor = page
+    total = len(cursor["provider_ids"])
+    if not provider_ids:
+        text = f"Ya se mostraron todos los proveedores de '{producto}' ({total} en total)."
+    else:
+        logger.info(f"📄 Search cursor page: {len(provider_ids)} providers by id (no re-search)")
+        rows = (
+            session_candidates.rows_by_ids(state.get("session_id"), product_ids)
+            or _qn._fetch_products_by_ids(product_ids)
+        )
+        productos_list = [_transformer.row_to_producto(r) for r in rows]
+        rank = {pid: i for i, pid in enumerate(provider_ids)}
+        proveedores = sorted(
+            _transformer.proveedores_con_precios(productos_list),
+            key=lambda p: rank.get(p["proveedor_id"], len(rank)),
+        )
+        first = cursor["offset"] - len(provider_ids) + 1
+        lines = [f"Más proveedores de '{producto}' ({first}–{cursor['offset']} de {total}):"]
+        for p in proveedores:
+            ejemplos = p.get("ejemplos", "—")
+            lines.append(f"- {p['proveedor']} (ID {p['proveedor_id']}): {ejemplos}")
+        if remaining(cursor):
+            lines.append(f"\nHay {remaining(cursor)} proveedores más disponibles.")
+        text = "\n".join(lines)
+
+    return Command(update={
+        "search_cursor": cursor,
+        "messages": [ToolMessage(content=text, tool_call_id=tool_call_id)],
+    })
+
+
+def _mostrar_mas_por_busqueda(producto: str, session_id: Optional[str] = None) -> str:
+    """Fallback sin cursor: repite la búsqueda y lista hasta 10 proveedores."""
+    rows = session_candidates.get(session_id, producto)
+    if rows is None:
+        rows = _qn._execute_hybrid_search(
+            search_query=producto, marca=None, min_score=_RELEVANCE_THRESHOLD
+        )
 
     if not rows:
         return f"No encontré más proveedores de '{producto}'."
@@ -353,7 +495,7 @@ def consultar_especialista(
     system_prompt = _SPECIALIST_PROMPTS.get(especialista, _SPECIALIST_PROMPTS["chef"])
 
     try:
-        llm = ChatOpenAI(model=settings.CHAT_MODEL, temperature=0.7)
+        llm = get_chat_model(settings.CHAT_MODEL, temperature=0.7)
         response = llm.invoke([("system", system_prompt), ("user", pregunta)])
         text = response.content.strip()
         # Clean bracket artifacts
@@ -400,7 +542,7 @@ def reportar_producto_no_encontrado(
 
     # 1) Classify
     try:
-        llm = ChatOpenAI(model=settings.ROUTER_MODEL, temperature=0)
+        llm = get_chat_model(settings.ROUTER_MODEL, temperature=0)
         resp = llm.invoke([("user", _CLASSIFICATION_PROMPT.format(producto=producto))])
         raw = resp.content.strip().upper()
         es_gastro = "NO_GASTRONOMICO" not in raw and "NO GASTRONOMICO" not in raw
@@ -1,6 +1,7 @@
 """Configuración centralizada del chatbot."""
 from .settings import Settings
+from .database import get_engine, pool_stats
 
 settings = Settings()
 
-__all__ = ["settings"]
+__all__ = ["settings", "get_engine", "pool_stats"]
@@ -0,0 +1,121 @@
+"""
+Registro de engines SQLAlchemy - un pool por DSN y proceso.
+
+QueryNode se instancia más de una vez (``_query_node`` en
+chat/graph/nodes/query.py y ``_qn`` en chat/agent/tools.py) y cada
+instancia creaba su propio engine con el pool por defecto (5 + 10). Aquí
+se crea un único engine por DSN, con el pool dimensionado por settings:
+
+    conexiones por worker = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    conexiones totales    = eso × workers de uvicorn (≤ max_connections)
+
+DB_POOL_SIZE por defecto es SEARCH_RACE_WORKERS + PREFETCH_WORKERS: cada
+búsqueda en carrera usa hasta dos conexiones a la vez desde ese executor, y
+los hilos de prefetch (chat/services/prefetch.py) consultan el mismo pool.
+Las copias en memoria de utils/ (índices, corrector, caché de embeddings)
+también lo usan cuando no reciben un engine.
+
+El pool registra cuánto se espera por una conexión (``pool_stats()``,
+expuesto en /stats). Con psycopg 3 y PGVECTOR_BINARY, cada conexión nueva
+registra el envío binario de embeddings (utils/pgvector_binary.py).
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+from chat.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide la espera de cada checkout y los timeouts."""
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self._wait = {"checkouts": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._wait_lock:
+                self._wait["timeouts"] += 1
+            raise
+        finally:
+            waited = (time.perf_counter() - t0) * 1000
+            with self._wait_lock:
+                self._wait["checkouts"] += 1
+                self._wait["wait_ms_total"] += waited
+                self._wait["wait_ms_max"] = max(self._wait["wait_ms_max"], waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._wait_lock:
+            c = dict(self._wait)
+        c.update(
+            pool_size=self.size(),
+            checked_out=self.checkedout(),
+            checked_in=self.checkedin(),
+            overflow=max(self.overflow(), 0),
+            max_overflow=self._max_overflow,
+        )
+        c["wait_ms_avg"] = round(c["wait_ms_total"] / c["checkouts"], 3) if c["checkouts"] else 0.0
+        c["wait_ms_total"] = round(c["wait_ms_total"], 1)
+        c["wait_ms_max"] = round(c["wait_ms_max"], 3)
+        return c
+
+
+_engines: Dict[str, Engine] = {}
+_lock = threading.Lock()
+
+
+def get_engine(database_url: Optional[str] = None, **engine_kwargs: Any) -> Engine:
+    """
+    Engine compartido para ``database_url`` (por defecto DATABASE_URL).
+
+    La primera llamada para un DSN lo crea; ``engine_kwargs`` (p. ej.
+    ``connect_args``) solo se aplican en esa primera llamada.
+    """
+    url = database_url or settings.database_url_normalized
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            kwargs: Dict[str, Any] = dict(
+                poolclass=InstrumentedQueuePool,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_pre_ping=settings.POOL_PRE_PING,
+                pool_recycle=settings.POOL_RECYCLE,
+            )
+            kwargs.update(engine_kwargs)
+            engine = create_engine(url, **kwargs)
+            if settings.PGVECTOR_BINARY and engine.dialect.driver == "psycopg":
+                from utils.pgvector_binary import register_vector_binary
+
+                event.listen(engine, "connect", register_vector_binary)
+            _engines[url] = engine
+            logger.info(
+                f"🔌 Pool de conexiones: {engine.url.render_as_string(hide_password=True)} "
+                f"(size={kwargs['pool_size']}, max_overflow={kwargs['max_overflow']})"
+            )
+    return engine
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Estado de cada pool registrado (DSN sin contraseña → métricas)."""
+    with _lock:
+        engines = list(_engines.values())
+    out: Dict[str, Dict[str, Any]] = {}
+    for engine in engines:
+        pool = engine.pool
+        name = engine.url.render_as_string(hide_password=True)
+        out[name] = pool.stats() if isinstance(pool, InstrumentedQueuePool) else {"status": pool.status()}
+    return out
@@ -40,6 +40,82 @@ class Settings:
     MAX_PROVEEDORES_MOSTRADOS: int = 3
     MAX_EJEMPLOS_POR_PROVEEDOR: int = 3
     
+    # Search Configuration - Relevance / diversity (aplicados en el SQL híbrido)
+    # Empírico: coincidencias legítimas puntúan >= 0.65, falsos positivos < 0.55
+    RELEVANCE_THRESHOLD: float = float(os.getenv("RELEVANCE_THRESHOLD", "0.55"))
+    # Máximo de filas por proveedor (ROW_NUMBER por id_proveedor); 0 = sin tope
+    SEARCH_ROWS_PER_PROVIDER: int = int(os.getenv("SEARCH_ROWS_PER_PROVIDER", "3"))
+    
+    # Facetas de marca (ver chat/services/brand_facets.py): marcas con nº de productos y
+    # proveedores sobre hasta N candidatos; sus ids sirven la búsqueda siguiente con marca
+    BRAND_FACETS_ENABLED: bool = os.getenv("BRAND_FACETS_ENABLED", "true").lower() == "true"
+    BRAND_FACET_CANDIDATES: int = int(os.getenv("BRAND_FACET_CANDIDATES", "1000"))
+    
+    # Search Configuration - Index tuning (per-query GUCs, ver ingest/indexes.py)
+    # ef_search nunca por debajo de DEFAULT_KNN_LIMIT (HNSW devolvería menos filas)
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", "200"))
+    HNSW_ITERATIVE_SCAN: str = os.getenv("HNSW_ITERATIVE_SCAN", "")  # pgvector>=0.8: relaxed_order
+    TRGM_SIMILARITY_THRESHOLD: float = 0.3  # umbral del operador % (candidatos trigram)
+    
+    # Índice vectorial local (mmap, ver utils/vector_index.py; se activa con VECTOR_INDEX_ENABLED)
+    # Con filtros (marca/precio/proveedor) se piden knn_limit × este factor y SQL filtra
+    VECTOR_INDEX_FILTER_OVERFETCH: int = int(os.getenv("VECTOR_INDEX_FILTER_OVERFETCH", "10"))
+    
+    # Pata vectorial en Postgres: exact (HNSW coseno) | binary_rerank (top-N por Hamming
+    # sobre embedding_bq y re-ranking coseno exacto de esos N, ver benchmarks/binary_quantization_bench.py)
+    VECTOR_SEARCH_MODE: str = os.getenv("VECTOR_SEARCH_MODE", "exact").lower()
+    VECTOR_BQ_CANDIDATES: int = int(os.getenv("VECTOR_BQ_CANDIDATES", "800"))
+    
+    # Cascada de búsqueda (ver chat/services/search_cascade.py): etapas léxicas
+    # (exacta / trigram) que, si alcanzan su umbral, evitan el embedding
+    SEARCH_CASCADE_ENABLED: bool = os.getenv("SEARCH_CASCADE_ENABLED", "true").lower() == "true"
+    CASCADE_MIN_ROWS: int = int(os.getenv("CASCADE_MIN_ROWS", "3"))
+    CASCADE_EXACT_MIN_SCORE: float = float(os.getenv("CASCADE_EXACT_MIN_SCORE", "0.6"))
+    CASCADE_TRIGRAM_MIN_SCORE: float = float(os.getenv("CASCADE_TRIGRAM_MIN_SCORE", "0.7"))
+    
+    # Result cache (filas de búsqueda; se vacía al cambiar catalog_version)
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_MAX_MB: float = float(os.getenv("RESULT_CACHE_MAX_MB", "32"))
+    RESULT_CACHE_TTL: int = int(os.getenv("RESULT_CACHE_TTL", "86400"))  # segundos
+    CATALOG_VERSION_POLL_SECONDS: float = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "30"))
+    CATALOG_VERSION_LISTEN: bool = os.getenv("CATALOG_VERSION_LISTEN", "false").lower() == "true"
+    
+    # "Mostrar más" paginado sobre el cursor de la última búsqueda
+    SHOW_MORE_PAGE_SIZE: int = int(os.getenv("SHOW_MORE_PAGE_SIZE", "7"))
+    SEARCH_CURSOR_TTL: int = int(os.getenv("SEARCH_CURSOR_TTL", "1800"))  # segundos
+    
+    # Conjunto candidato por sesión (ver chat/services/session_candidates.py): filas de la
+    # primera búsqueda; marca, precios y "mostrar más" del mismo producto se resuelven en memoria
+    SESSION_CANDIDATES_ENABLED: bool = os.getenv("SESSION_CANDIDATES_ENABLED", "true").lower() == "true"
+    SESSION_CANDIDATES_TOP_K: int = int(os.getenv("SESSION_CANDIDATES_TOP_K", "60"))
+    SESSION_CANDIDATES_MAX_SESSIONS: int = int(os.getenv("SESSION_CANDIDATES_MAX_SESSIONS", "1000"))
+    
+    # Prefetch especulativo (ver chat/services/prefetch.py): precios y tarjetas de proveedor
+    # del siguiente turno probable, calculados en segundo plano tras buscar_productos
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    PREFETCH_WORKERS: int = int(os.getenv("PREFETCH_WORKERS", "2"))
+    PREFETCH_MAX_PENDING: int = int(os.getenv("PREFETCH_MAX_PENDING", "16"))
+    PREFETCH_TTL_SECONDS: float = float(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+    PREFETCH_WAIT_SECONDS: float = float(os.getenv("PREFETCH_WAIT_SECONDS", "2"))  # espera máx. en take()
+    
+    # Memoización de llamadas repetidas a herramientas (ver chat/services/tool_memo.py)
+    TOOL_MEMO_ENABLED: bool = os.getenv("TOOL_MEMO_ENABLED", "true").lower() == "true"
+    TOOL_MEMO_TTL_SECONDS: float = float(os.getenv("TOOL_MEMO_TTL_SECONDS", "600"))
+
+    # Directorio de proveedores en memoria (detalle_proveedor sin consultas)
+    PROVIDER_DIRECTORY_ENABLED: bool = os.getenv("PROVIDER_DIRECTORY_ENABLED", "true").lower() == "true"
+    PROVIDER_DIRECTORY_REFRESH_SECONDS: float = float(os.getenv("PROVIDER_DIRECTORY_REFRESH_SECONDS", "30"))
+    
+    # Plan cache (SQL generado por SQL_MODEL, reutilizado por firma de entidades)
+    PLAN_CACHE_ENABLED: bool = os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true"
+    PLAN_CACHE_MAX_ENTRIES: int = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "256"))
+    PLAN_CACHE_TTL: int = int(os.getenv("PLAN_CACHE_TTL", "86400"))  # segundos
+    
+    # Speculative search (LLM-SQL vs híbrida en paralelo)
+    SEARCH_RACE_ENABLED: bool = os.getenv("SEARCH_RACE_ENABLED", "true").lower() == "true"
+    SEARCH_RACE_GRACE_SECONDS: float = float(os.getenv("SEARCH_RACE_GRACE_SECONDS", "3.0"))
+    SEARCH_RACE_WORKERS: int = int(os.getenv("SEARCH_RACE_WORKERS", "8"))
+    
     # Platform Transition Configuration
     # Consulta = turno 0-indexed. La 5ª consulta es turn 4.
     CONSULTAS_ANTES_SUGERENCIA: int = 4  # Turn 4 (5ª consulta): respuesta + "📢 ¡Importante!..."
@@ -50,6 +126,14 @@ class Settings:
     DATABASE_URL: Optional[str] = os.getenv("DATABASE_URL")
     POOL_PRE_PING: bool = True
     POOL_RECYCLE: int = 1800
+    # Un pool por DSN y proceso (chat/config/database.py); dimensionado según
+    # los hilos que lo comparten (executor de búsqueda + prefetch).
+    # Por worker: DB_POOL_SIZE + DB_MAX_OVERFLOW.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", str(SEARCH_RACE_WORKERS + PREFETCH_WORKERS)))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # segundos
+    # Embeddings como parámetro binario de tipo vector (utils/pgvector_binary.py)
+    PGVECTOR_BINARY: bool = os.getenv("PGVECTOR_BINARY", "true").lower() == "true"
     
     # Logging Configuration
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
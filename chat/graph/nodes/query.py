@@ -9,11 +9,12 @@ language, enabling flexible searches like:
 """
 import logging
 import re
+from contextlib import contextmanager
 from typing import Dict, Any, List, Optional, Tuple
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.engine import Row
 
 from chat.graph.state import (
@@ -24,9 +25,41 @@ from chat.graph.state import (
     RelevanciaLevel,
 )
 from chat.config.settings import settings
+from chat.config.database import get_engine
+from chat.services.brand_facets import BrandFacet, brand_candidate_ids, facet_from_row
 from chat.services.data_transformer import DataTransformer
-from chat.services.whatsapp_formatter import WhatsAppFormatter
+from chat.services.query_planner import (
+    QueryPlan,
+    QueryPath,
+    query_planner,
+    PROVIDER_FILTER_SQL,
+    ORDER_BY_SQL,
+)
+from chat.services.search_cascade import CascadeStage, search_cascade
+from chat.services.search_race import RaceResult, search_racer
+from chat.services.result_cache import search_result_cache
+from chat.services.provider_directory import (
+    PROVIDER_COLUMNS,
+    ProviderEntry,
+    provider_detail,
+    provider_directory,
+    provider_entry_from_row,
+)
+from chat.services.plan_cache import (
+    sql_plan_cache,
+    entity_signature,
+    schema_fingerprint,
+)
+from utils.catalog_version import get_catalog_version
+from utils.embedding_cache import get_embedding_cache
+from utils.embedding_storage import binary_column_type, column_type, cosine_opclass, storage_type
 from utils.embedding_utils import generar_embedding
+from utils.llm_clients import get_chat_model
+from utils.pgvector_binary import VectorParam
+from utils.spanish_normalizer import NORMALIZED_SEARCH, normalize_text
+from utils.spell_corrector import get_spell_corrector
+from utils.trigram_index import get_trigram_index
+from utils.vector_index import get_vector_index
 
 logger = logging.getLogger(__name__)
 
@@ -62,16 +95,17 @@ TABLAS DISPONIBLES:
    - categoria_1 (TEXT): Categoría principal
    - categoria_2 (TEXT): Subcategoría
    - vigencia (TEXT): Vigencia del precio
-   - embedding (VECTOR(1536)): Embedding para búsqueda semántica
+   - embedding ({embedding_type}): Embedding para búsqueda semántica
 
 EXTENSIONES DISPONIBLES:
 - pg_trgm: Para búsqueda por similitud de texto (similarity function, % operator)
 - pgvector: Para búsqueda por embeddings (<=> operator para distancia coseno)
 
 ÍNDICES:
-- GIN en nombre_producto para trigram
-- IVFFlat en embedding para vector search
-"""
+- GIN trigram en nombre_producto, COALESCE(marca, '') y proveedores.nombre_comercial
+- B-tree en LOWER(marca)
+- HNSW ({embedding_opclass}) en embedding para vector search
+""".format(embedding_type=column_type().upper(), embedding_opclass=cosine_opclass())
 
 TEXT_TO_SQL_PROMPT = """Eres un experto en SQL para PostgreSQL con extensiones pg_trgm y pgvector.
 
@@ -80,7 +114,7 @@ TEXT_TO_SQL_PROMPT = """Eres un experto en SQL para PostgreSQL con extensiones p
 
 ## PARÁMETROS DISPONIBLES (usa :nombre_parametro):
 - :query = término de búsqueda del usuario (texto)
-- :embedding = vector embedding del término (VECTOR(1536))
+- :embedding = vector embedding del término
 - :marca = marca específica si se menciona (puede ser NULL)
 - :precio_max = precio máximo si se menciona (puede ser NULL)
 - :precio_min = precio mínimo si se menciona (puede ser NULL)
@@ -91,13 +125,13 @@ Usa SIEMPRE esta estrategia combinando trigram + vector:
 ```sql
 -- Score combinado: 60% trigram + 40% vector
 (0.6 * similarity(p.nombre_producto, :query) + 
- 0.4 * (1 - (p.embedding <=> CAST(:embedding AS vector)))) AS score
+ 0.4 * (1 - (p.embedding <=> CAST(:embedding AS {vector_type})))) AS score
 ```
 
 Para el WHERE, usa threshold de similitud:
 ```sql
 WHERE similarity(p.nombre_producto, :query) > 0.25
-   OR (1 - (p.embedding <=> CAST(:embedding AS vector))) > 0.65
+   OR (1 - (p.embedding <=> CAST(:embedding AS {vector_type}))) > 0.65
 ```
 
 ## REGLAS OBLIGATORIAS:
@@ -127,17 +161,78 @@ SELECT p.id, p.nombre_producto, p.marca, p.presentacion_venta,
        pr.nombre_ejecutivo_ventas, pr.whatsapp_ventas, pr.pagina_web,
        pr.nivel_membresia, pr.calificacion_usuarios,
        (0.6 * similarity(p.nombre_producto, :query) + 
-        0.4 * (1 - (p.embedding <=> CAST(:embedding AS vector)))) AS score
+        0.4 * (1 - (p.embedding <=> CAST(:embedding AS {vector_type})))) AS score
 FROM productos p
 JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
 WHERE similarity(p.nombre_producto, :query) > 0.25
-   OR (1 - (p.embedding <=> CAST(:embedding AS vector))) > 0.65
+   OR (1 - (p.embedding <=> CAST(:embedding AS {vector_type}))) > 0.65
 ORDER BY score DESC, pr.nivel_membresia DESC
 LIMIT 25;
 ```
 LIMIT 25;
 ```"""
 
+# Plan-cache entries are only valid for the schema/prompt that generated them
+_SCHEMA_FINGERPRINT = schema_fingerprint(DB_SCHEMA, TEXT_TO_SQL_PROMPT)
+
+# Query embedding bound once per statement; later CTEs read it through a
+# scalar subquery (an InitPlan, so HNSW can still serve the ORDER BY).
+# The cast follows the column type (vector / halfvec); no dimension anywhere.
+_QUERY_EMBEDDING_CTE = f"query_embedding AS MATERIALIZED (SELECT CAST(:embedding AS {storage_type()}) AS v)"
+_QUERY_EMBEDDING = "(SELECT v FROM query_embedding)"
+# pgvector's upper bound for hnsw.ef_search
+_HNSW_MAX_EF_SEARCH = 1000
+
+
+# Trigram leg: normalized copies of nombre_producto / marca (accents, plurals,
+# units and stop words folded the same way as the query, see
+# utils/spanish_normalizer.py), or the raw columns with SEARCH_NORMALIZATION=false
+if NORMALIZED_SEARCH:
+    _TRGM_NAME, _TRGM_BRAND = "p.nombre_norm", "p.marca_norm"
+else:
+    _TRGM_NAME, _TRGM_BRAND = "p.nombre_producto", "COALESCE(p.marca, '')"
+
+
+def _trgm_query(search_query: str) -> str:
+    """The :q bind value compared against _TRGM_NAME / _TRGM_BRAND."""
+    if not NORMALIZED_SEARCH:
+        return search_query
+    return normalize_text(search_query) or search_query
+
+
+# Row shape of every hybrid search stage (trgm / vec CTEs and the cascade)
+_HYBRID_ROW_COLUMNS = """p.id, p.id_producto_csv, p.nombre_producto, p.marca, p.presentacion_venta,
+            p.unidad_venta, p.precio_unidad, p.moneda, p.impuesto,
+            pr.id_proveedor, pr.nombre_comercial, pr.nombre_ejecutivo_ventas,
+            pr.whatsapp_ventas, pr.pagina_web, pr.descripcion,
+            pr.nivel_membresia, pr.calificacion_usuarios"""
+# Row shape of the price search (scored CTE and the cascade)
+_PRICE_ROW_COLUMNS = """p.id, p.nombre_producto, p.marca, p.presentacion_venta,
+            p.precio_unidad, p.moneda, p.impuesto,
+            pr.id_proveedor, pr.nombre_comercial, pr.nivel_membresia"""
+
+
+def _cap_per_provider(select_sql: str, order_sql: str) -> str:
+    """
+    ``select_sql`` ordered by ``order_sql`` and limited to :top_k, keeping
+    at most :per_provider rows per id_proveedor (the best ones). One
+    round-trip then returns at least top_k / per_provider distinct
+    providers instead of a page crowded by a single catalog.
+    """
+    return f"""
+        SELECT * FROM (
+          SELECT s.*, ROW_NUMBER() OVER (PARTITION BY s.id_proveedor ORDER BY {order_sql}) AS provider_rank
+          FROM ({select_sql}) s
+        ) ranked
+        WHERE provider_rank <= :per_provider
+        ORDER BY {order_sql}
+        LIMIT :top_k"""
+
+
+def _embedding_param(embedding: List[float]) -> Any:
+    """Embedding bind value: binary pgvector parameter, or the plain list."""
+    return VectorParam(embedding) if settings.PGVECTOR_BINARY else embedding
+
 
 class QueryNode:
     """
@@ -152,24 +247,260 @@ class QueryNode:
     def __init__(self):
         """Initialize the query node."""
         self.transformer = DataTransformer()
-        self.engine = create_engine(
-            settings.database_url_normalized,
-            pool_pre_ping=settings.POOL_PRE_PING,
-            pool_recycle=settings.POOL_RECYCLE
-        )
+        # Shared per-DSN pool (every QueryNode instance uses the same one)
+        self.engine = get_engine()
         # LLM for Text-to-SQL
         # Note: o3/o3-mini don't support temperature parameter
         model_name = settings.SQL_MODEL
         if model_name.startswith("o3"):
-            self.sql_llm = ChatOpenAI(model=model_name)
+            self.sql_llm = get_chat_model(model_name)
         else:
-            self.sql_llm = ChatOpenAI(model=model_name, temperature=0)
+            self.sql_llm = get_chat_model(model_name, temperature=0)
+        # Result cache invalidation: poll catalog_version (+ LISTEN if enabled)
+        search_result_cache.set_version_source(lambda: get_catalog_version(self.engine))
+        if settings.CATALOG_VERSION_LISTEN:
+            search_result_cache.start_listener(settings.DATABASE_URL)
+        # Local indexes (if enabled) start building in the background now
+        get_trigram_index(self.engine)
+        get_vector_index(self.engine)
+        get_embedding_cache(self.engine)
+        get_spell_corrector(self.engine)
+        provider_directory.attach(self.engine)
         logger.info(f"✅ QueryNode inicializado con SQL_MODEL={settings.SQL_MODEL}")
     
+    @contextmanager
+    def _search_connection(self):
+        """
+        Connection with per-query index GUCs applied (transaction-local).
+        
+        - hnsw.ef_search: at least knn_limit so the ANN scan can fill the CTE
+          (and VECTOR_BQ_CANDIDATES in binary_rerank mode; pgvector caps it at 1000)
+        - pg_trgm.similarity_threshold: candidate cut-off for the % operator
+        """
+        ef_search = max(settings.HNSW_EF_SEARCH, settings.DEFAULT_KNN_LIMIT)
+        if settings.VECTOR_SEARCH_MODE == "binary_rerank":
+            ef_search = min(max(ef_search, settings.VECTOR_BQ_CANDIDATES), _HNSW_MAX_EF_SEARCH)
+        with self.engine.connect() as conn:
+            conn.execute(
+                text("""
+                    SELECT set_config('hnsw.ef_search', :ef, true),
+                           set_config('pg_trgm.similarity_threshold', :trgm, true)
+                """),
+                {
+                    "ef": str(ef_search),
+                    "trgm": str(settings.TRGM_SIMILARITY_THRESHOLD),
+                },
+            )
+            if settings.HNSW_ITERATIVE_SCAN:
+                conn.execute(
+                    text("SELECT set_config('hnsw.iterative_scan', :mode, true)"),
+                    {"mode": settings.HNSW_ITERATIVE_SCAN},
+                )
+            yield conn
+    
+    def _local_vector_candidates(
+        self, embedding: Optional[List[float]], filtered: bool = False
+    ) -> Optional[Tuple[List[int], List[float]]]:
+        """
+        Top-N (ids, cosine sims) from the in-process mmap index.
+        
+        With marca/precio/provider filters the local index can't pre-filter,
+        so it over-fetches and SQL applies the filters before LIMIT knn_limit.
+        Returns None (→ pgvector) when the index is disabled or stale.
+        """
+        index = get_vector_index()
+        if index is None:
+            return None
+        k = settings.DEFAULT_KNN_LIMIT
+        if filtered:
+            k *= settings.VECTOR_INDEX_FILTER_OVERFETCH
+        try:
+            return index.search(embedding, k)
+        except Exception as e:
+            logger.warning(f"⚠️  Local vector index failed, using pgvector: {e}")
+            return None
+    
+    def _local_trigram_candidates(
+        self, search_query: str, threshold: Optional[float] = None
+    ) -> Optional[Tuple[List[int], List[float]]]:
+        """
+        (ids, trgm_sim) from the in-process trigram index: same rows and
+        scores as ``_TRGM_NAME % q OR _TRGM_BRAND % q`` with GREATEST(similarity),
+        for a query already passed through _trgm_query.
+        Returns None (→ pg_trgm) when the index is disabled or stale.
+        """
+        index = get_trigram_index()
+        if index is None:
+            return None
+        try:
+            return index.search_products(search_query, threshold or settings.TRGM_SIMILARITY_THRESHOLD)
+        except Exception as e:
+            logger.warning(f"⚠️  Local trigram index failed, using pg_trgm: {e}")
+            return None
+    
+    def _find_provider(self, nombre: str) -> Optional[Row]:
+        """
+        Best provider match for a user-typed name (``nombre_comercial % nombre``).
+        
+        Resolved in-process by the trigram index when available, so Postgres
+        only fetches the row by primary key.
+        """
+        columns = PROVIDER_COLUMNS
+        index = get_trigram_index()
+        matches = None
+        if index is not None:
+            try:
+                matches = index.resolve_provider(nombre, settings.TRGM_SIMILARITY_THRESHOLD)
+            except Exception as e:
+                logger.warning(f"⚠️  Local trigram index failed, using pg_trgm: {e}")
+        
+        if matches is not None:
+            if not matches:
+                return None
+            proveedor_id, sim = matches[0]
+            with self.engine.connect() as conn:
+                return conn.execute(
+                    text(f"SELECT {columns}, CAST(:sim AS float8) AS sim "
+                         "FROM proveedores pr WHERE pr.id_proveedor = :id"),
+                    {"id": proveedor_id, "sim": sim},
+                ).fetchone()
+        
+        with self._search_connection() as conn:
+            return conn.execute(
+                text(f"""
+                    SELECT {columns}, similarity(pr.nombre_comercial, :nombre) AS sim
+                    FROM proveedores pr
+                    WHERE pr.nombre_comercial % :nombre  -- GIN trigram index (threshold 0.3)
+                    ORDER BY sim DESC
+                    LIMIT 1
+                """),
+                {"nombre": nombre},
+            ).fetchone()
+    
+    def _provider_entry(self, nombre: str) -> Optional[ProviderEntry]:
+        """
+        Best provider match as a pre-rendered entry (card + detail fields).
+        
+        Served from the in-memory provider directory when it is current
+        (no DB query); otherwise resolved with ``_find_provider``.
+        """
+        try:
+            matches = provider_directory.resolve(nombre)
+        except Exception as e:
+            logger.warning(f"⚠️  Provider directory failed, using DB: {e}")
+            matches = None
+        if matches is not None:
+            return matches[0] if matches else None
+        row = self._find_provider(nombre)
+        return provider_entry_from_row(row, row.sim) if row else None
+    
+    def _lexical_cascade(
+        self,
+        kind: str,
+        params: Dict[str, Any],
+        filter_sql: str,
+        columns_sql: str,
+        score_alias: str,
+        order_sql: str,
+    ) -> Optional[List[Row]]:
+        """
+        Early-exit stages of the search cascade (chat/services/search_cascade.py),
+        run before any embedding call:
+        
+        - EXACT: normalized name equal to / starting with the query (whole
+          words) or normalized brand equal to it; btree index.
+        - TRIGRAM: the trigram leg alone with a strict similarity threshold
+          (GIN with pg_trgm.similarity_threshold raised, or the local index).
+        
+        ``params`` must hold :q (already through _trgm_query), :top_k and the
+        values of ``filter_sql``; an optional :min_score raises the stage
+        thresholds and :per_provider caps the rows per provider (as in the
+        hybrid SQL). Returns the rows of the first stage that clears its bar
+        (vec_sim 0, score = trigram similarity), or None.
+        """
+        top_k = params["top_k"]
+        floor = params.get("min_score", 0.0)
+        sim_sql = f"GREATEST(similarity({_TRGM_NAME}, :q), similarity({_TRGM_BRAND}, :q))"
+        stages = [CascadeStage.TRIGRAM]
+        if NORMALIZED_SEARCH:
+            stages.insert(0, CascadeStage.EXACT)
+        # Normalized text is [a-z0-9. ] only: nothing to escape in LIKE
+        params = dict(params, q_prefix=f"{params['q']} %")
+        
+        with self._search_connection() as conn:
+            for stage in stages:
+                params["min_score"] = min_score = max(search_cascade.min_score[stage], floor)
+                from_sql, stage_sim_sql = "productos p", sim_sql
+                if stage is CascadeStage.EXACT:
+                    match_sql = f"({_TRGM_NAME} = :q OR {_TRGM_NAME} LIKE :q_prefix OR {_TRGM_BRAND} = :q)"
+                else:
+                    match_sql = f"({_TRGM_NAME} % :q OR {_TRGM_BRAND} % :q)"
+                    local_trgm = self._local_trigram_candidates(params["q"], min_score)
+                    if local_trgm is not None:
+                        params["trgm_ids"], params["trgm_sims"] = local_trgm
+                        from_sql = (
+                            "unnest(CAST(:trgm_ids AS int[]), CAST(:trgm_sims AS float8[])) AS t(id, trgm_sim) "
+                            "JOIN productos p ON p.id = t.id"
+                        )
+                        stage_sim_sql, match_sql = "t.trgm_sim", "TRUE"
+                    else:
+                        # The % operator prunes on this GUC: the GIN scan only
+                        # returns rows that can clear the stage threshold
+                        conn.execute(
+                            text("SELECT set_config('pg_trgm.similarity_threshold', :thr, true)"),
+                            {"thr": str(min_score)},
+                        )
+                stage_sql = f"""
+                    SELECT
+                      {columns_sql},
+                      {stage_sim_sql} AS trgm_sim,
+                      0.0::float AS vec_sim,
+                      {stage_sim_sql} AS {score_alias}
+                    FROM {from_sql}
+                    JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
+                    WHERE {match_sql}
+                      AND {stage_sim_sql} >= :min_score
+                      {filter_sql}"""
+                if "per_provider" in params:
+                    stage_sql = _cap_per_provider(stage_sql, order_sql)
+                else:
+                    stage_sql += f"""
+                    ORDER BY {order_sql}
+                    LIMIT :top_k"""
+                rows = conn.execute(text(stage_sql), params).fetchall()
+                if search_cascade.accepts(rows, top_k):
+                    search_cascade.record(kind, stage)
+                    return rows
+        return None
+    
+    def _fetch_products_by_ids(self, product_ids: List[int]) -> List[Row]:
+        """
+        Product + provider rows by primary key, in the given order.
+        
+        Used to page a stored search cursor: no embedding, no similarity.
+        """
+        if not product_ids:
+            return []
+        sql = text("""
+            SELECT
+              p.id, p.id_producto_csv, p.nombre_producto, p.marca, p.presentacion_venta,
+              p.unidad_venta, p.precio_unidad, p.moneda, p.impuesto,
+              pr.id_proveedor, pr.nombre_comercial, pr.nombre_ejecutivo_ventas,
+              pr.whatsapp_ventas, pr.pagina_web, pr.descripcion,
+              pr.nivel_membresia, pr.calificacion_usuarios
+            FROM unnest(CAST(:ids AS int[])) WITH ORDINALITY AS k(id, ord)
+            JOIN productos p ON p.id = k.id
+            JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
+            ORDER BY k.ord
+        """)
+        with self.engine.connect() as conn:
+            return conn.execute(sql, {"ids": list(product_ids)}).fetchall()
+    
     def _generate_sql_with_llm(
         self,
         user_query: str,
         entities: Dict[str, Any],
+        embedding: Optional[List[float]] = None,
     ) -> Optional[Tuple[str, Dict[str, Any]]]:
         """
         Generate SQL query using LLM (o3-mini) with hybrid search parameters.
@@ -177,6 +508,7 @@ class QueryNode:
         Args:
             user_query: Natural language query from user
             entities: Extracted entities (producto, marca, precio, etc.)
+            embedding: Precomputed embedding of the search term (optional)
             
         Returns:
             Tuple of (SQL query, parameters dict) or None if generation fails
@@ -184,8 +516,10 @@ class QueryNode:
         # Get search term and generate embedding
         search_term = entities.get("producto") or user_query
         try:
-            embedding = generar_embedding(search_term)
-            embedding_str = str(embedding)  # Convert list to string for SQL
+            if embedding is None:
+                embedding = generar_embedding(search_term)
+            # Binary vector parameter (or the legacy text literal)
+            embedding_param = VectorParam(embedding) if settings.PGVECTOR_BINARY else str(embedding)
         except Exception as e:
             logger.error(f"❌ Error generando embedding: {e}")
             return None
@@ -193,7 +527,7 @@ class QueryNode:
         # Build parameters dict
         params = {
             "search_term": search_term,
-            "embedding": embedding_str,
+            "embedding": embedding_param,
         }
         
         # Build context from entities
@@ -212,6 +546,11 @@ class QueryNode:
         if entities.get("busca_precio"):
             context_parts.append("El usuario quiere ver precios (ordenar por precio)")
         
+        # Reuse SQL from an earlier query with the same shape (no LLM call)
+        cached_sql = sql_plan_cache.get(entity_signature(user_query, entities), _SCHEMA_FINGERPRINT)
+        if cached_sql:
+            return (cached_sql, params)
+        
         context = "\n".join(context_parts) if context_parts else "Sin filtros específicos"
         
         # Show which parameters are available
@@ -235,7 +574,7 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
             logger.debug(f"📝 Parámetros: {list(params.keys())}")
             
             response = self.sql_llm.invoke([
-                SystemMessage(content=TEXT_TO_SQL_PROMPT.format(schema=DB_SCHEMA)),
+                SystemMessage(content=TEXT_TO_SQL_PROMPT.format(schema=DB_SCHEMA, vector_type=storage_type())),
                 HumanMessage(content=prompt)
             ])
             
@@ -253,6 +592,12 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
             logger.error(f"❌ Error generando SQL: {e}")
             return None
     
+    def _remember_llm_sql(self, user_query: str, entities: Dict[str, Any], sql: str) -> None:
+        """Store LLM SQL that ran and returned relevant rows in the plan cache."""
+        sql_plan_cache.put(
+            entity_signature(user_query, entities), _SCHEMA_FINGERPRINT, sql, entities
+        )
+    
     def _extract_sql_from_response(self, response: str) -> Optional[str]:
         """Extract SQL from LLM response (handles ```sql blocks)."""
         # Try to extract from code block
@@ -295,7 +640,7 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
             return []
         
         try:
-            with self.engine.connect() as conn:
+            with self._search_connection() as conn:
                 if params:
                     # Bind parameters to the query
                     logger.debug(f"📊 Ejecutando SQL con parámetros: {list(params.keys())}")
@@ -318,13 +663,52 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
         precio_max: Optional[float] = None,
         precio_min: Optional[float] = None,
         top_k: int = 25,
+        provider_filters: Optional[List[str]] = None,
+        order_by: str = "score",
+        embedding: Optional[List[float]] = None,
+        min_score: Optional[float] = None,
     ) -> List[Row]:
         """
         Execute hybrid search with optional filters.
         
         This combines trigram similarity + vector similarity with
-        optional filters for marca and precio.
+        optional filters for marca and precio. ``provider_filters`` and
+        ``order_by`` are keys of the pre-vetted fragments in
+        ``chat.services.query_planner``.
+        
+        The SQL itself drops rows with score < ``min_score`` (if given) and
+        keeps at most ``settings.SEARCH_ROWS_PER_PROVIDER`` rows per
+        provider, so callers get top_k relevant, diversified rows.
+        
+        Results are served from ``search_result_cache`` until the catalog
+        version changes (a hit also skips the embedding call).
         """
+        key = search_result_cache.make_key(
+            "hybrid", search_query,
+            marca=marca, precio_max=precio_max, precio_min=precio_min, top_k=top_k,
+            provider_filters=provider_filters, order_by=order_by, min_score=min_score,
+        )
+        return search_result_cache.get_or_compute(
+            key,
+            lambda: self._run_hybrid_search(
+                search_query, marca, precio_max, precio_min, top_k,
+                provider_filters, order_by, embedding, min_score,
+            ),
+        )
+    
+    def _run_hybrid_search(
+        self,
+        search_query: str,
+        marca: Optional[str],
+        precio_max: Optional[float],
+        precio_min: Optional[float],
+        top_k: int,
+        provider_filters: Optional[List[str]],
+        order_by: str,
+        embedding: Optional[List[float]],
+        min_score: Optional[float] = None,
+    ) -> List[Row]:
+        """Uncached hybrid search (see _execute_hybrid_search)."""
         logger.info(f"🔍 Executing hybrid search: '{search_query}'")
         if marca:
             logger.info(f"   📍 Filter: marca='{marca}'")
@@ -333,12 +717,8 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
         if precio_min:
             logger.info(f"   📍 Filter: precio_min={precio_min}")
         
-        # Generate embedding for vector search
-        embedding = generar_embedding(search_query)
-        
         params = {
-            "q": search_query,
-            "embedding": embedding,
+            "q": _trgm_query(search_query),
             "knn_limit": settings.DEFAULT_KNN_LIMIT,
             "w_trgm": settings.WEIGHT_TRGM,
             "w_vec": settings.WEIGHT_VEC,
@@ -346,13 +726,17 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
             "thr_vec": settings.THRESHOLD_VEC_HIGH,
             "top_k": top_k,
         }
+        min_score_filter = ""
+        if min_score is not None:
+            min_score_filter = "AND score >= :min_score"
+            params["min_score"] = min_score
+        if settings.SEARCH_ROWS_PER_PROVIDER > 0:
+            params["per_provider"] = settings.SEARCH_ROWS_PER_PROVIDER
         
         # Add marca filter
-        marca_filter_trgm = ""
-        marca_filter_vec = ""
+        marca_filter = ""
         if marca:
-            marca_filter_trgm = "AND LOWER(p.marca) = LOWER(:marca)"
-            marca_filter_vec = "AND LOWER(p.marca) = LOWER(:marca)"
+            marca_filter = "AND LOWER(p.marca) = LOWER(:marca)"
             params["marca"] = marca
         
         # Add precio filters
@@ -363,63 +747,207 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
         if precio_min is not None:
             precio_filter += " AND p.precio_unidad >= :precio_min"
             params["precio_min"] = precio_min
+        if order_by == "precio":
+            precio_filter += " AND p.precio_unidad > 0"
         
-        sql = text(f"""
-        WITH trgm AS (
-          SELECT
-            p.id,
-            p.id_producto_csv,
-            p.nombre_producto,
-            p.marca,
-            p.presentacion_venta,
-            p.unidad_venta,
-            p.precio_unidad,
-            p.moneda,
-            p.impuesto,
-            pr.id_proveedor,
-            pr.nombre_comercial,
-            pr.nombre_ejecutivo_ventas,
-            pr.whatsapp_ventas,
-            pr.pagina_web,
-            pr.descripcion,
-            pr.nivel_membresia,
-            pr.calificacion_usuarios,
-            GREATEST(
-              similarity(p.nombre_producto, :q),
-              similarity(COALESCE(p.marca, ''), :q)
-            ) AS trgm_sim
+        # Provider attribute filters (whitelisted fragments only)
+        provider_filter = " ".join(PROVIDER_FILTER_SQL[k] for k in provider_filters or [])
+        order_sql = ORDER_BY_SQL[order_by]
+        filter_sql = f"{marca_filter} {precio_filter} {provider_filter}".strip()
+        
+        # Cascade: exact / trigram-only stages first; an embedding shared by
+        # the caller is already paid for, so go straight to the full search
+        cascade = embedding is None and search_cascade.enabled
+        if cascade:
+            rows = self._lexical_cascade(
+                "hybrid", params, filter_sql, _HYBRID_ROW_COLUMNS, "score", order_sql,
+            )
+            if rows is not None:
+                return rows
+        
+        # Generate embedding for vector search (unless shared by the caller)
+        if embedding is None:
+            embedding = generar_embedding(search_query)
+        
+        final_sql = f"""
+        SELECT * FROM filtered
+        ORDER BY {order_sql}
+        LIMIT :top_k"""
+        if "per_provider" in params:
+            final_sql = _cap_per_provider("SELECT * FROM filtered", order_sql)
+        sql = self._hybrid_sql(params, embedding, filter_sql, min_score_filter, final_sql)
+        
+        with self._search_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        
+        if cascade:
+            search_cascade.record("hybrid", CascadeStage.HYBRID)
+        logger.info(f"✅ Hybrid search returned {len(rows)} products")
+        return rows
+    
+    def _execute_brand_facets(
+        self, search_query: str, min_score: Optional[float] = None
+    ) -> List[BrandFacet]:
+        """
+        Brands of the product's candidate set with product / provider
+        counts and their ids (see chat/services/brand_facets.py), served
+        from ``search_result_cache`` until the catalog version changes.
+        """
+        key = search_result_cache.make_key("brand_facets", search_query, min_score=min_score)
+        rows = search_result_cache.get_or_compute(
+            key, lambda: self._run_brand_facets(search_query, min_score)
+        )
+        return [facet_from_row(r) for r in rows]
+    
+    def _run_brand_facets(self, search_query: str, min_score: Optional[float]) -> List[Row]:
+        """Uncached brand facets: the hybrid candidate set grouped by marca."""
+        logger.info(f"🏷️  Brand facets: '{search_query}'")
+        params = {
+            "q": _trgm_query(search_query),
+            "knn_limit": settings.DEFAULT_KNN_LIMIT,
+            "w_trgm": settings.WEIGHT_TRGM,
+            "w_vec": settings.WEIGHT_VEC,
+            "thr_trgm": settings.THRESHOLD_TRGM_HIGH,
+            "thr_vec": settings.THRESHOLD_VEC_HIGH,
+            "facet_limit": settings.BRAND_FACET_CANDIDATES,
+        }
+        min_score_filter = ""
+        if min_score is not None:
+            min_score_filter = "AND score >= :min_score"
+            params["min_score"] = min_score
+        
+        final_sql = """
+        SELECT
+          TRIM(c.marca) AS marca,
+          COUNT(*) AS productos,
+          COUNT(DISTINCT c.id_proveedor) AS proveedores,
+          array_agg(c.id ORDER BY c.score DESC) AS ids,
+          array_agg(c.id_proveedor ORDER BY c.score DESC) AS provider_ids
+        FROM (
+          SELECT * FROM filtered ORDER BY score DESC LIMIT :facet_limit
+        ) c
+        WHERE NULLIF(TRIM(c.marca), '') IS NOT NULL
+          AND TRIM(c.marca) NOT IN ('—', 'N/A', 'Sin marca')
+        GROUP BY TRIM(c.marca)
+        ORDER BY productos DESC, marca"""
+        sql = self._hybrid_sql(
+            params, generar_embedding(search_query), "", min_score_filter, final_sql
+        )
+        with self._search_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        logger.info(f"✅ Brand facets: {len(rows)} brands")
+        return rows
+    
+    def _execute_brand_search(
+        self,
+        search_query: str,
+        marca: str,
+        min_score: Optional[float] = None,
+        top_k: int = 25,
+    ) -> Optional[List[Row]]:
+        """
+        Brand-filtered search answered from the cached brand facets of the
+        same product (no embedding, no similarity): the brand's candidate
+        ids, capped per provider, fetched by primary key.
+        
+        None when there are no cached facets or the brand is not among them
+        (→ the caller runs the normal search).
+        """
+        if not settings.BRAND_FACETS_ENABLED:
+            return None
+        key = search_result_cache.make_key("brand_facets", search_query, min_score=min_score)
+        cached = search_result_cache.get(key)
+        if not cached:
+            return None
+        facets = [facet_from_row(r) for r in cached]
+        ids = brand_candidate_ids(facets, marca, settings.SEARCH_ROWS_PER_PROVIDER, top_k)
+        if not ids:
+            return None
+        logger.info(f"🏷️  Brand search from cached facets: '{search_query}' marca='{marca}' ({len(ids)} ids)")
+        return self._fetch_products_by_ids(ids)
+    
+    def _hybrid_sql(
+        self,
+        params: Dict[str, Any],
+        embedding: List[float],
+        filter_sql: str,
+        min_score_filter: str,
+        final_sql: str,
+    ) -> TextClause:
+        """
+        Hybrid search statement: trigram and vector legs, fused into the
+        ``filtered`` CTE, then ``final_sql`` (the page of rows, or the brand
+        facets). Adds the embedding / local candidate binds to ``params``.
+        """
+        params["embedding"] = _embedding_param(embedding)
+        
+        # Trigram leg: in-process inverted index when available, else pg_trgm
+        trgm_from_sql = "productos p"
+        trgm_sim_sql = f"GREATEST(similarity({_TRGM_NAME}, :q), similarity({_TRGM_BRAND}, :q))"
+        trgm_match_sql = f"({_TRGM_NAME} % :q OR {_TRGM_BRAND} % :q)"
+        local_trgm = self._local_trigram_candidates(params["q"])
+        if local_trgm is not None:
+            params["trgm_ids"], params["trgm_sims"] = local_trgm
+            trgm_from_sql = (
+                "unnest(CAST(:trgm_ids AS int[]), CAST(:trgm_sims AS float8[])) AS t(id, trgm_sim) "
+                "JOIN productos p ON p.id = t.id"
+            )
+            trgm_sim_sql = "t.trgm_sim"
+            trgm_match_sql = "TRUE"
+        
+        # Vector leg: in-process mmap index when available, else pgvector
+        embedding_cte_sql = _QUERY_EMBEDDING_CTE + ","
+        vec_from_sql = "productos p"
+        vec_sim_sql = f"1 - (p.embedding <=> {_QUERY_EMBEDDING})"
+        vec_order_sql = f"p.embedding <=> {_QUERY_EMBEDDING}"
+        local = self._local_vector_candidates(embedding, filtered=bool(filter_sql))
+        if local is None and settings.VECTOR_SEARCH_MODE == "binary_rerank":
+            # First pass by Hamming distance over the bit codes (32x smaller
+            # than the float vectors); the vec CTE re-ranks those candidates
+            # by exact cosine
+            params["bq_candidates"] = settings.VECTOR_BQ_CANDIDATES
+            embedding_cte_sql += f"""
+        bq AS MATERIALIZED (
+          SELECT p.id
           FROM productos p
           JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
-          WHERE (p.nombre_producto % :q OR COALESCE(p.marca,'') % :q)
-            {marca_filter_trgm}
-            {precio_filter}
+          WHERE p.embedding_bq IS NOT NULL
+            {filter_sql}
+          ORDER BY p.embedding_bq <~> binary_quantize({_QUERY_EMBEDDING})::{binary_column_type()}
+          LIMIT :bq_candidates
+        ),"""
+            vec_from_sql = "bq JOIN productos p ON p.id = bq.id"
+        if local is not None:
+            params["vec_ids"], params["vec_sims"] = local
+            del params["embedding"]
+            embedding_cte_sql = ""
+            vec_from_sql = (
+                "unnest(CAST(:vec_ids AS int[]), CAST(:vec_sims AS float8[])) AS v(id, vec_sim) "
+                "JOIN productos p ON p.id = v.id"
+            )
+            vec_sim_sql = "v.vec_sim"
+            vec_order_sql = "v.vec_sim DESC"
+        
+        return text(f"""
+        WITH {embedding_cte_sql}
+        trgm AS (
+          SELECT
+            {_HYBRID_ROW_COLUMNS},
+            {trgm_sim_sql} AS trgm_sim
+          FROM {trgm_from_sql}
+          JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
+          WHERE {trgm_match_sql}
+            {filter_sql}
         ),
         vec AS (
           SELECT
-            p.id,
-            p.id_producto_csv,
-            p.nombre_producto,
-            p.marca,
-            p.presentacion_venta,
-            p.unidad_venta,
-            p.precio_unidad,
-            p.moneda,
-            p.impuesto,
-            pr.id_proveedor,
-            pr.nombre_comercial,
-            pr.nombre_ejecutivo_ventas,
-            pr.whatsapp_ventas,
-            pr.pagina_web,
-            pr.descripcion,
-            pr.nivel_membresia,
-            pr.calificacion_usuarios,
-            1 - (p.embedding <=> CAST(:embedding AS vector)) AS vec_sim
-          FROM productos p
+            {_HYBRID_ROW_COLUMNS},
+            {vec_sim_sql} AS vec_sim
+          FROM {vec_from_sql}
           JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
           WHERE 1=1
-            {marca_filter_vec}
-            {precio_filter}
-          ORDER BY p.embedding <=> CAST(:embedding AS vector)
+            {filter_sql}
+          ORDER BY {vec_order_sql}
           LIMIT :knn_limit
         ),
         unioned AS (
@@ -459,95 +987,188 @@ Genera el SQL para buscar productos/proveedores según esta consulta."""
           SELECT *
           FROM fused
           WHERE (trgm_sim >= :thr_trgm OR vec_sim >= :thr_vec)
+            {min_score_filter}
         )
-        SELECT * FROM filtered
-        ORDER BY score DESC
-        LIMIT :top_k;
+        {final_sql};
         """)
+    
+    def _execute_plan(
+        self, plan: QueryPlan, min_score: Optional[float] = None, top_k: int = 25
+    ) -> List[Row]:
+        """Execute a deterministic plan from the QueryPlanner (no LLM call)."""
+        logger.info(f"🧭 Executing planned search: template={plan['template']}")
+        return self._execute_hybrid_search(
+            search_query=plan["search_query"],
+            marca=plan["marca"],
+            precio_max=plan["precio_max"],
+            precio_min=plan["precio_min"],
+            provider_filters=plan["provider_filters"],
+            order_by=plan["order_by"],
+            top_k=top_k,
+            min_score=min_score,
+        )
+    
+    def _race_llm_and_hybrid(
+        self,
+        user_query: str,
+        entities: Dict[str, Any],
+        min_score: float,
+        marca: Optional[str] = None,
+        precio_max: Optional[float] = None,
+        precio_min: Optional[float] = None,
+    ) -> RaceResult:
+        """
+        Run Text-to-SQL and hybrid search concurrently (see SearchRacer).
         
-        with self.engine.connect() as conn:
-            rows = conn.execute(sql, params).fetchall()
+        Both strategies share one embedding. LLM SQL wins if it returns rows
+        with score >= min_score within the grace window; otherwise the first
+        strategy with relevant rows wins. Hybrid only runs with a producto.
+        """
+        producto = entities.get("producto")
+        embedding = generar_embedding(producto or user_query)
         
-        logger.info(f"✅ Hybrid search returned {len(rows)} products")
-        return rows
+        def relevant(rows: List[Row]) -> List[Row]:
+            return [r for r in rows if hasattr(r, "score") and float(r.score) >= min_score]
+        
+        def llm_sql() -> List[Row]:
+            result = self._generate_sql_with_llm(user_query, entities, embedding=embedding)
+            if not result:
+                return []
+            sql, params = result
+            rows = self._execute_llm_sql(sql, params)
+            if relevant(rows):
+                self._remember_llm_sql(user_query, entities, sql)
+            return rows
+        
+        strategies = {"llm_sql": llm_sql}
+        if producto:
+            strategies["hybrid"] = lambda: self._execute_hybrid_search(
+                search_query=producto,
+                marca=marca,
+                precio_max=precio_max,
+                precio_min=precio_min,
+                embedding=embedding,
+                min_score=min_score,
+            )
+        
+        return search_racer.race(strategies, accept=relevant)
     
     def _execute_price_search(
         self,
         search_query: str,
         marca: Optional[str] = None,
         top_k: int = 10,
+        precio_max: Optional[float] = None,
+        precio_min: Optional[float] = None,
     ) -> List[Dict[str, Any]]:
         """
         Execute price-focused search that returns products sorted by price.
+        
+        Two stages so every step is index-backed:
+        1. Candidates: ANN top-N (HNSW) ∪ trigram matches (GIN, % operator),
+           with marca / price-range filters pushed down.
+        2. Relevance filter + price ordering over that small candidate set.
+        
+        Note: with the current weights, score > 0.6 already implies
+        similarity > 0.3, so the trigram leg alone covers the relevance bar;
+        the ANN leg keeps recall if the thresholds are relaxed.
         """
         logger.info(f"💰 Executing price search: '{search_query}'")
         
-        embedding = generar_embedding(search_query)
+        key = search_result_cache.make_key(
+            "price", search_query,
+            marca=marca, precio_max=precio_max, precio_min=precio_min, top_k=top_k,
+        )
+        rows = search_result_cache.get_or_compute(
+            key,
+            lambda: self._price_search_rows(search_query, marca, top_k, precio_max, precio_min),
+        )
+        
+        # Format for price display
+        precios = [self.transformer.row_to_precio(row) for row in rows]
         
+        logger.info(f"✅ Price search returned {len(precios)} prices")
+        return precios
+    
+    def _price_search_rows(
+        self,
+        search_query: str,
+        marca: Optional[str],
+        top_k: int,
+        precio_max: Optional[float],
+        precio_min: Optional[float],
+    ) -> List[Row]:
+        """Uncached candidate + rerank SQL for _execute_price_search."""
         params = {
-            "q": search_query,
-            "embedding": embedding,
+            "q": _trgm_query(search_query),
+            "knn_limit": settings.DEFAULT_KNN_LIMIT,
             "top_k": top_k,
         }
         
-        marca_filter = ""
+        candidate_filter = "AND p.precio_unidad IS NOT NULL AND p.precio_unidad > 0"
         if marca:
-            marca_filter = "AND LOWER(p.marca) = LOWER(:marca)"
+            candidate_filter += " AND LOWER(p.marca) = LOWER(:marca)"
             params["marca"] = marca
+        if precio_max is not None:
+            candidate_filter += " AND p.precio_unidad <= :precio_max"
+            params["precio_max"] = precio_max
+        if precio_min is not None:
+            candidate_filter += " AND p.precio_unidad >= :precio_min"
+            params["precio_min"] = precio_min
+        
+        if search_cascade.enabled:
+            rows = self._lexical_cascade(
+                "price", params, candidate_filter, _PRICE_ROW_COLUMNS, "relevance_score", "precio_unidad ASC",
+            )
+            if rows is not None:
+                return rows
+        
+        embedding = generar_embedding(search_query)
+        params["embedding"] = _embedding_param(embedding)
         
         sql = text(f"""
-        SELECT 
-            p.id,
-            p.nombre_producto,
-            p.marca,
-            p.presentacion_venta,
-            p.precio_unidad,
-            p.moneda,
-            p.impuesto,
-            pr.id_proveedor,
-            pr.nombre_comercial,
-            pr.nivel_membresia,
-            (0.6 * similarity(p.nombre_producto, :q) +
-             0.4 * (1 - (p.embedding <=> CAST(:embedding AS vector)))) AS relevance_score
-        FROM productos p
-        JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
-        WHERE (similarity(p.nombre_producto, :q) > 0.3 OR 
-               (1 - (p.embedding <=> CAST(:embedding AS vector))) > 0.82)
-          AND p.precio_unidad IS NOT NULL
-          AND p.precio_unidad > 0
-          AND (0.6 * similarity(p.nombre_producto, :q) +
-               0.4 * (1 - (p.embedding <=> CAST(:embedding AS vector)))) > 0.6
-          {marca_filter}
+        WITH {_QUERY_EMBEDDING_CTE},
+        ann AS (
+          SELECT p.id
+          FROM productos p
+          WHERE p.embedding IS NOT NULL
+            {candidate_filter}
+          ORDER BY p.embedding <=> {_QUERY_EMBEDDING}
+          LIMIT :knn_limit
+        ),
+        trgm AS (
+          SELECT p.id
+          FROM productos p
+          WHERE {_TRGM_NAME} % :q
+            {candidate_filter}
+        ),
+        candidates AS (
+          SELECT id FROM ann
+          UNION
+          SELECT id FROM trgm
+        ),
+        scored AS (
+          SELECT
+            {_PRICE_ROW_COLUMNS},
+            similarity({_TRGM_NAME}, :q) AS trgm_sim,
+            1 - (p.embedding <=> {_QUERY_EMBEDDING}) AS vec_sim
+          FROM candidates c
+          JOIN productos p ON p.id = c.id
+          JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
+        )
+        SELECT *, (0.6 * trgm_sim + 0.4 * vec_sim) AS relevance_score
+        FROM scored
+        WHERE (trgm_sim > 0.3 OR vec_sim > 0.82)
+          AND (0.6 * trgm_sim + 0.4 * vec_sim) > 0.6
         ORDER BY precio_unidad ASC
         LIMIT :top_k;
         """)
         
-        with self.engine.connect() as conn:
+        with self._search_connection() as conn:
             rows = conn.execute(sql, params).fetchall()
-        
-        # Format for price display
-        precios = []
-        for row in rows:
-            moneda = row.moneda or "MXN"
-            if moneda.upper() == "PMX":
-                moneda = "MXN"
-            precio_str = f"${row.precio_unidad:,.2f} {moneda}"
-            if row.impuesto and "IVA" in row.impuesto.upper():
-                precio_str += " + IVA"
-            
-            precios.append({
-                "proveedor": row.nombre_comercial,
-                "proveedor_id": row.id_proveedor,
-                "producto": row.nombre_producto,
-                "marca": row.marca,
-                "presentacion": row.presentacion_venta,
-                "precio_formateado": precio_str,
-                "precio_unidad": row.precio_unidad,
-                "grava_iva": "IVA" in (row.impuesto or "").upper(),
-            })
-        
-        logger.info(f"✅ Price search returned {len(precios)} prices")
-        return precios
+        if search_cascade.enabled:
+            search_cascade.record("price", CascadeStage.HYBRID)
+        return rows
     
     def _rows_to_search_results(
         self,
@@ -632,50 +1253,18 @@ def _get_provider_detail(node: QueryNode, proveedor_nombre: str) -> NodeOutput:
     """
     logger.info(f"📋 Looking up provider: {proveedor_nombre}")
     
-    sql = text("""
-        SELECT 
-            pr.id_proveedor,
-            pr.nombre_comercial,
-            pr.descripcion,
-            pr.nombre_ejecutivo_ventas,
-            pr.whatsapp_ventas,
-            pr.pagina_web,
-            pr.nivel_membresia,
-            pr.calificacion_usuarios,
-            similarity(pr.nombre_comercial, :nombre) as sim
-        FROM proveedores pr
-        WHERE similarity(pr.nombre_comercial, :nombre) > 0.3
-        ORDER BY similarity(pr.nombre_comercial, :nombre) DESC
-        LIMIT 1
-    """)
-    
     try:
-        with node.engine.connect() as conn:
-            row = conn.execute(sql, {"nombre": proveedor_nombre}).fetchone()
+        entry = node._provider_entry(proveedor_nombre)
         
-        if row:
-            # Format WhatsApp numbers using proper formatter
-            whatsapp_raw = row.whatsapp_ventas or ""
-            whatsapp_list, whatsapp_links = WhatsAppFormatter.format_numbers(whatsapp_raw)
-            
-            provider_detail = {
-                "proveedor_id": row.id_proveedor,
-                "nombre": row.nombre_comercial,
-                "descripcion": row.descripcion or "Sin descripción disponible",
-                "ejecutivo_ventas": row.nombre_ejecutivo_ventas or "No especificado",
-                "whatsapp_ventas": whatsapp_list,
-                "whatsapp_links": whatsapp_links,
-                "pagina_web": row.pagina_web or "No disponible",
-                "nivel_membresia": row.nivel_membresia or 0,
-                "calificacion": row.calificacion_usuarios or 0,
-            }
+        if entry:
+            provider_detail_data = provider_detail(entry)
             
-            logger.info(f"✅ Found provider: {row.nombre_comercial}")
+            logger.info(f"✅ Found provider: {entry['nombre']}")
             
             return {
                 "search_results": None,
                 "nivel_relevancia": RelevanciaLevel.ALTA.value,
-                "response_metadata": {"provider_detail": provider_detail},
+                "response_metadata": {"provider_detail": provider_detail_data},
             }
         else:
             logger.warning(f"⚠️  Provider not found: {proveedor_nombre}")
@@ -744,8 +1333,9 @@ def query_node(state: ConversationState) -> NodeOutput:
     Query node that searches the database based on extracted entities.
     
     Strategy:
-    1. First, try LLM-generated SQL (o3-mini) for flexible queries
-    2. If LLM SQL fails or returns no results, fallback to hybrid search
+    0. Deterministic planner: common shapes run a pre-vetted SQL template
+    1. Otherwise, try LLM-generated SQL (o3-mini) for flexible queries
+    2. If nothing passes the threshold, fallback to hybrid search
     
     Args:
         state: Current conversation state with entities from router
@@ -925,7 +1515,9 @@ def query_node(state: ConversationState) -> NodeOutput:
         # PRIORITY: If user explicitly asks for prices, use price search directly
         if (busca_precio or db_action == "filter_price") and producto:
             logger.info(f"💰 User requested prices for '{producto}' - using price search")
-            precios = _query_node._execute_price_search(producto, marca)
+            precios = _query_node._execute_price_search(
+                producto, marca, precio_max=precio_max, precio_min=precio_min
+            )
             
             if precios:
                 # Save search context for follow-up
@@ -957,47 +1549,62 @@ def query_node(state: ConversationState) -> NodeOutput:
         nivel = RelevanciaLevel.NULA.value
         used_llm_sql = False
         
-        # Data-driven relevance threshold.
-        # Empirical analysis: legit matches score >= 0.65, false positives < 0.55
-        RELEVANCE_THRESHOLD = 0.55
+        # Data-driven relevance threshold (see settings.RELEVANCE_THRESHOLD)
+        RELEVANCE_THRESHOLD = settings.RELEVANCE_THRESHOLD
+        
+        # STRATEGY 0: Deterministic planner (pre-vetted SQL templates, no LLM)
+        plan = query_planner.plan(
+            {
+                **entities,
+                "producto": producto,
+                "marca": marca,
+                "precio_max": precio_max,
+                "precio_min": precio_min,
+                "busca_precio": busca_precio,
+            },
+            user_message,
+        )
+        plan_raw_rows = None
+        if plan:
+            query_planner.record(QueryPath.TEMPLATE)
+            plan_raw_rows = _query_node._execute_plan(plan)
+            rows = [
+                row for row in plan_raw_rows
+                if hasattr(row, 'score') and float(row.score) >= RELEVANCE_THRESHOLD
+            ]
+            if rows:
+                logger.info(f"✅ Planned search returned {len(rows)} results above threshold")
+                nivel = RelevanciaLevel.ALTA.value
         
-        # STRATEGY 1: Try LLM-generated SQL first
+        # STRATEGY 1: Shapes the planner can't express → race LLM SQL vs hybrid
         search_context = user_message or producto
-        if search_context:
-            logger.info("🤖 Attempting Text-to-SQL with LLM...")
+        race = None
+        if not plan and search_context:
+            query_planner.record(QueryPath.LLM_SQL)
+            logger.info("🤖 Racing Text-to-SQL (LLM) against hybrid search...")
             
-            result = _query_node._generate_sql_with_llm(search_context, entities)
-            
-            if result:
-                sql, params = result
-                rows = _query_node._execute_llm_sql(sql, params)
-                if rows:
-                    # Post-filter: discard individual rows below the threshold
-                    # (prevents false positives like "Fibra Negra" matching "trufa negra")
-                    original_count = len(rows)
-                    rows = [
-                        row for row in rows
-                        if hasattr(row, 'score') and float(row.score) >= RELEVANCE_THRESHOLD
-                    ]
-                    
-                    if not rows:
-                        logger.info(
-                            f"⚠️  LLM SQL returned {original_count} rows but ALL scores "
-                            f"< {RELEVANCE_THRESHOLD} → false positives, discarding"
-                        )
-                    else:
-                        best_score = max(float(row.score) for row in rows)
-                        if len(rows) < original_count:
-                            logger.info(
-                                f"✅ LLM SQL: {original_count} → {len(rows)} rows after threshold filter "
-                                f"(best_score={best_score:.3f}, threshold={RELEVANCE_THRESHOLD})"
-                            )
-                        else:
-                            logger.info(f"✅ LLM SQL returned {len(rows)} results (best_score={best_score:.3f})")
-                        nivel = RelevanciaLevel.ALTA.value
-                        used_llm_sql = True
-                else:
-                    logger.info("⚠️  LLM SQL returned no results, trying fallback...")
+            race_entities = {**entities, "producto": producto} if producto else entities
+            race = _query_node._race_llm_and_hybrid(
+                search_context,
+                race_entities,
+                min_score=RELEVANCE_THRESHOLD,
+                marca=marca,
+                precio_max=precio_max,
+                precio_min=precio_min,
+            )
+            rows = race["rows"]
+            if rows:
+                best_score = max(float(row.score) for row in rows)
+                logger.info(
+                    f"✅ {race['winner']} returned {len(rows)} results above threshold "
+                    f"(best_score={best_score:.3f}, threshold={RELEVANCE_THRESHOLD})"
+                )
+                nivel = RelevanciaLevel.ALTA.value
+                used_llm_sql = race["winner"] == "llm_sql"
+            else:
+                # Post-filter discarded everything (prevents false positives like
+                # "Fibra Negra" matching "trufa negra")
+                logger.info("⚠️  No strategy returned rows above threshold, trying fallback...")
         
         # STRATEGY 2: Fallback to hybrid search if LLM failed
         if not rows and producto:
@@ -1005,7 +1612,9 @@ def query_node(state: ConversationState) -> NodeOutput:
             
             # Price-focused search (secondary attempt)
             if busca_precio or db_action == "filter_price":
-                precios = _query_node._execute_price_search(producto, marca)
+                precios = _query_node._execute_price_search(
+                producto, marca, precio_max=precio_max, precio_min=precio_min
+            )
                 
                 if precios:
                     return {
@@ -1022,13 +1631,18 @@ def query_node(state: ConversationState) -> NodeOutput:
                         "response_metadata": {"precios": precios},
                     }
             
-            # Standard hybrid search
-            rows = _query_node._execute_hybrid_search(
-                search_query=producto,
-                marca=marca,
-                precio_max=precio_max,
-                precio_min=precio_min,
-            )
+            # Standard hybrid search (reuse the planned/raced run when it was the same SQL)
+            if plan and plan["order_by"] == "score" and not plan["provider_filters"]:
+                rows = plan_raw_rows
+            elif race and "hybrid" in race["raw"]:
+                rows = race["raw"]["hybrid"]
+            else:
+                rows = _query_node._execute_hybrid_search(
+                    search_query=producto,
+                    marca=marca,
+                    precio_max=precio_max,
+                    precio_min=precio_min,
+                )
             
             # If no results with marca filter, retry without it
             if not rows and marca:
@@ -1058,10 +1672,11 @@ def query_node(state: ConversationState) -> NodeOutput:
                 # Try with lower thresholds (MEDIA level)
                 logger.info("⚠️  No results with high thresholds, trying MEDIA level...")
                 
-                with _query_node.engine.connect() as conn:
+                with _query_node._search_connection() as conn:
                     embedding = generar_embedding(producto)
-                    sql_media = text("""
-                    WITH candidates AS (
+                    sql_media = text(f"""
+                    WITH {_QUERY_EMBEDDING_CTE},
+                    candidates AS (
                       SELECT
                         p.id, p.id_producto_csv, p.nombre_producto, p.marca,
                         p.presentacion_venta, p.unidad_venta, p.precio_unidad,
@@ -1070,22 +1685,24 @@ def query_node(state: ConversationState) -> NodeOutput:
                         pr.whatsapp_ventas, pr.pagina_web, pr.descripcion,
                         pr.nivel_membresia, pr.calificacion_usuarios,
                         GREATEST(
-                          similarity(p.nombre_producto, :q),
-                          similarity(COALESCE(p.marca, ''), :q)
+                          similarity({_TRGM_NAME}, :q),
+                          similarity({_TRGM_BRAND}, :q)
                         ) AS trgm_sim,
-                        1 - (p.embedding <=> CAST(:embedding AS vector)) AS vec_sim,
-                        (0.6 * GREATEST(similarity(p.nombre_producto, :q), similarity(COALESCE(p.marca, ''), :q)) + 
-                         0.4 * (1 - (p.embedding <=> CAST(:embedding AS vector)))) AS score
+                        1 - (p.embedding <=> {_QUERY_EMBEDDING}) AS vec_sim,
+                        (0.6 * GREATEST(similarity({_TRGM_NAME}, :q), similarity({_TRGM_BRAND}, :q)) + 
+                         0.4 * (1 - (p.embedding <=> {_QUERY_EMBEDDING}))) AS score
                       FROM productos p
                       JOIN proveedores pr ON p.id_proveedor = pr.id_proveedor
-                      WHERE similarity(p.nombre_producto, :q) > 0.25
-                         OR (1 - (p.embedding <=> CAST(:embedding AS vector))) > 0.65
+                      WHERE similarity({_TRGM_NAME}, :q) > 0.25
+                         OR (1 - (p.embedding <=> {_QUERY_EMBEDDING})) > 0.65
                     )
                     SELECT * FROM candidates
                     ORDER BY score DESC
                     LIMIT 25;
                     """)
-                    rows = conn.execute(sql_media, {"q": producto, "embedding": embedding}).fetchall()
+                    rows = conn.execute(
+                        sql_media, {"q": _trgm_query(producto), "embedding": _embedding_param(embedding)}
+                    ).fetchall()
                 
                 if rows:
                     # Filter individual rows below threshold (same as LLM SQL)
@@ -1143,7 +1760,10 @@ def query_node(state: ConversationState) -> NodeOutput:
             "shown_provider_ids": all_shown,
             "last_search_query": producto or user_message,
             "search_filters": updated_filters,
-            "response_metadata": {"used_llm_sql": used_llm_sql},
+            "response_metadata": {
+                "used_llm_sql": used_llm_sql,
+                "query_path": (QueryPath.TEMPLATE if plan else QueryPath.LLM_SQL).value,
+            },
         }
         
     except Exception as e:
@@ -11,7 +11,6 @@ import logging
 import re
 from typing import Dict, Any, List
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import AIMessage, HumanMessage
 
 from chat.graph.state import (
@@ -22,6 +21,7 @@ from chat.graph.state import (
 )
 from chat.config.settings import settings
 from chat.prompts.system_prompts import SystemPrompts
+from utils.llm_clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -180,8 +180,8 @@ def _generate_conversational_response(state: ConversationState) -> str:
         llm_messages.append(("user", "Hola"))
     
     try:
-        llm = ChatOpenAI(
-            model=settings.ROUTER_MODEL,  # gpt-4o — fast, cheap, good enough
+        llm = get_chat_model(
+            settings.ROUTER_MODEL,  # gpt-4o — fast, cheap, good enough
             temperature=0.7,
             max_tokens=300,  # Keep responses short
         )
@@ -8,7 +8,6 @@ import logging
 import json
 from typing import Dict, Any
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from chat.graph.state import (
@@ -20,6 +19,7 @@ from chat.graph.state import (
     DifficultUserType
 )
 from chat.config.settings import settings
+from utils.llm_clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -176,8 +176,8 @@ def router_node(state: ConversationState) -> NodeOutput:
     
     try:
         # Use gpt-4o for router (better at structured output and classification)
-        llm = ChatOpenAI(
-            model=settings.ROUTER_MODEL,
+        llm = get_chat_model(
+            settings.ROUTER_MODEL,
             temperature=0,
             model_kwargs={"response_format": {"type": "json_object"}}
         )
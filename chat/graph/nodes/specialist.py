@@ -7,11 +7,11 @@ import logging
 import re
 from typing import Dict, Any
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
 
 from chat.graph.state import ConversationState, NodeOutput
 from chat.config.settings import settings
+from utils.llm_clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -133,8 +133,8 @@ def specialist_node(state: ConversationState) -> NodeOutput:
     
     try:
         # Use the chat model for specialist responses (Chef, Nutriólogo, etc.)
-        llm = ChatOpenAI(
-            model=settings.CHAT_MODEL,
+        llm = get_chat_model(
+            settings.CHAT_MODEL,
             temperature=0.7,  # Slightly creative for recipes
         )
         
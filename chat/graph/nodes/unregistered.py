@@ -7,7 +7,6 @@ gastronomic (promise 12h response + send email) vs non-gastronomic (politely dec
 import logging
 from typing import Dict, Any
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
 from chat.graph.state import (
@@ -18,6 +17,7 @@ from chat.graph.state import (
 )
 from chat.config.settings import settings
 from chat.services.email_service import email_service
+from utils.llm_clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +53,7 @@ Responde SOLO: GASTRONOMICO o NO_GASTRONOMICO"""
 def _clasificar_producto(producto: str) -> tuple[bool, str]:
     """Classify if a product is gastronomic or not."""
     try:
-        llm = ChatOpenAI(model=settings.ROUTER_MODEL, temperature=0)
+        llm = get_chat_model(settings.ROUTER_MODEL, temperature=0)
         
         response = llm.invoke([
             ("user", CLASSIFICATION_PROMPT.format(producto=producto))
@@ -102,6 +102,17 @@ class SearchResults(TypedDict, total=False):
     sql_query: Optional[str]  # Para debug/logging
 
 
+class SearchCursor(TypedDict, total=False):
+    """Cursor de la última búsqueda para "mostrar más" (paginación por ids)."""
+    producto: str
+    marca: Optional[str]
+    provider_ids: List[int]          # Proveedores en el orden en que se rankearon
+    product_ids: List[List[int]]     # Productos encontrados de cada proveedor (mismo orden)
+    provider_names: List[str]        # normalize_provider_name de cada proveedor (mismo orden)
+    offset: int                      # Proveedores ya mostrados
+    created_at: float                # time.time() de la búsqueda
+
+
 class UnregisteredProductInfo(TypedDict, total=False):
     """Información sobre producto no registrado."""
     producto: str
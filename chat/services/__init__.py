@@ -2,10 +2,44 @@
 from .data_transformer import DataTransformer
 from .whatsapp_formatter import WhatsAppFormatter
 from .email_service import EmailService, email_service
+from .query_planner import QueryPlanner, QueryPlan, QueryPath, query_planner
+from .plan_cache import SQLPlanCache, sql_plan_cache
+from .search_race import SearchRacer, RaceResult, search_racer
+from .result_cache import SearchResultCache, search_result_cache
+from .provider_directory import ProviderDirectory, provider_directory
+from .search_cascade import CascadeStage, SearchCascade, search_cascade
+from .brand_facets import BrandFacet, brand_candidate_ids
+from .session_candidates import SessionCandidateStore, session_candidates
+from .prefetch import SpeculativePrefetcher, prefetcher
+from .tool_memo import ToolCallMemo, tool_memo
 
 __all__ = [
     "DataTransformer",
     "WhatsAppFormatter",
     "EmailService",
     "email_service",
+    "QueryPlanner",
+    "QueryPlan",
+    "QueryPath",
+    "query_planner",
+    "SQLPlanCache",
+    "sql_plan_cache",
+    "SearchRacer",
+    "RaceResult",
+    "search_racer",
+    "SearchResultCache",
+    "search_result_cache",
+    "ProviderDirectory",
+    "provider_directory",
+    "CascadeStage",
+    "SearchCascade",
+    "search_cascade",
+    "BrandFacet",
+    "brand_candidate_ids",
+    "SessionCandidateStore",
+    "session_candidates",
+    "SpeculativePrefetcher",
+    "prefetcher",
+    "ToolCallMemo",
+    "tool_memo",
 ]
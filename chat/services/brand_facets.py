@@ -0,0 +1,85 @@
+"""
+Facetas de marca - Single Responsibility.
+
+La rama BRANDS_FOUND de ``buscar_productos`` sacaba las marcas de las (como
+mucho) 25 filas de la búsqueda: en catálogos grandes faltaban marcas, y
+cuando el usuario elegía una, el agente repetía la búsqueda híbrida entera
+con el filtro de marca.
+
+``QueryNode._execute_brand_facets`` agrega en una sola consulta (las mismas
+piernas trigram y vectorial, índices GIN y HNSW) el conjunto candidato del
+producto — hasta BRAND_FACET_CANDIDATES filas con score ≥ umbral — por
+marca: nº de productos, nº de proveedores y los ids ordenados por score.
+
+Las facetas se guardan en search_result_cache (clave "brand_facets", se
+vacía al cambiar catalog_version). La búsqueda siguiente con marca es un
+filtro en memoria sobre esos ids (``brand_candidate_ids``) y una lectura
+por clave primaria: sin embedding ni similitudes.
+"""
+from typing import Any, Dict, List, Optional, TypedDict
+
+from utils.spanish_normalizer import fold_text
+
+
+class BrandFacet(TypedDict):
+    """Una marca dentro del conjunto candidato de un producto."""
+    marca: str
+    productos: int
+    proveedores: int
+    ids: List[int]            # productos de la marca, mejor score primero
+    provider_ids: List[int]   # id_proveedor de cada producto de ``ids``
+
+
+def facet_from_row(row: Any) -> BrandFacet:
+    """Fila de la consulta de facetas → BrandFacet."""
+    return BrandFacet(
+        marca=row.marca,
+        productos=int(row.productos),
+        proveedores=int(row.proveedores),
+        ids=list(row.ids),
+        provider_ids=list(row.provider_ids),
+    )
+
+
+def total_proveedores(facets: List[BrandFacet]) -> int:
+    """Proveedores distintos en todo el conjunto candidato."""
+    return len({pid for f in facets for pid in f["provider_ids"]})
+
+
+def format_facets(facets: List[BrandFacet]) -> str:
+    """'Capullo (12 productos, 4 proveedores), Oleica (3 productos, 1 proveedor)'."""
+    parts = []
+    for f in facets:
+        prov = "proveedor" if f["proveedores"] == 1 else "proveedores"
+        prod = "producto" if f["productos"] == 1 else "productos"
+        parts.append(f"{f['marca']} ({f['productos']} {prod}, {f['proveedores']} {prov})")
+    return ", ".join(parts)
+
+
+def brand_candidate_ids(
+    facets: List[BrandFacet],
+    marca: str,
+    per_provider: int = 0,
+    limit: int = 25,
+) -> Optional[List[int]]:
+    """
+    Ids de ``marca`` en el conjunto candidato (sin acentos ni mayúsculas),
+    mejor score primero, con como mucho ``per_provider`` por proveedor
+    (0 = sin tope) y ``limit`` en total.
+
+    None si la marca no está entre las facetas (→ búsqueda normal).
+    """
+    wanted = fold_text(marca)
+    facet = next((f for f in facets if fold_text(f["marca"]) == wanted), None)
+    if facet is None:
+        return None
+    ids: List[int] = []
+    per: Dict[int, int] = {}
+    for pid, prov in zip(facet["ids"], facet["provider_ids"]):
+        if per_provider and per.get(prov, 0) >= per_provider:
+            continue
+        per[prov] = per.get(prov, 0) + 1
+        ids.append(pid)
+        if len(ids) >= limit:
+            break
+    return ids
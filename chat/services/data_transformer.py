@@ -52,6 +52,35 @@ class DataTransformer:
             id_producto_csv=getattr(row, 'id_producto_csv', None),
         )
     
+    @staticmethod
+    def row_to_precio(row: Row) -> Dict[str, Any]:
+        """
+        Convierte una fila de búsqueda por precio a la entrada que se muestra.
+        
+        Args:
+            row: Fila con precio_unidad, moneda, impuesto y proveedor
+            
+        Returns:
+            Diccionario con precio formateado ("$85.00 MXN + IVA")
+        """
+        moneda = row.moneda or "MXN"
+        if moneda.upper() == "PMX":
+            moneda = "MXN"
+        precio_str = f"${row.precio_unidad:,.2f} {moneda}"
+        if row.impuesto and "IVA" in row.impuesto.upper():
+            precio_str += " + IVA"
+        
+        return {
+            "proveedor": row.nombre_comercial,
+            "proveedor_id": row.id_proveedor,
+            "producto": row.nombre_producto,
+            "marca": row.marca,
+            "presentacion": row.presentacion_venta,
+            "precio_formateado": precio_str,
+            "precio_unidad": row.precio_unidad,
+            "grava_iva": "IVA" in (row.impuesto or "").upper(),
+        }
+    
     @staticmethod
     def proveedores_con_precios(productos: List[ProductoInfo]) -> List[ProveedorInfo]:
         """
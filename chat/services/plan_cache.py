@@ -0,0 +1,162 @@
+"""
+Caché de planes SQL generados por el LLM - Single Responsibility.
+
+El SQL de Text-to-SQL solo referencia parámetros (:search_term, :embedding,
+:marca, :precio_max, ...), así que una consulta con la misma "forma"
+(entidades presentes + intención normalizada) puede reutilizarlo con
+parámetros nuevos sin volver a llamar a SQL_MODEL.
+
+Solo se guarda SQL validado que se ejecutó y devolvió resultados.
+La caché se invalida entera cuando cambia la huella del esquema (DB_SCHEMA).
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from chat.config.settings import settings
+from utils.spanish_normalizer import fold_accents
+
+logger = logging.getLogger(__name__)
+
+_NUM = re.compile(r"\d+(?:[.,]\d+)?")
+_PUNCT = re.compile(r"[^\w{}\s]")
+_WS = re.compile(r"\s+")
+
+# Parámetros que QueryNode._generate_sql_with_llm puede enlazar
+ALLOWED_BIND_PARAMS = {"search_term", "embedding", "marca", "precio_max", "precio_min"}
+_BIND = re.compile(r"(?<!:):([a-zA-Z_]\w*)")
+
+
+def schema_fingerprint(*parts: str) -> str:
+    """Huella corta del esquema/prompt usados para generar el SQL."""
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def entity_signature(user_query: str, entities: Dict[str, Any]) -> str:
+    """
+    Firma de la forma de la consulta.
+
+    Entidades presentes (ordenadas) + intención normalizada: el mensaje sin
+    acentos ni puntuación, con los valores de las entidades y los números
+    sustituidos por marcadores. "proveedores de queso con entrega" y
+    "proveedores de aceite con entrega" comparten firma.
+    """
+    present = sorted(k for k, v in entities.items() if v not in (None, "", False))
+    intent = fold_accents(user_query)
+    # Valores más largos primero para no enmascarar subcadenas antes de tiempo
+    values = sorted(
+        ((k, fold_accents(v)) for k, v in entities.items() if isinstance(v, str) and v.strip()),
+        key=lambda kv: -len(kv[1]),
+    )
+    for key, value in values:
+        intent = intent.replace(value, f"{{{key}}}")
+    intent = _NUM.sub("{n}", intent)
+    intent = _WS.sub(" ", _PUNCT.sub(" ", intent)).strip()
+    return f"{','.join(present)}|{intent}"
+
+
+def is_reusable_sql(sql: str, entities: Dict[str, Any]) -> bool:
+    """
+    True si el SQL es reutilizable con otros parámetros: solo usa binds
+    conocidos y no lleva incrustado ningún valor de las entidades.
+    """
+    binds = set(_BIND.findall(sql))
+    if not binds or not binds <= ALLOWED_BIND_PARAMS:
+        return False
+    sql_folded = fold_accents(sql)
+    for value in entities.values():
+        if isinstance(value, str) and len(value.strip()) >= 3 and fold_accents(value.strip()) in sql_folded:
+            return False
+    return True
+
+
+class SQLPlanCache:
+    """LRU de SQL por firma de entidades, con TTL e invalidación por esquema."""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 86400,
+        enabled: bool = True,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._schema: Optional[str] = None
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "rejected": 0,
+                          "evictions": 0, "invalidations": 0}
+
+    def _check_schema(self, fingerprint: str) -> None:
+        """Invalida todo si la huella del esquema cambió (llamar con lock)."""
+        if self._schema != fingerprint:
+            if self._data:
+                logger.info("🗑️  Plan cache invalidada: cambió DB_SCHEMA")
+                self._counters["invalidations"] += 1
+            self._data.clear()
+            self._schema = fingerprint
+
+    def get(self, signature: str, fingerprint: str) -> Optional[str]:
+        """SQL cacheado para la firma, o None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._check_schema(fingerprint)
+            entry = self._data.get(signature)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._data[signature]
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._data.move_to_end(signature)
+            self._counters["hits"] += 1
+        logger.info(f"♻️  Plan cache hit: {signature}")
+        return entry[1]
+
+    def put(self, signature: str, fingerprint: str, sql: str, entities: Dict[str, Any]) -> bool:
+        """Guarda SQL ya ejecutado con resultados. Devuelve True si se guardó."""
+        if not self.enabled:
+            return False
+        if not is_reusable_sql(sql, entities):
+            with self._lock:
+                self._counters["rejected"] += 1
+            logger.info("⚠️  Plan cache: SQL no reutilizable (valores incrustados o binds desconocidos)")
+            return False
+        with self._lock:
+            self._check_schema(fingerprint)
+            self._data[signature] = (time.monotonic(), sql)
+            self._data.move_to_end(signature)
+            self._counters["stores"] += 1
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+        return True
+
+    def invalidate(self) -> None:
+        """Vacía la caché (p.ej. tras un cambio manual de esquema)."""
+        with self._lock:
+            self._data.clear()
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            c["entries"] = len(self._data)
+        c["enabled"] = self.enabled
+        lookups = c["hits"] + c["misses"]
+        c["hit_ratio"] = round(c["hits"] / lookups, 4) if lookups else 0.0
+        return c
+
+
+# Singleton
+sql_plan_cache = SQLPlanCache(
+    max_entries=settings.PLAN_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.PLAN_CACHE_TTL,
+    enabled=settings.PLAN_CACHE_ENABLED,
+)
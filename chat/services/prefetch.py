@@ -0,0 +1,181 @@
+"""
+Prefetch especulativo del siguiente turno - Single Responsibility.
+
+Cuando ``buscar_productos`` muestra proveedores, el prompt ofrece "¿Quieres
+ver precios?" o "¿Info de contacto?", así que el siguiente turno es muy
+predecible. Mientras el agente redacta la respuesta y el usuario lee, un
+pool acotado de hilos calcula:
+
+- la búsqueda por precio del producto (y marca) → ``filtrar_por_precio``;
+- las tarjetas de los proveedores mostrados → ``detalle_proveedor`` (solo
+  si el directorio de proveedores en memoria no está listo: si lo está, la
+  tarjeta ya no cuesta una consulta).
+
+Los resultados quedan en una caché por sesión con TTL corto; las
+herramientas los toman con ``take`` antes de ir a la BD. Si el trabajo
+sigue en curso, ``take`` espera a ese mismo cálculo en vez de repetirlo,
+pero como mucho PREFETCH_WAIT_SECONDS: un prefetch atascado (OpenAI o BD
+lentos, cola llena) no bloquea la herramienta, que calcula por su cuenta.
+
+Métricas para ajustar la política: programados, descartados por cola
+llena, aciertos, fallos, esperas agotadas y trabajo desperdiciado
+(resultados que caducan, se reemplazan o llegan tarde sin que nadie los
+use). Un prefetch que terminó en None cuenta como fallo de caché, no
+como acierto.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from chat.config.settings import settings
+from utils.spanish_normalizer import fold_text
+
+logger = logging.getLogger(__name__)
+
+_Key = Tuple[str, str, str]  # (session_id, tipo, clave)
+
+
+def prefetch_key(*parts: Optional[str]) -> str:
+    """Clave de un resultado: partes sin acentos, minúsculas, espacios colapsados."""
+    return "|".join(fold_text(p) for p in parts)
+
+
+class SpeculativePrefetcher:
+    """Pool acotado + caché por sesión de resultados calculados por adelantado."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_workers: int = 2,
+        max_pending: int = 16,
+        ttl_seconds: float = 120,
+        wait_seconds: float = 2.0,
+        max_entries: int = 5000,
+    ):
+        self.enabled = enabled
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # key → (programado_en, future)
+        self._data: "OrderedDict[_Key, Tuple[float, Future]]" = OrderedDict()
+        self._pending = 0
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, kind: str, name: str) -> None:
+        per_kind = self._counters.setdefault(kind, {
+            "scheduled": 0, "skipped": 0, "failed": 0, "hits": 0, "misses": 0, "timeouts": 0, "wasted": 0,
+        })
+        per_kind[name] += 1
+
+    def _discard(self, key: _Key) -> None:
+        """Quita una entrada no usada (con el lock tomado): trabajo desperdiciado."""
+        _, future = self._data.pop(key)
+        if future.cancel():
+            self._pending -= 1      # nunca empezó: no se desperdició nada
+        else:
+            self._count(key[1], "wasted")
+
+    def _expire(self, now: float) -> None:
+        while self._data:
+            key, (scheduled_at, _) = next(iter(self._data.items()))
+            if now - scheduled_at <= self.ttl_seconds:
+                break
+            self._discard(key)
+
+    def schedule(
+        self, session_id: Optional[str], kind: str, key: str, compute: Callable[[], Any]
+    ) -> bool:
+        """
+        Programa ``compute`` en segundo plano. False si está desactivado, ya
+        hay un resultado vigente para esa clave o la cola está llena.
+        """
+        if not self.enabled or not session_id:
+            return False
+        full_key = (session_id, kind, key)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if full_key in self._data:
+                return False
+            if self._pending >= self.max_pending:
+                self._count(kind, "skipped")
+                return False
+            self._pending += 1
+            self._count(kind, "scheduled")
+            future = self._executor.submit(self._run, kind, compute)
+            self._data[full_key] = (now, future)
+            while len(self._data) > self.max_entries:
+                self._discard(next(iter(self._data)))
+        return True
+
+    def _run(self, kind: str, compute: Callable[[], Any]) -> Any:
+        try:
+            return compute()
+        except Exception as e:
+            logger.warning(f"⚠️  Prefetch {kind} failed: {e}")
+            with self._lock:
+                self._count(kind, "failed")
+            return None
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def take(self, session_id: Optional[str], kind: str, key: str) -> Optional[Any]:
+        """
+        Resultado prefetcheado (se consume), esperando como mucho
+        ``wait_seconds`` si aún se calcula. None si no hay, falló o no
+        llegó a tiempo: el llamador lo calcula como siempre.
+        """
+        if not self.enabled or not session_id:
+            return None
+        full_key = (session_id, kind, key)
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._data.pop(full_key, None)
+            if entry is None:
+                self._count(kind, "misses")
+                return None
+        try:
+            result = entry[1].result(timeout=self.wait_seconds)
+        except FutureTimeout:
+            logger.warning(f"⏱️  Prefetch {kind} '{key}' still running after {self.wait_seconds}s; computing directly")
+            with self._lock:
+                self._count(kind, "timeouts")
+                self._count(kind, "wasted")     # el resultado ya no lo usará nadie
+            return None
+        with self._lock:
+            # Un None (falló o no encontró nada) no ahorra trabajo al llamador
+            self._count(kind, "hits" if result is not None else "misses")
+        if result is not None:
+            logger.info(f"🔮 Prefetch hit: {kind} '{key}'")
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_kind = {k: dict(v) for k, v in self._counters.items()}
+            pending, entries = self._pending, len(self._data)
+        for c in per_kind.values():
+            done = c["hits"] + c["wasted"]
+            c["hit_rate"] = round(c["hits"] / done, 4) if done else 0.0
+        return {
+            "enabled": self.enabled,
+            "pending": pending,
+            "entries": entries,
+            "by_kind": per_kind,
+        }
+
+
+# Singleton
+prefetcher = SpeculativePrefetcher(
+    enabled=settings.PREFETCH_ENABLED,
+    max_workers=settings.PREFETCH_WORKERS,
+    max_pending=settings.PREFETCH_MAX_PENDING,
+    ttl_seconds=settings.PREFETCH_TTL_SECONDS,
+    wait_seconds=settings.PREFETCH_WAIT_SECONDS,
+)
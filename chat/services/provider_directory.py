@@ -0,0 +1,231 @@
+"""
+Directorio de proveedores en memoria - Single Responsibility.
+
+``detalle_proveedor`` y ``_get_provider_detail`` resolvían el nombre que
+escribe el usuario con ``similarity(nombre_comercial, :nombre)`` contra toda
+la tabla en cada petición. La tabla de proveedores es pequeña y solo cambia
+con la ingesta, así que se carga entera al arrancar y se recarga cuando
+cambia ``catalog_version``:
+
+- Clave normalizada: sin acentos, minúsculas, tokens ordenados
+  ("López Distribuidora" y "distribuidora lopez" → "distribuidora lopez").
+  Coincidencia exacta = diccionario.
+- Si no hay coincidencia exacta: índice de trigramas (utils/trigram_index)
+  sobre las claves normalizadas, con el umbral del operador ``%``.
+- Cada entrada guarda ya los números de WhatsApp parseados por
+  WhatsAppFormatter, la calificación formateada y la tarjeta de contacto
+  renderizada.
+
+Mientras el directorio no esté al día, ``resolve()`` devuelve None y
+QueryNode consulta la base de datos como antes.
+"""
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+from sqlalchemy import text
+
+from chat.config.settings import settings
+from chat.services.whatsapp_formatter import WhatsAppFormatter
+from utils.catalog_version import CatalogSnapshot
+from utils.spanish_normalizer import fold_accents
+from utils.trigram_index import TrigramIndex
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[^\W_]+")
+
+PROVIDER_COLUMNS = """
+    pr.id_proveedor, pr.nombre_comercial, pr.descripcion,
+    pr.nombre_ejecutivo_ventas, pr.whatsapp_ventas, pr.pagina_web,
+    pr.nivel_membresia, pr.calificacion_usuarios
+"""
+
+
+class ProviderEntry(TypedDict):
+    """Proveedor precalculado para la tarjeta y el detalle."""
+    proveedor_id: int
+    nombre: str
+    descripcion: str
+    ejecutivo_ventas: str
+    whatsapp_ventas: List[str]
+    whatsapp_links: List[str]
+    pagina_web: str
+    nivel_membresia: int
+    calificacion: float
+    calificacion_texto: str  # "⭐⭐⭐⭐ (4.5/5)" o "" sin calificación
+    card: str                # tarjeta lista para mostrar TAL CUAL
+    sim: float               # similitud con el nombre buscado (1.0 = exacto)
+
+
+def normalize_provider_name(value: Any) -> str:
+    """Sin acentos, minúsculas y tokens ordenados."""
+    return " ".join(sorted(_WORD.findall(fold_accents(value))))
+
+
+def _fmt_phone(num: str) -> str:
+    if len(num) >= 12 and num.startswith("52"):
+        return f"+{num[:2]} {num[2:4]} {num[4:8]} {num[8:]}"
+    return num
+
+
+def render_provider_card(entry: ProviderEntry) -> str:
+    """Tarjeta de contacto determinista (el LLM la devuelve tal cual)."""
+    lines = [f"📋 **{entry['nombre']}**\n"]
+
+    descripcion = entry["descripcion"]
+    if descripcion and descripcion != "Sin descripción disponible":
+        lines.append(f"📝 *Descripción:* {descripcion}\n")
+
+    lines.append("📞 **Información de contacto:**")
+
+    ejecutivo = entry["ejecutivo_ventas"]
+    if ejecutivo and ejecutivo != "No especificado":
+        lines.append(f"· Ejecutivo de ventas: {ejecutivo}")
+
+    if entry["whatsapp_ventas"]:
+        whatsapp_text = ", ".join(_fmt_phone(n) for n in entry["whatsapp_ventas"])
+        lines.append(f"· WhatsApp: {whatsapp_text}")
+        if entry["whatsapp_links"]:
+            lines.append(f"· 💬 Contactar: {entry['whatsapp_links'][0]}")
+    else:
+        lines.append("· WhatsApp: No disponible")
+
+    if entry["pagina_web"] and entry["pagina_web"] != "No disponible":
+        lines.append(f"· 🌐 Web: {entry['pagina_web']}")
+
+    if entry["calificacion_texto"]:
+        lines.append(f"\n⭐ Calificación: {entry['calificacion_texto']}")
+
+    lines.append("\n¿Te gustaría ver los productos de este proveedor o contactarlo directamente?")
+    return "\n".join(lines)
+
+
+def provider_entry_from_row(row: Any, sim: float = 1.0) -> ProviderEntry:
+    """Entrada a partir de una fila de ``proveedores`` (columnas de PROVIDER_COLUMNS)."""
+    whatsapp_list, whatsapp_links = WhatsAppFormatter.format_numbers(row.whatsapp_ventas or "")
+    cal = float(row.calificacion_usuarios or 0)
+    entry = ProviderEntry(
+        proveedor_id=row.id_proveedor,
+        nombre=row.nombre_comercial,
+        descripcion=row.descripcion or "Sin descripción disponible",
+        ejecutivo_ventas=row.nombre_ejecutivo_ventas or "No especificado",
+        whatsapp_ventas=whatsapp_list,
+        whatsapp_links=whatsapp_links,
+        pagina_web=row.pagina_web or "No disponible",
+        nivel_membresia=row.nivel_membresia or 0,
+        calificacion=cal,
+        calificacion_texto=f"{'⭐' * int(cal)} ({cal}/5)" if cal > 0 else "",
+        card="",
+        sim=float(sim),
+    )
+    entry["card"] = render_provider_card(entry)
+    return entry
+
+
+def provider_detail(entry: ProviderEntry) -> Dict[str, Any]:
+    """``response_metadata.provider_detail`` de _get_provider_detail."""
+    return {
+        "proveedor_id": entry["proveedor_id"],
+        "nombre": entry["nombre"],
+        "descripcion": entry["descripcion"],
+        "ejecutivo_ventas": entry["ejecutivo_ventas"],
+        "whatsapp_ventas": list(entry["whatsapp_ventas"]),
+        "whatsapp_links": list(entry["whatsapp_links"]),
+        "pagina_web": entry["pagina_web"],
+        "nivel_membresia": entry["nivel_membresia"],
+        "calificacion": entry["calificacion"],
+    }
+
+
+class ProviderDirectory(CatalogSnapshot):
+    """Proveedores precalculados por id, con resolución exacta y difusa del nombre."""
+
+    _thread_name = "provider-directory-build"
+
+    def __init__(self, engine=None, refresh_seconds: float = 30, enabled: bool = True, threshold: float = 0.3):
+        super().__init__(engine=engine, refresh_seconds=refresh_seconds)
+        self.enabled = enabled
+        self.threshold = threshold
+        # (versión, entradas por id, clave normalizada → ids, claves, trigramas de claves)
+        self._state: Optional[
+            Tuple[int, Dict[int, ProviderEntry], Dict[str, List[int]], List[str], TrigramIndex]
+        ] = None
+        self._counters.update(exact_hits=0, fuzzy_hits=0, misses=0)
+
+    def attach(self, engine) -> None:
+        """Asocia el engine (la primera vez) y lanza la carga inicial."""
+        if not self.enabled or self._engine is not None:
+            return
+        self._engine = engine
+        self.refresh()
+
+    # ── Construcción ────────────────────────────────────────────────
+    def load(self, version: int, rows: List[Any]) -> None:
+        """Construye el directorio desde filas de ``proveedores``."""
+        entries: Dict[int, ProviderEntry] = {}
+        by_key: Dict[str, List[int]] = {}
+        for row in rows:
+            entry = provider_entry_from_row(row)
+            entries[entry["proveedor_id"]] = entry
+            by_key.setdefault(normalize_provider_name(entry["nombre"]), []).append(entry["proveedor_id"])
+        keys = list(by_key)
+        # El índice apunta a la posición de la clave; la clave da los ids
+        fuzzy = TrigramIndex(keys, range(len(keys)))
+        self._state = (int(version), entries, by_key, keys, fuzzy)
+        logger.info(f"📇 Directorio de proveedores v{version}: {len(entries)} proveedores")
+
+    def _load_snapshot(self, engine, version: int) -> None:
+        with engine.connect() as conn:
+            rows = conn.execute(text(f"SELECT {PROVIDER_COLUMNS} FROM proveedores pr")).fetchall()
+        self.load(version, rows)
+
+    # ── Consultas ───────────────────────────────────────────────────
+    def ready(self) -> bool:
+        return self.enabled and self.is_current()
+
+    def resolve(self, nombre: str) -> Optional[List[ProviderEntry]]:
+        """
+        Proveedores para un nombre escrito por el usuario, del más parecido
+        al menos parecido (``sim`` ya calculado en cada entrada).
+
+        Lista vacía si no hay ninguno; None si el directorio no está
+        disponible (consultar la base de datos).
+        """
+        if not self.enabled:
+            return None
+        state = self._current_state()
+        if state is None:
+            return None
+        _, entries, by_key, keys, fuzzy = state
+
+        key = normalize_provider_name(nombre)
+        exact = by_key.get(key)
+        if exact:
+            self._counters["exact_hits"] += 1
+            return [ProviderEntry(entries[i], sim=1.0) for i in exact]
+
+        positions, sims = fuzzy.search(key, self.threshold)
+        if not len(positions):
+            self._counters["misses"] += 1
+            return []
+        self._counters["fuzzy_hits"] += 1
+        return [
+            ProviderEntry(entries[i], sim=float(s))
+            for p, s in zip(positions.tolist(), sims.tolist())
+            for i in by_key[keys[p]]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.snapshot_stats()
+        c["enabled"] = self.enabled
+        c["proveedores"] = len(self._state[1]) if self._state else 0
+        return c
+
+
+# Singleton (el engine lo aporta QueryNode con attach)
+provider_directory = ProviderDirectory(
+    refresh_seconds=settings.PROVIDER_DIRECTORY_REFRESH_SECONDS,
+    enabled=settings.PROVIDER_DIRECTORY_ENABLED,
+    threshold=settings.TRGM_SIMILARITY_THRESHOLD,
+)
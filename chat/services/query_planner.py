@@ -0,0 +1,164 @@
+"""
+Planificador determinista de consultas - evita Text-to-SQL en los casos comunes.
+
+Mapea las entidades extraídas (producto, marca, precio_min/max, busca_precio,
+atributos de proveedor) sobre plantillas SQL parametrizadas y revisadas
+(la búsqueda híbrida de QueryNode + fragmentos de filtro en lista blanca).
+Solo si la forma de la consulta no es expresable se devuelve None y el
+llamador recurre al LLM (SQL_MODEL).
+"""
+import logging
+import re
+import threading
+from enum import Enum
+from typing import Any, Dict, List, Optional, TypedDict
+
+from utils.spanish_normalizer import fold_accents
+
+logger = logging.getLogger(__name__)
+
+
+class QueryPath(str, Enum):
+    """Camino elegido para resolver una búsqueda."""
+    TEMPLATE = "template"   # Plantilla SQL determinista (sin LLM)
+    LLM_SQL = "llm_sql"     # Text-to-SQL con SQL_MODEL
+
+
+# Fragmentos pre-validados que la plantilla híbrida puede añadir al WHERE.
+PROVIDER_FILTER_SQL: Dict[str, str] = {
+    "entregas_domicilio": "AND pr.entregas_domicilio IS TRUE",
+    "ofrece_credito": "AND pr.ofrece_credito IS TRUE",
+}
+
+# Ordenaciones permitidas para la plantilla híbrida.
+ORDER_BY_SQL: Dict[str, str] = {
+    "score": "score DESC",
+    "precio": "precio_unidad ASC, score DESC",
+}
+
+# Entidades que la plantilla sabe expresar.
+_SUPPORTED_ENTITIES = {
+    "producto", "marca", "precio_max", "precio_min", "busca_precio",
+    *PROVIDER_FILTER_SQL.keys(),
+}
+
+# Señales en el texto del usuario (sin acentos, minúsculas).
+_ATTR_PATTERNS = {
+    "entregas_domicilio": re.compile(r"\b(a domicilio|entregas?|envios?|reparto)\b"),
+    "ofrece_credito": re.compile(r"\bcredito\b"),
+}
+_CHEAPEST = re.compile(r"\b(mas barat[oa]s?|mas economic[oa]s?|menor precio|mejor precio)\b")
+# Formas que la plantilla NO cubre → Text-to-SQL
+_UNSUPPORTED = re.compile(
+    r"\b(categoria|vigencia|iva|monto minimo|mas car[oa]s?|cuant[oa]s|promedio|"
+    r"compara\w*|razon social|membresia)\b"
+)
+
+
+class QueryPlan(TypedDict):
+    """Plan ejecutable por QueryNode._execute_plan."""
+    template: str                 # "hybrid" | "hybrid_by_price"
+    search_query: str
+    marca: Optional[str]
+    precio_max: Optional[float]
+    precio_min: Optional[float]
+    provider_filters: List[str]   # claves de PROVIDER_FILTER_SQL
+    order_by: str                 # clave de ORDER_BY_SQL
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class QueryPlanner:
+    """
+    Planificador de búsquedas basado en plantillas.
+
+    Lleva contadores por camino (template / llm_sql) para medir la tasa
+    de aciertos del planificador.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {path.value: 0 for path in QueryPath}
+
+    def plan(
+        self,
+        entities: Dict[str, Any],
+        user_query: Optional[str] = None,
+    ) -> Optional[QueryPlan]:
+        """
+        Construye un plan determinista o None si la forma no es expresable.
+
+        Args:
+            entities: Entidades extraídas (producto, marca, precio, ...)
+            user_query: Mensaje original del usuario (opcional) para detectar
+                        atributos de proveedor u órdenes no soportadas.
+        """
+        producto = (entities.get("producto") or "").strip()
+        if not producto:
+            return None
+
+        present = {k for k, v in entities.items() if v not in (None, "", False)}
+        unknown = present - _SUPPORTED_ENTITIES
+        if unknown:
+            logger.info(f"🧭 Planner: entidades no soportadas {sorted(unknown)} → LLM")
+            return None
+
+        precio_max = _to_float(entities.get("precio_max"))
+        precio_min = _to_float(entities.get("precio_min"))
+        if ("precio_max" in present and precio_max is None) or (
+            "precio_min" in present and precio_min is None
+        ):
+            return None
+
+        provider_filters = [k for k in PROVIDER_FILTER_SQL if k in present]
+        by_price = bool(entities.get("busca_precio"))
+
+        if user_query:
+            folded = fold_accents(user_query)
+            if _UNSUPPORTED.search(folded):
+                logger.info("🧭 Planner: forma no soportada en el mensaje → LLM")
+                return None
+            for attr, pattern in _ATTR_PATTERNS.items():
+                if attr not in provider_filters and pattern.search(folded):
+                    provider_filters.append(attr)
+            by_price = by_price or bool(_CHEAPEST.search(folded))
+
+        plan = QueryPlan(
+            template="hybrid_by_price" if by_price else "hybrid",
+            search_query=producto,
+            marca=entities.get("marca") or None,
+            precio_max=precio_max,
+            precio_min=precio_min,
+            provider_filters=provider_filters,
+            order_by="precio" if by_price else "score",
+        )
+        logger.info(
+            f"🧭 Planner: template={plan['template']} marca={plan['marca']} "
+            f"precio=[{precio_min}, {precio_max}] provider_filters={provider_filters}"
+        )
+        return plan
+
+    def record(self, path: QueryPath) -> None:
+        """Registra el camino usado en una búsqueda."""
+        with self._lock:
+            self._counters[path.value] += 1
+        logger.info(f"🧭 Query path: {path.value}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores por camino y tasa de aciertos del planificador."""
+        with self._lock:
+            c = dict(self._counters)
+        total = sum(c.values())
+        c["template_hit_rate"] = round(c[QueryPath.TEMPLATE.value] / total, 4) if total else 0.0
+        return c
+
+
+# Singleton
+query_planner = QueryPlanner()
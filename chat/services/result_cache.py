@@ -0,0 +1,229 @@
+"""
+Caché de resultados de búsqueda - Single Responsibility.
+
+La ingesta diaria es el único escritor del catálogo, así que entre dos
+ingestas la misma búsqueda (producto + marca + filtros de precio + top_k)
+devuelve siempre las mismas filas. Se guardan las filas de
+``_execute_hybrid_search`` y ``_execute_price_search`` en una LRU acotada
+por bytes (estimados) y con TTL.
+
+Invalidación: cada entrada pertenece a una versión del catálogo
+(utils/catalog_version.py). La versión se sondea cada ``poll_seconds`` y,
+opcionalmente, llega al instante por LISTEN/NOTIFY; al cambiar se vacía
+la caché entera.
+
+Métricas: hit ratio y milisegundos ahorrados (suma del tiempo que costó
+calcular cada entrada servida desde la caché).
+"""
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from chat.config.settings import settings
+from utils.spanish_normalizer import NORMALIZED_SEARCH, normalize_text
+
+logger = logging.getLogger(__name__)
+
+_ROW_OVERHEAD = 64  # bytes aproximados por fila (tupla + referencias)
+
+
+def _normalize_query(value: Any) -> str:
+    # Con SEARCH_NORMALIZATION la pierna trigram compara el texto
+    # normalizado: "Aceítes 1LT" y "aceite 1 litro" son la misma búsqueda
+    # (el embedding de la primera que se calcule sirve para ambas).
+    if NORMALIZED_SEARCH:
+        return normalize_text(value)
+    # pg_trgm ya ignora mayúsculas y espacios, y la caché de embeddings
+    # también; sin NFC porque pg_trgm sí distingue formas NFC/NFD.
+    return " ".join(str(value).split()).lower()
+
+
+def _normalize_filter(value: Any) -> str:
+    # Filtros de igualdad (LOWER(p.marca) = LOWER(:marca)): solo minúsculas
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).lower()
+
+
+def _estimate_bytes(rows: List[Any]) -> int:
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += _ROW_OVERHEAD + sum(sys.getsizeof(v) for v in row)
+    return size
+
+
+class SearchResultCache:
+    """LRU de filas de búsqueda por (tipo, consulta normalizada, filtros, top_k)."""
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        enabled: bool = True,
+        poll_seconds: float = 30,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.poll_seconds = poll_seconds
+        # key → (stored_at, bytes, compute_ms, rows)
+        self._data: "OrderedDict[str, Tuple[float, int, float, List[Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._version: Optional[int] = None
+        self._version_source: Optional[Callable[[], int]] = None
+        self._last_poll: Optional[float] = None
+        self._listener: Optional[threading.Thread] = None
+        self._counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                          "expirations": 0, "invalidations": 0}
+        self._saved_ms = 0.0
+
+    # ── Claves ──────────────────────────────────────────────────────
+    @staticmethod
+    def make_key(kind: str, query: str, **filters: Any) -> str:
+        """Clave estable: filtros en orden alfabético, None omitidos."""
+        parts = [kind, _normalize_query(query)]
+        for name in sorted(filters):
+            value = filters[name]
+            if value is None or value == [] or value == "":
+                continue
+            if isinstance(value, (list, tuple, set)):
+                value = ",".join(sorted(_normalize_filter(v) for v in value))
+            else:
+                value = _normalize_filter(value)
+            parts.append(f"{name}={value}")
+        return "|".join(parts)
+
+    # ── Versión del catálogo ────────────────────────────────────────
+    def set_version_source(self, source: Callable[[], int]) -> None:
+        """Función que devuelve la versión actual del catálogo (sondeo)."""
+        self._version_source = source
+
+    def start_listener(self, database_url: str) -> None:
+        """LISTEN/NOTIFY para invalidar sin esperar al siguiente sondeo (idempotente)."""
+        if self._listener is None and database_url:
+            from utils.catalog_version import listen_catalog_version
+
+            self._listener = listen_catalog_version(database_url, self.on_catalog_version)
+
+    def on_catalog_version(self, version: int) -> None:
+        """Registra la versión vigente; si cambió, vacía la caché."""
+        with self._lock:
+            if self._version is not None and version != self._version and self._data:
+                self._data.clear()
+                self._bytes = 0
+                self._counters["invalidations"] += 1
+                logger.info(f"🗑️  Result cache invalidada: catálogo v{self._version} → v{version}")
+            self._version = version
+
+    def _poll_version(self) -> None:
+        if self._version_source is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._last_poll is not None and now - self._last_poll < self.poll_seconds:
+                return
+            self._last_poll = now
+        try:
+            self.on_catalog_version(self._version_source())
+        except Exception as e:
+            logger.warning(f"⚠️  No se pudo leer catalog_version: {e}")
+
+    # ── API pública ─────────────────────────────────────────────────
+    def get(self, key: str) -> Optional[List[Any]]:
+        """Copia de las filas cacheadas, o None."""
+        if not self.enabled:
+            return None
+        self._poll_version()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry[0] > self.ttl_seconds:
+                self._drop(key)
+                self._counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._counters["hits"] += 1
+            self._saved_ms += entry[2]
+            return list(entry[3])
+
+    def put(
+        self,
+        key: str,
+        rows: List[Any],
+        compute_ms: float = 0.0,
+        version: Optional[int] = None,
+    ) -> None:
+        """
+        Guarda las filas (las listas vacías también: "no hay resultados" es
+        un resultado). Con ``version``, descarta el resultado si el catálogo
+        cambió mientras se calculaba.
+        """
+        if not self.enabled:
+            return
+        rows = list(rows)
+        size = _estimate_bytes(rows)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if version is not None and version != self._version:
+                return
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic(), size, compute_ms, rows)
+            self._bytes += size
+            self._counters["stores"] += 1
+            while self._bytes > self.max_bytes and self._data:
+                self._drop(next(iter(self._data)))
+                self._counters["evictions"] += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], List[Any]]) -> List[Any]:
+        """Filas cacheadas o ``compute()`` (que se cachea con su duración)."""
+        rows = self.get(key)
+        if rows is not None:
+            logger.info(f"♻️  Result cache hit: {key}")
+            return rows
+        version = self._version
+        t0 = time.perf_counter()
+        rows = compute()
+        self.put(key, rows, (time.perf_counter() - t0) * 1000, version=version)
+        return rows
+
+    def _drop(self, key: str) -> None:
+        _, size, _, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            c.update(
+                entries=len(self._data),
+                bytes=self._bytes,
+                saved_ms=round(self._saved_ms, 1),
+                catalog_version=self._version,
+            )
+        lookups = c["hits"] + c["misses"]
+        c["hit_ratio"] = round(c["hits"] / lookups, 4) if lookups else 0.0
+        c["enabled"] = self.enabled
+        c["max_bytes"] = self.max_bytes
+        c["listening"] = self._listener is not None
+        return c
+
+
+# Singleton
+search_result_cache = SearchResultCache(
+    max_bytes=int(settings.RESULT_CACHE_MAX_MB * 1024 * 1024),
+    ttl_seconds=settings.RESULT_CACHE_TTL,
+    enabled=settings.RESULT_CACHE_ENABLED,
+    poll_seconds=settings.CATALOG_VERSION_POLL_SECONDS,
+)
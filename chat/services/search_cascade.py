@@ -0,0 +1,87 @@
+"""
+Cascada de búsqueda con salida temprana - Single Responsibility.
+
+Las búsquedas híbrida y por precio pedían siempre el embedding a OpenAI
+antes de ir a la base de datos, aunque el usuario hubiera escrito el
+nombre exacto de un producto o una marca del catálogo. QueryNode prueba
+antes dos etapas léxicas baratas y solo si ninguna alcanza su umbral
+calcula el embedding y ejecuta la pierna vectorial:
+
+1. EXACT:   ``nombre_norm`` igual a la consulta o que empieza por ella
+            (palabras completas), o ``marca_norm`` igual (índices btree).
+2. TRIGRAM: solo la pierna trigram, con un umbral de similitud alto
+            (índice GIN o índice trigram local).
+3. HYBRID:  embedding + trigram + vector (la búsqueda completa).
+
+Una etapa léxica responde si devuelve al menos ``min_rows`` filas (o
+top_k, si es menor) con similitud ≥ su umbral. En sus filas ``vec_sim`` es
+0 y ``score`` es la similitud trigram.
+
+Registra qué etapa respondió cada búsqueda (por tipo: hybrid / price).
+"""
+import logging
+import threading
+from enum import Enum
+from typing import Any, Dict, List
+
+from chat.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeStage(str, Enum):
+    """Etapa de la cascada que respondió una búsqueda."""
+    EXACT = "exact"       # Nombre / marca normalizados (btree)
+    TRIGRAM = "trigram"   # Solo trigramas, umbral alto
+    HYBRID = "hybrid"     # Embedding + pierna vectorial
+
+
+class SearchCascade:
+    """Umbrales por etapa y contadores de la etapa que respondió."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        min_rows: int = 3,
+        exact_min_score: float = 0.6,
+        trigram_min_score: float = 0.7,
+    ):
+        self.enabled = enabled
+        self.min_rows = min_rows
+        self.min_score = {
+            CascadeStage.EXACT: exact_min_score,
+            CascadeStage.TRIGRAM: trigram_min_score,
+        }
+        self._lock = threading.Lock()
+        self._answered: Dict[str, Dict[str, int]] = {}
+
+    def accepts(self, rows: List[Any], top_k: int) -> bool:
+        """¿Las filas de una etapa léxica bastan para responder?"""
+        return len(rows) >= min(self.min_rows, top_k)
+
+    def record(self, kind: str, stage: CascadeStage) -> None:
+        with self._lock:
+            per_kind = self._answered.setdefault(kind, {s.value: 0 for s in CascadeStage})
+            per_kind[stage.value] += 1
+        logger.info(f"🪜 Cascada {kind}: respondió la etapa {stage.value}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Búsquedas respondidas por etapa y embeddings evitados."""
+        with self._lock:
+            answered = {k: dict(v) for k, v in self._answered.items()}
+        total = sum(sum(v.values()) for v in answered.values())
+        lexical = sum(v[CascadeStage.EXACT.value] + v[CascadeStage.TRIGRAM.value] for v in answered.values())
+        return {
+            "enabled": self.enabled,
+            "answered": answered,
+            "embeddings_avoided": lexical,
+            "lexical_rate": round(lexical / total, 4) if total else 0.0,
+        }
+
+
+search_cascade = SearchCascade(
+    enabled=settings.SEARCH_CASCADE_ENABLED,
+    min_rows=settings.CASCADE_MIN_ROWS,
+    exact_min_score=settings.CASCADE_EXACT_MIN_SCORE,
+    trigram_min_score=settings.CASCADE_TRIGRAM_MIN_SCORE,
+)
@@ -0,0 +1,105 @@
+"""
+Cursor de búsqueda por sesión - Single Responsibility.
+
+``buscar_productos`` guarda en el estado del agente los proveedores ya
+rankeados (y los productos que encontró de cada uno). "Mostrar más" pide
+a la BD solo las filas de la siguiente página por id: sin embedding, sin
+similitudes y sin volver a fusionar la búsqueda.
+
+El cursor caduca a los ``SEARCH_CURSOR_TTL`` segundos; si caducó o es de
+otro producto, el llamador vuelve a buscar.
+
+También guarda el nombre normalizado de cada proveedor: ``provider_id_for``
+resuelve el nombre que escribe el usuario ("info de La Ranita") al id de
+un proveedor de la búsqueda sin consultar la BD.
+"""
+import time
+from typing import List, Optional, Tuple
+
+from chat.graph.state import SearchCursor
+from chat.models.types import ProductoInfo, ProveedorInfo
+from chat.services.provider_directory import normalize_provider_name
+from utils.spanish_normalizer import fold_text
+
+_MAX_PRODUCTS_PER_PROVIDER = 10
+
+
+def build_search_cursor(
+    producto: str,
+    marca: Optional[str],
+    proveedores: List[ProveedorInfo],
+    productos: List[ProductoInfo],
+    shown: int,
+) -> SearchCursor:
+    """Cursor con el ranking de ``proveedores_con_precios`` y ``shown`` ya mostrados."""
+    by_provider = {}
+    for p in productos:
+        ids = by_provider.setdefault(p["proveedor_id"], [])
+        if len(ids) < _MAX_PRODUCTS_PER_PROVIDER:
+            ids.append(p["id"])
+    provider_ids = [prov["proveedor_id"] for prov in proveedores]
+    return SearchCursor(
+        producto=producto,
+        marca=marca,
+        provider_ids=provider_ids,
+        product_ids=[by_provider.get(pid, []) for pid in provider_ids],
+        provider_names=[normalize_provider_name(prov.get("proveedor")) for prov in proveedores],
+        offset=shown,
+        created_at=time.time(),
+    )
+
+
+def next_page(
+    cursor: Optional[SearchCursor],
+    producto: str,
+    page_size: int,
+    ttl_seconds: float,
+    now: Optional[float] = None,
+) -> Optional[Tuple[List[int], List[int], SearchCursor]]:
+    """
+    Siguiente página del cursor: (provider_ids, product_ids, cursor avanzado).
+
+    None si no hay cursor, caducó o es de otro producto (→ buscar de nuevo).
+    Una página vacía significa que ya se mostraron todos.
+    """
+    if not cursor or not cursor.get("provider_ids"):
+        return None
+    now = time.time() if now is None else now
+    if ttl_seconds and now - cursor.get("created_at", 0) > ttl_seconds:
+        return None
+    # El agente puede abreviar el producto ("aceite" por "aceite de oliva")
+    asked, stored = fold_text(producto), fold_text(cursor.get("producto"))
+    if asked and asked not in stored and stored not in asked:
+        return None
+
+    start = cursor.get("offset", 0)
+    end = start + page_size
+    provider_ids = cursor["provider_ids"][start:end]
+    product_ids = [pid for ids in cursor["product_ids"][start:end] for pid in ids]
+    advanced = SearchCursor(**{**cursor, "offset": min(end, len(cursor["provider_ids"]))})
+    return provider_ids, product_ids, advanced
+
+
+def remaining(cursor: SearchCursor) -> int:
+    """Proveedores que quedan por mostrar."""
+    return max(0, len(cursor.get("provider_ids", [])) - cursor.get("offset", 0))
+
+
+def provider_id_for(cursor: Optional[SearchCursor], nombre: str) -> Optional[int]:
+    """
+    Id del proveedor de la búsqueda que corresponde a ``nombre``: mismo
+    nombre normalizado, o el único cuyo nombre contiene todas sus palabras
+    ("la ranita" → "Distribuidora La Ranita"). None si no hay o es ambiguo.
+    """
+    if not cursor or not cursor.get("provider_names"):
+        return None
+    key = normalize_provider_name(nombre)
+    if not key:
+        return None
+    pairs = list(zip(cursor["provider_names"], cursor["provider_ids"]))
+    for name, pid in pairs:
+        if name == key:
+            return pid
+    words = set(key.split())
+    matches = {pid for name, pid in pairs if words <= set(name.split())}
+    return matches.pop() if len(matches) == 1 else None
@@ -0,0 +1,216 @@
+"""
+Ejecución especulativa de estrategias de búsqueda - Single Responsibility.
+
+Lanza varias estrategias (p.ej. Text-to-SQL y búsqueda híbrida) en paralelo
+y devuelve el primer conjunto de resultados que pasa el filtro de relevancia.
+La estrategia preferida (LLM-SQL) gana si llega dentro de la ventana de
+gracia. Los perdedores se cancelan si aún no empezaron; si ya corren, su
+resultado se ignora.
+
+Registra victorias y latencias por estrategia (p50/p95) para ajustar la
+ventana de gracia contra la latencia p95 del turno.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, TypedDict
+
+from chat.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_WINDOW = 500  # muestras por estrategia
+
+
+class RaceResult(TypedDict):
+    """Resultado de una carrera."""
+    winner: Optional[str]            # Estrategia ganadora (None si ninguna pasó)
+    rows: List[Any]                  # Filas aceptadas de la ganadora
+    raw: Dict[str, List[Any]]        # Filas sin filtrar de las que terminaron a tiempo
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[idx], 1)
+
+
+class SearchRacer:
+    """Ejecutor que hace competir estrategias de búsqueda."""
+
+    def __init__(
+        self,
+        prefer: Optional[str] = None,
+        grace_seconds: float = 0.0,
+        max_workers: int = 8,
+        enabled: bool = True,
+    ):
+        self.prefer = prefer
+        self.grace_seconds = grace_seconds
+        self.enabled = enabled
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search-race")
+        self._lock = threading.Lock()
+        self._wins: Dict[str, int] = {}
+        self._errors: Dict[str, int] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._races = 0
+        self._no_winner = 0
+
+    # ── Métricas ────────────────────────────────────────────────────
+    def _record_latency(self, name: str, ms: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=_LATENCY_WINDOW)).append(ms)
+
+    def _record_error(self, name: str) -> None:
+        with self._lock:
+            self._errors[name] = self._errors.get(name, 0) + 1
+
+    def _record_outcome(self, winner: Optional[str]) -> None:
+        with self._lock:
+            self._races += 1
+            if winner is None:
+                self._no_winner += 1
+            else:
+                self._wins[winner] = self._wins.get(winner, 0) + 1
+
+    def _timed(self, name: str, fn: Callable[[], List[Any]]) -> List[Any]:
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        except Exception:
+            self._record_error(name)
+            raise
+        finally:
+            self._record_latency(name, (time.perf_counter() - t0) * 1000)
+
+    # ── Carrera ─────────────────────────────────────────────────────
+    def race(
+        self,
+        strategies: Dict[str, Callable[[], List[Any]]],
+        accept: Callable[[List[Any]], List[Any]],
+    ) -> RaceResult:
+        """
+        Ejecuta las estrategias y devuelve la primera aceptada.
+
+        Args:
+            strategies: nombre → función sin argumentos que devuelve filas.
+            accept: filtro de relevancia; devuelve las filas que pasan.
+        """
+        if not self.enabled:
+            return self._run_sequential(strategies, accept)
+
+        start = time.perf_counter()
+        futures = {
+            self._executor.submit(self._timed, name, fn): name
+            for name, fn in strategies.items()
+        }
+        pending = set(futures)
+        accepted: Dict[str, List[Any]] = {}
+        raw: Dict[str, List[Any]] = {}
+        deadline: Optional[float] = None
+        winner: Optional[str] = None
+
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break  # ventana de gracia agotada
+            for fut in done:
+                name = futures[fut]
+                try:
+                    rows = fut.result() or []
+                except Exception as e:
+                    logger.warning(f"⚠️  Estrategia '{name}' falló: {e}")
+                    continue
+                raw[name] = rows
+                ok = accept(rows)
+                if ok:
+                    accepted[name] = ok
+
+            if self.prefer in accepted:
+                winner = self.prefer
+                break
+            if accepted:
+                prefer_pending = any(futures[f] == self.prefer for f in pending)
+                if not prefer_pending:
+                    break
+                if deadline is None:
+                    deadline = start + self.grace_seconds
+                if time.perf_counter() >= deadline:
+                    break
+
+        if winner is None and accepted:
+            winner = next(iter(accepted))  # la primera en llegar
+
+        losers = [futures[f] for f in pending]
+        for fut in pending:
+            fut.cancel()  # si ya está corriendo, el resultado se ignora
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record_outcome(winner)
+        logger.info(
+            f"🏁 Search race: winner={winner} in {elapsed_ms:.0f}ms"
+            + (f" (ignored: {', '.join(losers)})" if losers else "")
+        )
+        return RaceResult(winner=winner, rows=accepted.get(winner, []), raw=raw)
+
+    def _run_sequential(
+        self,
+        strategies: Dict[str, Callable[[], List[Any]]],
+        accept: Callable[[List[Any]], List[Any]],
+    ) -> RaceResult:
+        """Modo sin paralelismo (kill switch): preferida primero, luego el resto."""
+        order = sorted(strategies, key=lambda n: n != self.prefer)
+        raw: Dict[str, List[Any]] = {}
+        for name in order:
+            try:
+                rows = self._timed(name, strategies[name]) or []
+            except Exception as e:
+                logger.warning(f"⚠️  Estrategia '{name}' falló: {e}")
+                continue
+            raw[name] = rows
+            ok = accept(rows)
+            if ok:
+                self._record_outcome(name)
+                return RaceResult(winner=name, rows=ok, raw=raw)
+        self._record_outcome(None)
+        return RaceResult(winner=None, rows=[], raw=raw)
+
+    def stats(self) -> Dict[str, Any]:
+        """Victorias, errores y latencias (ms) por estrategia."""
+        with self._lock:
+            latencies = {n: list(d) for n, d in self._latencies.items()}
+            races = self._races
+            wins = dict(self._wins)
+            errors = dict(self._errors)
+            no_winner = self._no_winner
+        per_strategy = {}
+        for name in sorted(set(latencies) | set(wins)):
+            samples = latencies.get(name, [])
+            per_strategy[name] = {
+                "wins": wins.get(name, 0),
+                "win_rate": round(wins.get(name, 0) / races, 4) if races else 0.0,
+                "errors": errors.get(name, 0),
+                "p50_ms": _percentile(samples, 50),
+                "p95_ms": _percentile(samples, 95),
+            }
+        return {
+            "enabled": self.enabled,
+            "races": races,
+            "no_winner": no_winner,
+            "grace_seconds": self.grace_seconds,
+            "strategies": per_strategy,
+        }
+
+
+# Singleton
+search_racer = SearchRacer(
+    prefer="llm_sql",
+    grace_seconds=settings.SEARCH_RACE_GRACE_SECONDS,
+    max_workers=settings.SEARCH_RACE_WORKERS,
+    enabled=settings.SEARCH_RACE_ENABLED,
+)
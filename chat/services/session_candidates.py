@@ -0,0 +1,147 @@
+"""
+Conjunto candidato por sesión - Single Responsibility.
+
+Una conversación típica es "busco X" → "marca Y" → "precios" → "más
+proveedores", y cada herramienta volvía a calcular el embedding del
+producto y a buscar en todo el catálogo. ``buscar_productos`` guarda aquí,
+por ``session_id``, las filas rankeadas de la primera búsqueda (hasta
+SESSION_CANDIDATES_TOP_K, ya con umbral de relevancia y tope por
+proveedor). Los turnos siguientes del mismo producto trabajan en memoria:
+
+- marca:      ``filter_by_brand`` sobre las filas guardadas;
+- mostrar más: ``rows_by_ids`` sirve la página del cursor sin ir a la BD.
+
+Los precios no salen de aquí: esas filas están recortadas por relevancia y
+por proveedor, así que el producto más barato puede faltar.
+``filtrar_por_precio`` usa la búsqueda por precio (sin tope, con su propia
+caché y prefetch).
+
+Mismo producto = mismas palabras normalizadas ("Aceites de Oliva" reutiliza
+"aceite de oliva"). Una consulta más amplia ("queso" tras "queso panela")
+no reutiliza nada: las filas guardadas solo cubren la búsqueda original.
+Si cambia el producto, caduca (SEARCH_CURSOR_TTL) o el proceso no tiene la
+sesión, se busca en la BD como siempre.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, TypedDict
+
+from chat.config.settings import settings
+from utils.spanish_normalizer import fold_text, tokens
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCandidates(TypedDict):
+    """Filas de la última búsqueda de producto de una sesión."""
+    producto: str
+    concept: List[str]        # tokens normalizados del producto
+    rows: List[Any]           # filas híbridas, mejor score primero
+    created_at: float
+
+
+def filter_by_brand(rows: List[Any], marca: str) -> List[Any]:
+    """Filas de ``marca`` (sin acentos ni mayúsculas), en el mismo orden."""
+    wanted = fold_text(marca)
+    return [r for r in rows if fold_text(r.marca) == wanted]
+
+
+class SessionCandidateStore:
+    """LRU de conjuntos candidatos por session_id, con TTL."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_sessions: int = 1000,
+        ttl_seconds: float = 1800,
+    ):
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, SessionCandidates]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"stores": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+    def put(self, session_id: Optional[str], producto: str, rows: List[Any]) -> None:
+        """Guarda (o reemplaza) el conjunto candidato de la sesión."""
+        if not self.enabled or not session_id or not rows:
+            return
+        entry = SessionCandidates(
+            producto=producto,
+            concept=tokens(producto),
+            rows=list(rows),
+            created_at=time.time(),
+        )
+        with self._lock:
+            self._data.pop(session_id, None)
+            self._data[session_id] = entry
+            self._counters["stores"] += 1
+            while len(self._data) > self.max_sessions:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+        logger.info(f"🧺 Session candidates: {len(rows)} rows for '{producto}'")
+
+    def _entry(self, session_id: Optional[str], now: Optional[float] = None) -> Optional[SessionCandidates]:
+        if not self.enabled or not session_id:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._data.get(session_id)
+            if entry is not None and self.ttl_seconds and now - entry["created_at"] > self.ttl_seconds:
+                del self._data[session_id]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(session_id)
+            return entry
+
+    def get(
+        self, session_id: Optional[str], producto: str, now: Optional[float] = None
+    ) -> Optional[List[Any]]:
+        """Filas guardadas si ``producto`` es el mismo concepto, o None (→ BD)."""
+        entry = self._entry(session_id, now)
+        asked = set(tokens(producto))
+        hit = entry is not None and bool(asked) and asked == set(entry["concept"])
+        with self._lock:
+            self._counters["hits" if hit else "misses"] += 1
+        if not hit:
+            return None
+        logger.info(f"🧺 Session candidates hit: '{producto}' ({len(entry['rows'])} rows, no search)")
+        return list(entry["rows"])
+
+    def rows_by_ids(self, session_id: Optional[str], ids: List[int]) -> Optional[List[Any]]:
+        """Filas guardadas con esos ids, en ese orden; None si falta alguna."""
+        entry = self._entry(session_id)
+        if entry is None:
+            return None
+        by_id: Dict[int, Any] = {r.id: r for r in entry["rows"]}
+        if any(i not in by_id for i in ids):
+            return None
+        with self._lock:
+            self._counters["hits"] += 1
+        return [by_id[i] for i in ids]
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id is None:
+                self._data.clear()
+            else:
+                self._data.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self._counters)
+            c["sessions"] = len(self._data)
+        lookups = c["hits"] + c["misses"]
+        c["hit_ratio"] = round(c["hits"] / lookups, 4) if lookups else 0.0
+        c["enabled"] = self.enabled
+        return c
+
+
+# Singleton
+session_candidates = SessionCandidateStore(
+    enabled=settings.SESSION_CANDIDATES_ENABLED,
+    max_sessions=settings.SESSION_CANDIDATES_MAX_SESSIONS,
+    ttl_seconds=settings.SEARCH_CURSOR_TTL,
+)
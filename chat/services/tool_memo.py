@@ -0,0 +1,150 @@
+"""
+Memoización de llamadas a herramientas repetidas - Single Responsibility.
+
+El bucle agente → herramientas → agente repite a menudo la misma llamada
+(``buscar_productos`` con los mismos argumentos tras una aclaración, o
+``detalle_proveedor`` otra vez), y cada repetición volvía a pagar
+embeddings, SQL y llamadas a sub-LLMs.
+
+``ToolCallMemo.wrap`` se engancha a ``ToolNode(wrap_tool_call=...)`` y
+guarda el resultado por (session_id, herramienta, argumentos normalizados)
+durante TOOL_MEMO_TTL_SECONDS. Una repetición devuelve al instante el mismo
+contenido (y artifact) con el tool_call_id nuevo; si la herramienta devolvió
+un Command, también se reaplica el resto de su update (p.ej. el search_cursor).
+
+Solo se memoizan las herramientas de ``MEMOIZED_TOOLS``: las de efectos
+secundarios (``reportar_producto_no_encontrado`` envía un correo) o que
+dependen del estado de la conversación (``mostrar_mas_proveedores`` avanza
+el cursor) se ejecutan siempre. Los errores no se guardan.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.messages import ToolMessage
+from langgraph.types import Command
+
+from chat.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+MEMOIZED_TOOLS = frozenset({
+    "buscar_productos",
+    "filtrar_por_precio",
+    "detalle_proveedor",
+    "consultar_especialista",
+})
+
+_Key = Tuple[str, str, str]
+
+
+def _normalize_arg(value: Any) -> Any:
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def normalize_args(args: Dict[str, Any]) -> str:
+    """Argumentos como JSON estable: claves ordenadas, None omitidos, texto en minúsculas."""
+    clean = {k: _normalize_arg(v) for k, v in (args or {}).items() if v is not None and v != ""}
+    return json.dumps(clean, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class ToolCallMemo:
+    """Resultados de herramientas por sesión, con TTL."""
+
+    def __init__(self, enabled: bool = True, ttl_seconds: float = 600, max_entries: int = 5000):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key → (guardado_en, contenido, artifact, resto del update del Command o None)
+        self._data: "OrderedDict[_Key, Tuple[float, Any, Any, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool: str, name: str) -> None:
+        with self._lock:
+            per_tool = self._counters.setdefault(tool, {"hits": 0, "misses": 0})
+            per_tool[name] += 1
+
+    def _get(self, key: _Key) -> Optional[Tuple[float, Any, Any, Optional[Dict[str, Any]]]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+            return entry
+
+    def _put(self, key: _Key, message: ToolMessage, update: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.monotonic(), message.content, message.artifact, update)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def wrap(self, request: Any, execute: Callable[[Any], Any]) -> Any:
+        """``wrap_tool_call`` de ToolNode: sirve repeticiones desde la memoria."""
+        call = request.tool_call
+        name = call["name"]
+        state = request.state if isinstance(request.state, dict) else {}
+        session_id = state.get("session_id")
+        if not self.enabled or name not in MEMOIZED_TOOLS or not session_id:
+            return execute(request)
+
+        key = (session_id, name, normalize_args(call.get("args")))
+        entry = self._get(key)
+        if entry is not None:
+            self._count(name, "hits")
+            _, content, artifact, update = entry
+            logger.info(f"♻️  Tool call repeated, short-circuited: {name}({key[2]})")
+            message = ToolMessage(content=content, artifact=artifact, tool_call_id=call["id"], name=name)
+            if update is None:
+                return message
+            return Command(update={**update, "messages": [message]})
+
+        self._count(name, "misses")
+        result = execute(request)
+        if isinstance(result, ToolMessage):
+            if result.status != "error":
+                self._put(key, result, None)
+        elif isinstance(result, Command) and isinstance(result.update, dict):
+            messages = result.update.get("messages") or []
+            if len(messages) == 1 and isinstance(messages[0], ToolMessage) and messages[0].status != "error":
+                rest = {k: v for k, v in result.update.items() if k != "messages"}
+                self._put(key, messages[0], rest)
+        return result
+
+    def clear(self, session_id: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id is None:
+                self._data.clear()
+            else:
+                for key in [k for k in self._data if k[0] == session_id]:
+                    del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_tool = {k: dict(v) for k, v in self._counters.items()}
+            entries = len(self._data)
+        hits = sum(v["hits"] for v in per_tool.values())
+        lookups = hits + sum(v["misses"] for v in per_tool.values())
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "by_tool": per_tool,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton
+tool_memo = ToolCallMemo(
+    enabled=settings.TOOL_MEMO_ENABLED,
+    ttl_seconds=settings.TOOL_MEMO_TTL_SECONDS,
+)
@@ -1,9 +1,13 @@
 # ingest/database.py
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.types import UserDefinedType
 
+from chat.config.database import get_engine
+from utils.embedding_storage import binary_column_type, column_type
+from utils.normalize_db_url import normalize_db_url
+
 database_url = os.getenv("DATABASE_URL")
 if database_url and database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
@@ -12,7 +16,8 @@ class Vector(UserDefinedType):
     cache_ok = True  # importante para SQLAlchemy 2.x
 
     def get_col_spec(self):
-        return "VECTOR(1536)"
+        # vector(1536) por defecto; configurable (utils/embedding_storage.py)
+        return column_type()
 
     def bind_processor(self, dialect):
         def process(value):
@@ -32,11 +37,21 @@ class Vector(UserDefinedType):
             return value
         return process
 
-engine = create_engine(
-    database_url,
-    pool_pre_ping=True,
-    connect_args={"sslmode": "require"}
-)
+class Bit(UserDefinedType):
+    """bit(N) con el código binario del embedding ('1011...', ver binary_code)."""
+    cache_ok = True
+
+    def get_col_spec(self):
+        return binary_column_type()
+
+    def bind_processor(self, dialect):
+        def process(value):
+            return None if value is None else str(value)
+        return process
+
+# Mismo registro de pools que el chat (chat/config/database.py); misma URL
+# normalizada (driver psycopg) para compartir el pool en vez de abrir otro
+engine = get_engine(normalize_db_url(database_url), connect_args={"sslmode": "require"})
 
 # Extensiones
 with engine.connect() as conn:
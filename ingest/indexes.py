@@ -0,0 +1,252 @@
+# ingest/indexes.py
+"""
+Índices de búsqueda (ANN + trigram) para productos y proveedores.
+
+QueryNode ordena por ``p.embedding <=> :embedding``, filtra con ``%`` y
+calcula ``similarity()`` sobre nombre_producto, marca y nombre_comercial.
+Sin estos índices cada búsqueda es un seq scan sobre todo el catálogo.
+
+- ensure_search_indexes(): crea los que falten (CONCURRENTLY), repara los
+  que hayan quedado INVALID por una construcción interrumpida y borra la
+  pareja trigram que no usa SEARCH_NORMALIZATION.
+- rebuild_search_indexes(): REINDEX CONCURRENTLY + ANALYZE, para después
+  de ingestas grandes.
+- ensure_binary_codes(): con VECTOR_SEARCH_MODE=binary_rerank, columna
+  ``embedding_bq`` (bit(N)) rellenada con ``binary_quantize(embedding)``.
+- ensure_normalized_columns(): ``nombre_norm`` / ``marca_norm``
+  (utils/spanish_normalizer.py), recalculadas si cambia NORMALIZER_VERSION.
+"""
+import logging
+import os
+
+from sqlalchemy import text
+
+from utils.catalog_version import bump_catalog_version
+from utils.embedding_storage import BINARY_RERANK, binary_column_type, cosine_opclass
+from utils.spanish_normalizer import NORMALIZED_SEARCH, NORMALIZER_VERSION, normalize_text
+
+# (tabla, nombre, definición tras "ON tabla")
+SEARCH_INDEXES = [
+    (
+        "productos", "ix_prod_embedding_hnsw",
+        # vector_cosine_ops / halfvec_cosine_ops según EMBEDDING_STORAGE
+        f"USING hnsw (embedding {cosine_opclass()}) WITH (m = 16, ef_construction = 64)",
+    ),
+    (
+        # Filtro de marca: LOWER(p.marca) = LOWER(:marca)
+        "productos", "ix_prod_marca_lower",
+        "(LOWER(marca))",
+    ),
+    (
+        "proveedores", "ix_prov_nombre_trgm",
+        "USING gin (nombre_comercial gin_trgm_ops)",
+    ),
+]
+
+# Pierna trigram con SEARCH_NORMALIZATION (por defecto) + etapa EXACT de la cascada
+NORMALIZED_INDEXES = [
+    (
+        "productos", "ix_prod_nombre_norm_trgm",
+        "USING gin (nombre_norm gin_trgm_ops)",
+    ),
+    (
+        "productos", "ix_prod_marca_norm_trgm",
+        "USING gin (marca_norm gin_trgm_ops)",
+    ),
+    (
+        # nombre_norm = :q / LIKE :q || ' %'
+        "productos", "ix_prod_nombre_norm_prefix",
+        "(nombre_norm text_pattern_ops)",
+    ),
+    (
+        "productos", "ix_prod_marca_norm",
+        "(marca_norm)",
+    ),
+]
+
+# Pierna trigram con SEARCH_NORMALIZATION=false (columnas originales)
+RAW_TRIGRAM_INDEXES = [
+    (
+        "productos", "ix_prod_nombre_trgm",
+        "USING gin (nombre_producto gin_trgm_ops)",
+    ),
+    (
+        # Debe coincidir con la expresión de QueryNode: COALESCE(p.marca, '') % :q
+        "productos", "ix_prod_marca_trgm",
+        "USING gin ((COALESCE(marca, '')) gin_trgm_ops)",
+    ),
+]
+
+# Primera pasada por Hamming: solo con VECTOR_SEARCH_MODE=binary_rerank
+BINARY_INDEX = (
+    "productos", "ix_prod_embedding_bq_hnsw",
+    "USING hnsw (embedding_bq bit_hamming_ops) WITH (m = 16, ef_construction = 64)",
+)
+
+
+def search_indexes():
+    """SEARCH_INDEXES más los del modo de búsqueda configurado."""
+    trigram = NORMALIZED_INDEXES if NORMALIZED_SEARCH else RAW_TRIGRAM_INDEXES
+    return SEARCH_INDEXES + trigram + ([BINARY_INDEX] if BINARY_RERANK else [])
+
+
+def unused_indexes():
+    """Índices trigram del otro modo de SEARCH_NORMALIZATION (se borran)."""
+    return RAW_TRIGRAM_INDEXES if NORMALIZED_SEARCH else NORMALIZED_INDEXES
+
+
+# Mínimo de filas insertadas/borradas para reconstruir tras una ingesta
+INDEX_REBUILD_MIN_ROWS = int(os.getenv("INDEX_REBUILD_MIN_ROWS", "5000"))
+
+
+def _autocommit(engine):
+    # CREATE/REINDEX ... CONCURRENTLY no puede ir dentro de una transacción
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def _index_state(conn, name: str):
+    """None si no existe; True/False según pg_index.indisvalid."""
+    row = conn.execute(
+        text("""
+            SELECT i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = :name AND c.relkind = 'i'
+        """),
+        {"name": name},
+    ).fetchone()
+    return None if row is None else bool(row.indisvalid)
+
+
+def ensure_search_indexes(engine, concurrently: bool = True) -> None:
+    """Crea los índices de búsqueda que falten (idempotente)."""
+    mode = "CONCURRENTLY " if concurrently else ""
+    with _autocommit(engine) as conn:
+        for table, name, definition in search_indexes():
+            try:
+                state = _index_state(conn, name)
+                if state is True:
+                    continue
+                if state is False:
+                    logging.warning(f"Índice {name} INVALID (build interrumpido); se recrea.")
+                    conn.exec_driver_sql(f"DROP INDEX {mode}IF EXISTS {name}")
+                logging.info(f"Creando índice {name} en {table}...")
+                conn.exec_driver_sql(f"CREATE INDEX {mode}IF NOT EXISTS {name} ON {table} {definition}")
+            except Exception as e:
+                logging.error(f"No se pudo crear el índice {name}: {e}")
+        # Solo se mantiene la pareja trigram que usa la búsqueda
+        for table, name, _ in unused_indexes():
+            try:
+                if _index_state(conn, name) is not None:
+                    logging.info(f"Eliminando índice {name} (no lo usa SEARCH_NORMALIZATION actual)...")
+                    conn.exec_driver_sql(f"DROP INDEX {mode}IF EXISTS {name}")
+            except Exception as e:
+                logging.error(f"No se pudo eliminar el índice {name}: {e}")
+
+
+def ensure_binary_codes(engine, batch_size: int = 10000) -> None:
+    """
+    Con VECTOR_SEARCH_MODE=binary_rerank, crea ``productos.embedding_bq`` si
+    falta y calcula los códigos que falten (filas anteriores a la columna o
+    tras migrar los embeddings). La ingesta ya los escribe en las filas
+    nuevas. En modo ``exact`` no hace nada.
+    """
+    if not BINARY_RERANK:
+        return
+    bit_type = binary_column_type()
+    total = 0
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"ALTER TABLE productos ADD COLUMN IF NOT EXISTS embedding_bq {bit_type}")
+        while True:
+            with engine.begin() as conn:
+                updated = conn.execute(
+                    text(f"""
+                        UPDATE productos SET embedding_bq = binary_quantize(embedding)::{bit_type}
+                        WHERE id IN (
+                            SELECT id FROM productos
+                            WHERE embedding_bq IS NULL AND embedding IS NOT NULL
+                            LIMIT :n
+                        )
+                    """),
+                    {"n": batch_size},
+                ).rowcount
+            total += updated
+            if updated < batch_size:
+                break
+    except Exception as e:
+        # p.ej. pgvector < 0.7 (sin binary_quantize): la búsqueda exacta sigue funcionando
+        logging.error(f"No se pudieron calcular los códigos binarios: {e}")
+    if total:
+        logging.info(f"Códigos binarios calculados para {total} productos.")
+
+
+def ensure_normalized_columns(engine, batch_size: int = 5000) -> None:
+    """
+    Crea ``nombre_norm`` / ``marca_norm`` si faltan y las rellena en Python
+    (misma función que la consulta). El comentario de ``nombre_norm`` guarda
+    NORMALIZER_VERSION: si no coincide se recalculan todas las filas.
+    Incrementa catalog_version si cambió alguna (índice trigram local y
+    caché de resultados).
+    """
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE productos ADD COLUMN IF NOT EXISTS nombre_norm text")
+        conn.exec_driver_sql("ALTER TABLE productos ADD COLUMN IF NOT EXISTS marca_norm text")
+        version = conn.execute(
+            text("SELECT col_description('productos'::regclass, a.attnum) FROM pg_attribute a "
+                 "WHERE a.attrelid = 'productos'::regclass AND a.attname = 'nombre_norm'")
+        ).scalar()
+        if version != NORMALIZER_VERSION:
+            if version is not None:
+                logging.info(f"Normalizador {version} → {NORMALIZER_VERSION}: se recalculan nombre_norm/marca_norm.")
+            conn.execute(text("UPDATE productos SET nombre_norm = NULL, marca_norm = NULL WHERE nombre_norm IS NOT NULL"))
+            conn.exec_driver_sql(f"COMMENT ON COLUMN productos.nombre_norm IS '{NORMALIZER_VERSION}'")
+
+    total = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT id, nombre_producto, marca FROM productos WHERE nombre_norm IS NULL ORDER BY id LIMIT :n"),
+                {"n": batch_size},
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    text("UPDATE productos SET nombre_norm = :nombre, marca_norm = :marca WHERE id = :id"),
+                    [
+                        {"id": r.id, "nombre": normalize_text(r.nombre_producto), "marca": normalize_text(r.marca)}
+                        for r in rows
+                    ],
+                )
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    if total:
+        logging.info(f"Texto normalizado calculado para {total} productos.")
+        bump_catalog_version(engine)
+
+
+def rebuild_search_indexes(engine) -> None:
+    """Reconstruye los índices sin bloquear lecturas/escrituras y actualiza estadísticas."""
+    with _autocommit(engine) as conn:
+        for table, name, _ in search_indexes():
+            try:
+                logging.info(f"REINDEX CONCURRENTLY {name}...")
+                conn.exec_driver_sql(f"REINDEX INDEX CONCURRENTLY {name}")
+            except Exception as e:
+                logging.error(f"No se pudo reconstruir el índice {name}: {e}")
+        for table in sorted({t for t, _, _ in search_indexes()}):
+            conn.exec_driver_sql(f"ANALYZE {table}")
+
+
+def maybe_rebuild_after_ingest(engine, rows_changed: int) -> bool:
+    """Reconstruye si la ingesta tocó al menos INDEX_REBUILD_MIN_ROWS filas."""
+    if rows_changed < INDEX_REBUILD_MIN_ROWS:
+        logging.info(
+            f"Ingesta con {rows_changed} filas nuevas/borradas (< {INDEX_REBUILD_MIN_ROWS}); "
+            "no se reconstruyen índices."
+        )
+        return False
+    logging.info(f"Ingesta grande ({rows_changed} filas); reconstruyendo índices de búsqueda...")
+    ensure_search_indexes(engine)
+    rebuild_search_indexes(engine)
+    return True
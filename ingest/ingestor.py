@@ -15,7 +15,11 @@ sys.path.append(str(project_root))
 
 from ingest.models import Proveedor, Producto, Base, IngestedFile
 from ingest.database import engine, SessionLocal
+from ingest.indexes import ensure_binary_codes, ensure_normalized_columns, ensure_search_indexes
+from ingest.migrate_embeddings import check_embedding_column
+from utils.embedding_storage import BINARY_RERANK, binary_code
 from utils.embedding_utils import generar_embedding
+from utils.spanish_normalizer import normalize_text
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -74,6 +78,14 @@ def safe_str(val):
     s = str(val).strip()
     return None if not s or s.lower() == "nan" else s
 
+def texto_embedding(nombre_producto, marca, presentacion_venta) -> str:
+    """Texto que se embebe por producto (también al migrar, ver migrate_embeddings)."""
+    return (
+        nombre_producto
+        or " ".join(x for x in [marca, presentacion_venta] if x)
+        or ""
+    )
+
 
 # --- Clase de Ingestión ---
 class CSVIngestor:
@@ -81,10 +93,18 @@ class CSVIngestor:
         self.proveedores_file = proveedores_file
         self.productos_dir = productos_dir
         self.session = SessionLocal()
+        # Filas insertadas + borradas en esta ejecución (decide si reindexar)
+        self.rows_changed = 0
+        # Filas actualizadas (precio/moneda/vigencia): no reindexan pero sí cambian el catálogo
+        self.rows_updated = 0
 
     def create_tables(self):
         logging.info("Creando tablas si no existen...")
         Base.metadata.create_all(engine)  # incluye ingested_files
+        check_embedding_column(engine)
+        ensure_binary_codes(engine)
+        ensure_normalized_columns(engine)
+        ensure_search_indexes(engine)
 
     def reset_database(self):
         logging.info("⚠️  ELIMINANDO TODAS LAS TABLAS Y RECREANDO DESDE CERO...")
@@ -94,6 +114,10 @@ class CSVIngestor:
             logging.info("✅ Tablas eliminadas correctamente.")
             # Recrear tablas con el nuevo esquema
             Base.metadata.create_all(engine)
+            check_embedding_column(engine)
+            ensure_binary_codes(engine)
+            ensure_normalized_columns(engine)
+            ensure_search_indexes(engine, concurrently=False)
             logging.info("✅ Tablas recreadas con el nuevo esquema.")
         except Exception as e:
             logging.error(f"❌ Error al resetear la base de datos: {e}")
@@ -228,14 +252,12 @@ class CSVIngestor:
             try:
                 nombre_producto = safe_str(row.get("nombre_producto"))
                 # Texto para embedding
-                texto_emb = (
-                    nombre_producto
-                    or " ".join(x for x in [
-                        safe_str(row.get("marca")),
-                        safe_str(row.get("presentacion_venta")),
-                    ] if x)
-                    or ""
+                texto_emb = texto_embedding(
+                    nombre_producto,
+                    safe_str(row.get("marca")),
+                    safe_str(row.get("presentacion_venta")),
                 )
+                embedding = generar_embedding(texto_emb)
 
                 precio = parse_precio(row.get("precio_unidad"))
                 precio = float(precio) if (precio is not None and not pd.isna(precio)) else 0.0
@@ -253,8 +275,12 @@ class CSVIngestor:
                     categoria_1=safe_str(row.get("categoria_1")),
                     categoria_2=safe_str(row.get("categoria_2")),
                     vigencia=safe_str(row.get("vigencia")),
-                    embedding=generar_embedding(texto_emb)
+                    nombre_norm=normalize_text(nombre_producto),
+                    marca_norm=normalize_text(safe_str(row.get("marca"))),
+                    embedding=embedding,
                 )
+                if BINARY_RERANK:
+                    prod.embedding_bq = binary_code(embedding)
                 self.session.add(prod)
                 # Evita el INSERT en lote; si falla, rollback y continúa
                 self.session.flush()
@@ -320,6 +346,8 @@ class CSVIngestor:
         # Commit final
         try:
             self.session.commit()
+            self.rows_changed += len(to_insert) + len(to_delete)
+            self.rows_updated += len(to_update)
         except SQLAlchemyError as e:
             self.session.rollback()
             logging.error(
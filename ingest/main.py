@@ -12,6 +12,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from ingestor import CSVIngestor
+from ingest.database import engine
+from ingest.indexes import maybe_rebuild_after_ingest
+from utils.catalog_version import bump_catalog_version
+from utils.spell_corrector import build_catalog_vocabulary
+from utils.vector_index import export_vector_index, vector_index_settings
 
 BUCKET_NAME = "supplier-catalogs-2025"
 PROVEEDORES_KEY = "data/proveedores.csv"
@@ -205,4 +210,26 @@ if __name__ == "__main__":
                 except Exception as e:
                     logging.error(f"Error procesando '{key}': {e}", exc_info=True)
 
+    # 3) Índices de búsqueda: reconstrucción concurrente tras ingestas grandes
+    maybe_rebuild_after_ingest(engine, ingestor.rows_changed)
+
+    # 4) Nueva versión del catálogo (invalida cachés de resultados en los servidores)
+    #    + export del índice vectorial local (mmap). proveedores.csv también
+    #    cuenta: los índices locales y los resultados incluyen datos del proveedor.
+    if ingestor.rows_changed or ingestor.rows_updated or df_proveedores is not None:
+        if ingestor.rows_changed:
+            # Vocabulario del corrector ortográfico (lo cargan los servidores con la versión nueva)
+            try:
+                build_catalog_vocabulary(engine)
+            except Exception as e:
+                logging.error(f"No se pudo generar el vocabulario del catálogo: {e}", exc_info=True)
+        version = bump_catalog_version(engine)
+        vi = vector_index_settings()
+        if vi["enabled"]:
+            try:
+                export_vector_index(engine, vi["directory"], version, dtype=vi["dtype"])
+            except Exception as e:
+                # Los workers lo reconstruirán al ver la versión nueva
+                logging.error(f"No se pudo exportar el índice vectorial: {e}", exc_info=True)
+
     logging.info("Ingestión completada.")
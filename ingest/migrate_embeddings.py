@@ -0,0 +1,219 @@
+# ingest/migrate_embeddings.py
+"""
+Migración de ``productos.embedding`` al modelo / tipo configurado.
+
+La configuración vive en utils/embedding_storage.py (EMBEDDING_MODEL,
+EMBEDDING_DIMENSIONS, EMBEDDING_STORAGE). La columna guarda en su
+comentario qué modelo la generó (sin comentario = ada-002), así que el plan
+se decide comparando la columna actual con la configuración:
+
+- ``cast``:     mismo modelo y dimensiones, cambia vector ↔ halfvec.
+                ALTER COLUMN ... USING embedding::halfvec(N); sin API.
+- ``truncate``: text-embedding-3-* a menos dimensiones. Los embeddings
+                reducidos de OpenAI equivalen a truncar y renormalizar, así
+                que se hace en SQL (subvector + l2_normalize); sin API.
+- ``reembed``:  otro modelo (p.ej. ada-002 → text-embedding-3-small). Se
+                re-embebe cada producto en una columna nueva, por lotes y de
+                forma reanudable, y al final se intercambian las columnas.
+
+En todos los casos se borra antes el índice HNSW (su opclass depende del
+tipo), se recrea con ensure_search_indexes y se incrementa catalog_version
+(los servidores descartan cachés y su índice local). Salvo en ``cast``, los
+códigos binarios (``embedding_bq``) se borran y se recalculan con
+ensure_binary_codes. Conviene pausar la
+ingesta diaria mientras dura.
+
+Uso:
+    python -m ingest.migrate_embeddings            # muestra el plan
+    python -m ingest.migrate_embeddings --apply
+"""
+import argparse
+import logging
+import re
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+from utils.embedding_storage import LEGACY_MODEL, column_type, model_key
+
+_HNSW_INDEX = "ix_prod_embedding_hnsw"
+_BQ_INDEX = "ix_prod_embedding_bq_hnsw"
+_TMP_COLUMN = "embedding_new"
+_TYPE_RE = re.compile(r"^(vector|halfvec)\((\d+)\)$")
+
+
+def current_embedding_column(conn) -> Optional[Dict[str, str]]:
+    """
+    Tipo SQL y modelo (comentario) de productos.embedding; None si no
+    existe. ``model`` es None si la columna no tiene comentario.
+    """
+    row = conn.execute(
+        text("""
+            SELECT format_type(a.atttypid, a.atttypmod) AS type,
+                   col_description(a.attrelid, a.attnum) AS model
+            FROM pg_attribute a
+            WHERE a.attrelid = to_regclass('productos')
+              AND a.attname = 'embedding' AND NOT a.attisdropped
+        """)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"type": row.type, "model": row.model}
+
+
+def plan_migration(current: Dict[str, str], target: Dict[str, str]) -> str:
+    """none | cast | truncate | reembed (ver docstring del módulo)."""
+    current = dict(current, model=current["model"] or LEGACY_MODEL)
+    if current == target:
+        return "none"
+    cur_type, tgt_type = _TYPE_RE.match(current["type"]), _TYPE_RE.match(target["type"])
+    if not cur_type or not tgt_type:
+        return "reembed"
+    cur_dims, tgt_dims = int(cur_type.group(2)), int(tgt_type.group(2))
+    if current["model"] == target["model"] and cur_dims == tgt_dims:
+        return "cast"
+    cur_base, tgt_base = current["model"].split("@")[0], target["model"].split("@")[0]
+    if cur_base == tgt_base and cur_base.startswith("text-embedding-3") and tgt_dims < cur_dims:
+        return "truncate"
+    return "reembed"
+
+
+def check_embedding_column(engine) -> str:
+    """Avisa si la columna no coincide con la configuración; devuelve el plan."""
+    target = {"type": column_type(), "model": model_key()}
+    with engine.connect() as conn:
+        current = current_embedding_column(conn)
+        if current is not None and current["model"] is None and current["type"] == target["type"]:
+            # Columna recién creada por create_all (sin datos): se etiqueta
+            # con el modelo configurado en vez de suponer ada-002
+            empty = conn.execute(
+                text("SELECT NOT EXISTS (SELECT 1 FROM productos WHERE embedding IS NOT NULL)")
+            ).scalar()
+            if empty:
+                conn.execute(text(_comment_sql(target["model"])))
+                conn.commit()
+                current["model"] = target["model"]
+    if current is None:
+        return "none"
+    plan = plan_migration(current, target)
+    if plan != "none":
+        logging.error(
+            f"productos.embedding es {current['type']} ({current['model'] or LEGACY_MODEL}) pero la configuración "
+            f"pide {target['type']} ({target['model']}). Ejecuta "
+            f"'python -m ingest.migrate_embeddings --apply' (plan: {plan})."
+        )
+    return plan
+
+
+def _comment_sql(model: str) -> str:
+    # COMMENT no admite parámetros: literal con comillas escapadas
+    return "COMMENT ON COLUMN productos.embedding IS '{}'".format(model.replace("'", "''"))
+
+
+def _alter_in_place(engine, using_sql: str, model: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {_HNSW_INDEX}"))
+        conn.execute(text(f"ALTER TABLE productos ALTER COLUMN embedding TYPE {column_type()} USING {using_sql}"))
+        conn.execute(text(_comment_sql(model)))
+
+
+def _reembed(engine, model: str, batch_size: int) -> None:
+    from ingest.ingestor import texto_embedding
+    from utils.embedding_utils import generar_embedding
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE productos ADD COLUMN IF NOT EXISTS {_TMP_COLUMN} {column_type()}"))
+
+    # Reanudable: solo filas aún sin embedding nuevo, por id ascendente
+    last_id, done = 0, 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(f"""
+                    SELECT id, nombre_producto, marca, presentacion_venta
+                    FROM productos
+                    WHERE {_TMP_COLUMN} IS NULL AND id > :last
+                    ORDER BY id
+                    LIMIT :n
+                """),
+                {"last": last_id, "n": batch_size},
+            ).fetchall()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            embedding = generar_embedding(texto_embedding(row.nombre_producto, row.marca, row.presentacion_venta))
+            if embedding is not None:
+                updates.append({"id": row.id, "e": str(embedding)})
+        if updates:
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"UPDATE productos SET {_TMP_COLUMN} = CAST(CAST(:e AS vector) AS {column_type()}) WHERE id = :id"),
+                    updates,
+                )
+        last_id = rows[-1].id
+        done += len(rows)
+        logging.info(f"Re-embebidos {done} productos (último id {last_id})")
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP INDEX IF EXISTS {_HNSW_INDEX}"))
+        conn.execute(text("ALTER TABLE productos DROP COLUMN embedding"))
+        conn.execute(text(f"ALTER TABLE productos RENAME COLUMN {_TMP_COLUMN} TO embedding"))
+        conn.execute(text(_comment_sql(model)))
+
+
+def migrate_embeddings(engine, apply: bool = False, batch_size: int = 500) -> str:
+    """Calcula el plan y, con ``apply``, lo ejecuta. Devuelve el plan."""
+    from ingest.indexes import ensure_binary_codes, ensure_search_indexes
+    from utils.catalog_version import bump_catalog_version
+
+    target = {"type": column_type(), "model": model_key()}
+    with engine.connect() as conn:
+        current = current_embedding_column(conn)
+    if current is None:
+        logging.info("No existe productos.embedding: create_tables() la creará con la configuración actual.")
+        return "none"
+    plan = plan_migration(current, target)
+    logging.info(
+        f"productos.embedding: {current['type']} ({current['model'] or LEGACY_MODEL}) → "
+        f"{target['type']} ({target['model']}): plan={plan}"
+    )
+    if plan == "none" or not apply:
+        return plan
+
+    dims = _TYPE_RE.match(target["type"]).group(2)
+    if plan == "cast":
+        _alter_in_place(engine, f"embedding::{column_type()}", target["model"])
+    elif plan == "truncate":
+        _alter_in_place(
+            engine,
+            f"l2_normalize(subvector(embedding::vector, 1, {dims}))::{column_type()}",
+            target["model"],
+        )
+    else:
+        _reembed(engine, target["model"], batch_size)
+
+    if plan != "cast":
+        # Otro espacio de embeddings (dimensiones o modelo): códigos nuevos
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP INDEX IF EXISTS {_BQ_INDEX}"))
+            conn.execute(text("ALTER TABLE productos DROP COLUMN IF EXISTS embedding_bq"))
+    ensure_binary_codes(engine)
+    ensure_search_indexes(engine)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE productos"))
+    bump_catalog_version(engine)
+    logging.info("✅ Migración de embeddings completada.")
+    return plan
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apply", action="store_true", help="ejecuta el plan (por defecto solo lo muestra)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from ingest.database import engine
+
+    migrate_embeddings(engine, apply=args.apply, batch_size=args.batch_size)
@@ -3,7 +3,8 @@ from sqlalchemy import (
     UniqueConstraint, Index, DateTime, func
 )
 from sqlalchemy.orm import declarative_base
-from ingest.database import Vector  # Tipo personalizado pgvector (VECTOR(1536))
+from ingest.database import Bit, Vector  # Tipos pgvector (vector/halfvec y bit, ver utils/embedding_storage.py)
+from utils.embedding_storage import BINARY_RERANK
 
 Base = declarative_base()
 
@@ -62,13 +63,22 @@ class Producto(Base):
     categoria_2 = Column(Text)
     vigencia = Column(Text)
 
-    # Embedding (1536 dims)
+    # nombre_producto / marca normalizados para trigramas (utils/spanish_normalizer.py)
+    nombre_norm = Column(Text)
+    marca_norm = Column(Text)
+
+    # Embedding (EMBEDDING_STORAGE / EMBEDDING_DIMENSIONS)
     embedding = Column(Vector)
+    # Código binario del embedding (primera pasada por Hamming, ver ingest/indexes.py);
+    # solo se mapea con VECTOR_SEARCH_MODE=binary_rerank
+    if BINARY_RERANK:
+        embedding_bq = Column(Bit)
 
     __table_args__ = (
         # Un producto único por proveedor + id_producto_csv
         UniqueConstraint('id_proveedor', 'id_producto_csv', name='uq_prod_proveedor_prodid'),
         Index('ix_prod_id_proveedor', 'id_proveedor'),
+        # Índices de búsqueda (HNSW, trigram, LOWER(marca)): ver ingest/indexes.py
     )
 
 
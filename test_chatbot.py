@@ -7,6 +7,7 @@ Validates:
 3. Chatbot has the expected public API
 4. System prompt builds correctly for each turn range
 5. Platform block triggers at turn 5+
+6. Terminal tool output is rendered without a second LLM pass
 """
 import pytest
 from unittest.mock import patch, MagicMock
@@ -175,3 +176,77 @@ def test_extract_response():
     state = {"messages": messages}
     result = Chatbot._extract_response(state)
     assert "proveedores de aceite" in result
+
+
+# ── Test 6: Terminal tools ──────────────────────────────────────────
+def test_provider_card_is_rendered_without_second_llm_pass(monkeypatch):
+    """detalle_proveedor output goes tools → render → END (one LLM call)."""
+    from langchain_core.messages import AIMessage, HumanMessage
+    from chat.agent import graph as agent_graph
+    from chat.agent import tools
+    from chat.agent.graph import create_agent_graph, create_initial_agent_state
+    from chat.services.tool_memo import ToolCallMemo
+
+    card = "📋 **La Ranita**\nWhatsApp: 55 1234 5678"
+    llm_calls = []
+
+    class _FakeLLM:
+        def invoke(self, msgs):
+            llm_calls.append(msgs)
+            return AIMessage(content="", tool_calls=[
+                {"name": "detalle_proveedor", "args": {"nombre_proveedor": "la ranita"}, "id": "c1"},
+            ])
+
+    monkeypatch.setattr(agent_graph, "_llm_with_tools", _FakeLLM())
+    monkeypatch.setattr(agent_graph, "tool_memo", ToolCallMemo(enabled=False))
+    monkeypatch.setattr(tools._qn, "_provider_entry", lambda nombre: {"card": card, "nombre": "La Ranita"})
+    monkeypatch.setattr(tools.prefetcher, "enabled", False)
+
+    state = create_initial_agent_state(session_id="t-card")
+    state["messages"] = [HumanMessage(content="contacto de la ranita")]
+    result = create_agent_graph().invoke(state)
+
+    assert len(llm_calls) == 1
+    final = result["messages"][-1]
+    assert isinstance(final, AIMessage) and final.content.startswith(card)
+    assert "*La Ranita*" in final.content and "INSTRUCCIÓN" not in final.content
+
+
+def test_non_terminal_tool_output_loops_back_to_agent():
+    from langchain_core.messages import ToolMessage
+    from chat.agent.graph import after_tools
+
+    state = {"messages": [
+        ToolMessage(content="card", artifact={"final_render": "card"}, tool_call_id="1"),
+        ToolMessage(content="Se encontraron 3 proveedores", tool_call_id="2"),
+    ]}
+    assert after_tools(state) == "agent"
+    assert after_tools({"messages": state["messages"][:1]}) == "render"
+
+
+def test_llm_clients_share_pool_and_count_per_model():
+    """Same (model, params) → same ChatOpenAI; all share one HTTP pool; hooks feed stats."""
+    import httpx
+    from utils.llm_clients import LLMClientRegistry
+
+    registry = LLMClientRegistry(max_connections=4, max_keepalive=2, http2=False, api_key="sk-test")
+    a = registry.chat("gpt-4o", temperature=0)
+    assert registry.chat("gpt-4o", temperature=0) is a
+    b = registry.chat("gpt-4o", temperature=0.7)
+    assert b is not a
+    assert registry.openai()._client is registry.http_client()
+
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions", json={"model": "gpt-4o"})
+    registry._on_request(request)
+    registry._on_response(httpx.Response(200, request=request))
+    registry._on_request(request)
+    registry._on_response(httpx.Response(429, request=request))
+
+    stats = registry.stats()
+    assert stats["chat_models"] == 2
+    assert stats["max_connections"] == 4
+    model = stats["by_model"]["gpt-4o"]
+    assert model["requests"] == 2
+    assert model["errors"] == 1
+    assert sum(model["latency_histogram"].values()) == 2
+    registry.close()
@@ -0,0 +1,1405 @@
+"""
+Tests for the search layer (caches, planners, indexes).
+
+Pure unit tests: no LLM, no DB, no network.
+
+Ejecutar:
+    python -m pytest test_search.py -v
+"""
+import pytest
+
+
+# ── Embedding cache ─────────────────────────────────────────────────
+def test_embedding_cache_hits_after_first_compute():
+    """Second lookup of a normalized-equal text must not call the API."""
+    from utils.embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(max_bytes=1024 * 1024)
+    calls = []
+
+    def fake_embed(s):
+        calls.append(s)
+        return [0.1, 0.2, 0.3]
+
+    assert cache.get_or_compute("Aceite de oliva", "m", fake_embed) == [0.1, 0.2, 0.3]
+    assert cache.get_or_compute("  aceite   de OLIVA ", "m", fake_embed) == [0.1, 0.2, 0.3]
+    assert len(calls) == 1
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_embedding_cache_key_includes_model():
+    from utils.embedding_cache import EmbeddingCache
+
+    assert EmbeddingCache.make_key("queso", "a") != EmbeddingCache.make_key("queso", "b")
+
+
+def test_embedding_cache_evicts_by_bytes():
+    """LRU must stay under max_bytes (3 dims × 8 bytes = 24 bytes per entry)."""
+    from utils.embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(max_bytes=48)
+    cache.put("a", "m", [1.0, 1.0, 1.0])
+    cache.put("b", "m", [2.0, 2.0, 2.0])
+    cache.get("a", "m")                      # "a" becomes most recent
+    cache.put("c", "m", [3.0, 3.0, 3.0])     # evicts "b"
+
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") == [1.0, 1.0, 1.0]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= 48
+
+
+def test_embedding_cache_ttl_expires(monkeypatch):
+    import utils.embedding_cache as ec
+
+    now = [1000.0]
+    monkeypatch.setattr(ec.time, "monotonic", lambda: now[0])
+    cache = ec.EmbeddingCache(ttl_seconds=10)
+    cache.put("panela", "m", [0.5])
+    now[0] += 11
+    assert cache.get("panela", "m") is None
+    assert cache.stats()["expirations"] == 1
+
+
+# ── Query planner ───────────────────────────────────────────────────
+def test_planner_expresses_common_search_shape():
+    from chat.services.query_planner import QueryPlanner
+
+    plan = QueryPlanner().plan({"producto": "queso panela", "marca": "Lala", "precio_max": "150"})
+    assert plan["template"] == "hybrid"
+    assert plan["marca"] == "Lala"
+    assert plan["precio_max"] == 150.0
+    assert plan["provider_filters"] == []
+
+
+def test_planner_detects_price_order_and_provider_attributes():
+    from chat.services.query_planner import QueryPlanner
+
+    plan = QueryPlanner().plan(
+        {"producto": "aceite"},
+        user_query="el aceite más barato con entrega a domicilio y crédito",
+    )
+    assert plan["order_by"] == "precio"
+    assert set(plan["provider_filters"]) == {"entregas_domicilio", "ofrece_credito"}
+
+
+def test_planner_defers_unsupported_shapes_to_llm():
+    from chat.services.query_planner import QueryPlanner
+
+    planner = QueryPlanner()
+    assert planner.plan({}) is None
+    assert planner.plan({"producto": "queso", "proveedor_nombre": "La Ranita"}) is None
+    assert planner.plan({"producto": "queso"}, user_query="queso de la categoría lácteos") is None
+
+
+def test_planner_stats_hit_rate():
+    from chat.services.query_planner import QueryPlanner, QueryPath
+
+    planner = QueryPlanner()
+    planner.record(QueryPath.TEMPLATE)
+    planner.record(QueryPath.TEMPLATE)
+    planner.record(QueryPath.LLM_SQL)
+    stats = planner.stats()
+    assert stats["template"] == 2
+    assert stats["template_hit_rate"] == round(2 / 3, 4)
+
+
+# ── SQL plan cache ──────────────────────────────────────────────────
+_REUSABLE_SQL = (
+    "SELECT p.id FROM productos p WHERE similarity(p.nombre_producto, :search_term) > 0.25 "
+    "AND LOWER(p.marca) = LOWER(:marca) ORDER BY p.embedding <=> CAST(:embedding AS vector)"
+)
+
+
+def test_entity_signature_masks_entity_values():
+    from chat.services.plan_cache import entity_signature
+
+    a = entity_signature("proveedores de queso con entrega", {"producto": "queso"})
+    b = entity_signature("Proveedores de ACEITE con entrega!", {"producto": "aceite"})
+    c = entity_signature("proveedores de queso con entrega", {"producto": "queso", "marca": "Lala"})
+    assert a == b
+    assert a != c
+
+
+def test_plan_cache_roundtrip_and_schema_invalidation():
+    from chat.services.plan_cache import SQLPlanCache
+
+    cache = SQLPlanCache()
+    entities = {"producto": "queso", "marca": "Lala"}
+    assert cache.put("sig", "schema-v1", _REUSABLE_SQL, entities)
+    assert cache.get("sig", "schema-v1") == _REUSABLE_SQL
+    assert cache.get("sig", "schema-v2") is None      # schema changed → invalidated
+    assert cache.get("sig", "schema-v1") is None
+
+
+def test_plan_cache_rejects_sql_with_embedded_values():
+    from chat.services.plan_cache import SQLPlanCache
+
+    cache = SQLPlanCache()
+    sql = "SELECT p.id FROM productos p WHERE p.nombre_producto ILIKE '%queso%' AND :search_term IS NOT NULL"
+    assert not cache.put("sig", "v1", sql, {"producto": "queso"})
+    assert not cache.put("sig", "v1", "SELECT 1 WHERE :otro = 1", {"producto": "pan"})
+    assert cache.stats()["rejected"] == 2
+
+
+def test_plan_cache_kill_switch_and_eviction():
+    from chat.services.plan_cache import SQLPlanCache
+
+    disabled = SQLPlanCache(enabled=False)
+    assert not disabled.put("sig", "v1", _REUSABLE_SQL, {})
+    assert disabled.get("sig", "v1") is None
+
+    cache = SQLPlanCache(max_entries=1)
+    cache.put("a", "v1", _REUSABLE_SQL, {})
+    cache.put("b", "v1", _REUSABLE_SQL, {})
+    assert cache.get("a", "v1") is None
+    assert cache.stats()["evictions"] == 1
+
+
+# ── Speculative search race ─────────────────────────────────────────
+def _sleepy(seconds, rows):
+    import time
+
+    def fn():
+        time.sleep(seconds)
+        return rows
+    return fn
+
+
+def test_race_prefers_llm_within_grace_window():
+    from chat.services.search_race import SearchRacer
+
+    racer = SearchRacer(prefer="llm_sql", grace_seconds=1.0)
+    result = racer.race(
+        {"llm_sql": _sleepy(0.05, ["llm"]), "hybrid": _sleepy(0.0, ["hyb"])},
+        accept=lambda rows: rows,
+    )
+    assert result["winner"] == "llm_sql"
+    assert result["rows"] == ["llm"]
+
+
+def test_race_returns_first_passing_result_after_grace():
+    import time
+    from chat.services.search_race import SearchRacer
+
+    racer = SearchRacer(prefer="llm_sql", grace_seconds=0.05)
+    t0 = time.perf_counter()
+    result = racer.race(
+        {"llm_sql": _sleepy(0.5, ["llm"]), "hybrid": _sleepy(0.0, ["hyb"])},
+        accept=lambda rows: rows,
+    )
+    assert result["winner"] == "hybrid"
+    assert time.perf_counter() - t0 < 0.4      # loser ignored, not awaited
+    assert racer.stats()["strategies"]["hybrid"]["wins"] == 1
+
+
+def test_race_skips_results_below_relevance_filter():
+    from chat.services.search_race import SearchRacer
+
+    racer = SearchRacer(prefer="llm_sql", grace_seconds=0.0)
+    result = racer.race(
+        {"llm_sql": _sleepy(0.0, [0.1]), "hybrid": _sleepy(0.02, [0.9])},
+        accept=lambda rows: [r for r in rows if r >= 0.55],
+    )
+    assert result["winner"] == "hybrid"
+    assert result["raw"]["llm_sql"] == [0.1]
+
+
+def test_race_sequential_when_disabled():
+    from chat.services.search_race import SearchRacer
+
+    racer = SearchRacer(prefer="llm_sql", enabled=False)
+    result = racer.race(
+        {"hybrid": _sleepy(0.0, ["hyb"]), "llm_sql": _sleepy(0.0, [])},
+        accept=lambda rows: rows,
+    )
+    assert result["winner"] == "hybrid"
+    assert set(result["raw"]) == {"llm_sql", "hybrid"}
+
+
+# ── In-process mmap vector index ────────────────────────────────────
+def _publish_index(directory, version, ids, vectors, dtype="float32"):
+    """Write the files the ingest export produces (no DB needed)."""
+    import json
+    import numpy as np
+
+    vecs = np.asarray(vectors, dtype=np.float32)
+    vecs = vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+    np.save(directory / f"vectors-v{version}.npy", vecs.astype(dtype))
+    np.save(directory / f"ids-v{version}.npy", np.asarray(ids, dtype=np.int64))
+    (directory / "manifest.json").write_text(json.dumps({
+        "version": version, "dtype": dtype, "count": len(ids), "dim": vecs.shape[1],
+        "vectors": f"vectors-v{version}.npy", "ids": f"ids-v{version}.npy",
+    }))
+
+
+def test_vector_index_matches_brute_force_cosine(tmp_path):
+    import numpy as np
+    from utils.vector_index import MmapVectorIndex
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16))
+    ids = list(range(1000, 1500))
+    _publish_index(tmp_path, 1, ids, vectors)
+
+    query = rng.normal(size=16)
+    got_ids, got_sims = MmapVectorIndex(str(tmp_path)).search(query.tolist(), k=5)
+
+    cos = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    expected = [ids[i] for i in np.argsort(-cos)[:5]]
+    assert got_ids == expected
+    assert np.allclose(got_sims, np.sort(cos)[::-1][:5], atol=1e-5)
+
+
+def test_vector_index_float16_and_version_swap(tmp_path):
+    from utils.vector_index import MmapVectorIndex
+
+    _publish_index(tmp_path, 1, [1, 2], [[1.0, 0.0], [0.0, 1.0]], dtype="float16")
+    index = MmapVectorIndex(str(tmp_path), refresh_seconds=3600)
+    assert index.search([1.0, 0.1], k=1)[0] == [1]
+
+    _publish_index(tmp_path, 2, [7, 8], [[0.0, 1.0], [1.0, 0.0]])
+    assert index.search([1.0, 0.1], k=1)[0] == [1]      # not re-checked yet
+    index.refresh(force=True)
+    assert index.search([1.0, 0.1], k=1)[0] == [8]
+    assert index.stats()["loaded_version"] == 2
+
+
+def test_vector_index_stale_falls_back(tmp_path, monkeypatch):
+    import utils.catalog_version as cv
+    import utils.vector_index as vi
+
+    _publish_index(tmp_path, 1, [1], [[1.0, 0.0]])
+    monkeypatch.setattr(cv, "get_catalog_version", lambda engine: 2)
+    monkeypatch.setattr(vi.MmapVectorIndex, "_rebuild", lambda self: None)
+    index = vi.MmapVectorIndex(str(tmp_path), engine=object())
+    assert index.search([1.0, 0.0], k=1) is None
+    assert index.stats()["stale_fallbacks"] == 1
+
+
+def test_vector_index_rebuild_exports_once_and_maps(tmp_path, monkeypatch):
+    import json
+
+    import utils.vector_index as vi
+
+    exports = []
+
+    def fake_export(engine, directory, version, dtype="float32"):
+        exports.append(version)
+        _publish_index(tmp_path, version, [5], [[0.0, 1.0]])
+        return json.loads((tmp_path / "manifest.json").read_text())
+
+    monkeypatch.setattr(vi, "export_vector_index", fake_export)
+    index = vi.MmapVectorIndex(str(tmp_path))
+    index._load_snapshot(object(), 3)
+    index._load_snapshot(object(), 3)                     # ya publicado por otro worker
+    assert exports == [3]
+    assert index.loaded_version == 3 and index.search([0.0, 1.0], k=1)[0] == [5]
+
+
+# ── In-process trigram index (pg_trgm equivalence) ──────────────────
+# Expected pg_trgm similarity() values (word/two words is the PostgreSQL docs example;
+# the rest follow from show_trgm: 2 leading + 1 trailing pad per word).
+_PG_TRGM_CASES = [
+    ("word", "two words", 0.36363637),
+    ("cat", "cat", 1.0),
+    ("café", "cafe", 0.42857143),
+    ("Queso Panela", "queso panela lala", 0.7647059),
+    ("aceite", "Aceite de Oliva", 0.4375),
+    ("", "queso", 0.0),
+    ("!!!", "queso", 0.0),
+]
+
+_NAMES = [
+    "Queso Panela Lala 400g", "Queso Oaxaca", "Aceite de Oliva Extra Virgen",
+    "Aceite vegetal 1L", "Leche entera", "Leche deslactosada", "Crema ácida",
+    "Mantequilla Gloria", "Queso manchego", "Tortillas de maíz", "Jamón de pavo",
+]
+
+
+def test_trigrams_match_show_trgm():
+    from utils.trigram_index import trigrams
+
+    assert trigrams("cat") == {"  c", " ca", "cat", "at "}
+    assert trigrams("foo_bar") == trigrams("foo bar")          # _ is not a word char
+    assert trigrams("Word") == trigrams("word")
+
+
+@pytest.mark.parametrize("a,b,expected", _PG_TRGM_CASES)
+def test_similarity_matches_pg_trgm(a, b, expected):
+    from utils.trigram_index import similarity
+
+    assert similarity(a, b) == pytest.approx(expected, abs=1e-6)
+
+
+@pytest.mark.parametrize("query", ["queso", "aceite oliva", "leche", "gloria", "xyz", "tortilla maiz"])
+def test_trigram_index_equals_brute_force(query):
+    from utils.trigram_index import TrigramIndex, similarity
+
+    ids = list(range(len(_NAMES))) + [100]
+    texts = _NAMES + ["Queso Oaxaca"]                          # duplicate text, different id
+    got_ids, got_sims = TrigramIndex(texts, ids).search(query, threshold=0.3)
+
+    expected = {i: similarity(t, query) for i, t in zip(ids, texts) if similarity(t, query) >= 0.3}
+    assert dict(zip(got_ids.tolist(), got_sims.tolist())) == pytest.approx(expected)
+    assert list(got_sims) == sorted(got_sims, reverse=True)
+
+
+def test_catalog_trigram_index_products_and_providers():
+    from utils.trigram_index import CatalogTrigramIndex, similarity
+
+    index = CatalogTrigramIndex()
+    index.load(
+        1,
+        productos=[(1, "Queso Panela", "Lala"), (2, "Leche entera", "Lala"), (3, "Aceite", "")],
+        proveedores=[(10, "La Ranita"), (11, "Distribuidora López")],
+    )
+    ids, sims = index.search_products("lala")
+    assert set(ids) == {1, 2}                                  # matched on marca
+    assert sims[0] == pytest.approx(similarity("Lala", "lala"))
+
+    assert index.resolve_provider("la ranita")[0][0] == 10
+    assert index.resolve_provider("zzz") == []
+
+
+@pytest.mark.skipif(not __import__("os").getenv("PG_TRGM_TEST_URL"), reason="PG_TRGM_TEST_URL not set")
+def test_similarity_equivalence_against_live_pg_trgm():
+    """Opt-in: compares every pair in _NAMES × queries against a real pg_trgm."""
+    import os
+    from sqlalchemy import create_engine, text
+    from utils.normalize_db_url import normalize_db_url
+    from utils.trigram_index import similarity
+
+    engine = create_engine(normalize_db_url(os.environ["PG_TRGM_TEST_URL"]))
+    queries = ["queso", "aceite oliva", "leche", "gloria", "maíz", "crema acida"]
+    with engine.connect() as conn:
+        for name in _NAMES + [a for a, _, _ in _PG_TRGM_CASES]:
+            for q in queries:
+                pg = conn.execute(text("SELECT similarity(:a, :b)"), {"a": name, "b": q}).scalar_one()
+                assert similarity(name, q) == pytest.approx(pg, abs=1e-6), (name, q)
+
+
+# ── Search result cache ─────────────────────────────────────────────
+def test_result_cache_key_normalizes_query_and_filters():
+    from chat.services.result_cache import SearchResultCache
+
+    a = SearchResultCache.make_key("hybrid", "Queso  Panela", marca="Lala", precio_max=150.0, top_k=25)
+    b = SearchResultCache.make_key("hybrid", "queso panela ", top_k=25, precio_max="150", marca="LALA")
+    c = SearchResultCache.make_key("price", "queso panela", marca="Lala", precio_max=150.0, top_k=25)
+    assert a == b
+    assert a != c
+
+
+def test_result_cache_hits_and_saved_ms():
+    from chat.services.result_cache import SearchResultCache
+
+    cache = SearchResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [("row",)]
+
+    assert cache.get_or_compute("k", compute) == [("row",)]
+    assert cache.get_or_compute("k", compute) == [("row",)]
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["hit_ratio"] == 0.5
+    assert stats["saved_ms"] >= 0
+
+
+def test_result_cache_invalidates_on_catalog_version_change():
+    from chat.services.result_cache import SearchResultCache
+
+    version = [1]
+    cache = SearchResultCache(poll_seconds=0)
+    cache.set_version_source(lambda: version[0])
+    cache.get_or_compute("k", lambda: ["v1"])
+    assert cache.get("k") == ["v1"]
+
+    version[0] = 2                                    # ingest bumped catalog_version
+    assert cache.get("k") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_result_cache_drops_result_computed_across_a_version_bump():
+    from chat.services.result_cache import SearchResultCache
+
+    cache = SearchResultCache()
+    cache.on_catalog_version(1)
+
+    def compute():
+        cache.on_catalog_version(2)                   # NOTIFY arrives mid-query
+        return ["stale"]
+
+    assert cache.get_or_compute("k", compute) == ["stale"]
+    assert cache.get("k") is None
+
+
+def test_result_cache_bounded_by_bytes():
+    from chat.services.result_cache import SearchResultCache
+
+    cache = SearchResultCache(max_bytes=2000)
+    for i in range(50):
+        cache.put(f"k{i}", [("x" * 100,)])
+    assert cache.stats()["bytes"] <= 2000
+    assert cache.stats()["evictions"] > 0
+
+
+# ── Search cursor ("mostrar más" by id) ─────────────────────────────
+def _cursor_fixture(n_providers=5, shown=3):
+    from chat.services.search_cursor import build_search_cursor
+
+    productos = [{"id": i, "proveedor_id": 100 + i % n_providers} for i in range(2 * n_providers)]
+    proveedores = [{"proveedor_id": 100 + i} for i in range(n_providers)]
+    return build_search_cursor("Aceite de oliva", None, proveedores, productos, shown=shown)
+
+
+def test_search_cursor_pages_by_id():
+    from chat.services.search_cursor import next_page, remaining
+
+    cursor = _cursor_fixture()
+    provider_ids, product_ids, cursor = next_page(cursor, "aceite de oliva", page_size=10, ttl_seconds=60)
+    assert provider_ids == [103, 104]
+    assert product_ids == [3, 8, 4, 9]
+    assert remaining(cursor) == 0
+    assert next_page(cursor, "aceite de oliva", page_size=10, ttl_seconds=60)[0] == []
+
+
+def test_search_cursor_rejects_expired_or_other_product():
+    from chat.services.search_cursor import next_page
+
+    cursor = _cursor_fixture()
+    assert next_page(cursor, "aceite", 10, 60) is not None            # abbreviated product
+    assert next_page(cursor, "queso", 10, 60) is None
+    assert next_page(cursor, "aceite de oliva", 10, 60, now=cursor["created_at"] + 61) is None
+    assert next_page(None, "aceite", 10, 60) is None
+
+
+def test_search_cursor_resolves_typed_provider_names():
+    from chat.services.search_cursor import build_search_cursor, provider_id_for
+
+    proveedores = [
+        {"proveedor_id": 1, "proveedor": "Distribuidora La Ranita"},
+        {"proveedor_id": 2, "proveedor": "Abarrotes López"},
+        {"proveedor_id": 3, "proveedor": "López Hermanos"},
+    ]
+    cursor = build_search_cursor("aceite", None, proveedores, [], shown=3)
+    assert provider_id_for(cursor, "la ranita") == 1
+    assert provider_id_for(cursor, "lopez abarrotes") == 2
+    assert provider_id_for(cursor, "López") is None                   # ambiguo
+    assert provider_id_for(cursor, "Quesos Finos") is None
+    assert provider_id_for(None, "la ranita") is None
+
+
+# ── Provider directory ──────────────────────────────────────────────
+def _provider_row(id_, nombre, whatsapp="", cal=None, web=None):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(
+        id_proveedor=id_, nombre_comercial=nombre, descripcion=None,
+        nombre_ejecutivo_ventas="Ana", whatsapp_ventas=whatsapp, pagina_web=web,
+        nivel_membresia=1, calificacion_usuarios=cal,
+    )
+
+
+def test_provider_directory_exact_and_fuzzy_resolution():
+    from chat.services.provider_directory import ProviderDirectory
+
+    directory = ProviderDirectory()
+    directory.load(1, [_provider_row(10, "La Ranita"), _provider_row(11, "Distribuidora López")])
+
+    assert directory.resolve("lopez distribuidora")[0]["proveedor_id"] == 11   # accents + token order
+    assert directory.resolve("lopez distribuidora")[0]["sim"] == 1.0
+    fuzzy = directory.resolve("ranitas")
+    assert fuzzy[0]["proveedor_id"] == 10 and 0.3 <= fuzzy[0]["sim"] < 1.0
+    assert directory.resolve("zzz") == []
+    assert directory.stats()["exact_hits"] == 2
+
+
+def test_provider_directory_prerenders_card():
+    from chat.services.provider_directory import ProviderDirectory
+
+    directory = ProviderDirectory()
+    directory.load(1, [_provider_row(10, "La Ranita", "33 1234 5678, 3312345678", cal=4.5, web="ranita.mx")])
+    entry = directory.resolve("La Ranita")[0]
+
+    assert entry["whatsapp_ventas"] == ["523312345678"]
+    assert entry["calificacion_texto"] == "⭐⭐⭐⭐ (4.5/5)"
+    assert "· WhatsApp: +52 33 1234 5678" in entry["card"]
+    assert "· 💬 Contactar: https://wa.me/523312345678" in entry["card"]
+    assert "· 🌐 Web: ranita.mx" in entry["card"]
+
+
+def test_provider_directory_disabled_or_not_loaded_defers_to_db():
+    from chat.services.provider_directory import ProviderDirectory
+
+    assert ProviderDirectory().resolve("La Ranita") is None
+    directory = ProviderDirectory(enabled=False)
+    directory.load(1, [_provider_row(10, "La Ranita")])
+    assert directory.resolve("La Ranita") is None
+
+
+# ── Engine registry ─────────────────────────────────────────────────
+def test_engine_registry_shares_one_pool_per_dsn_and_reports_waits(tmp_path):
+    from sqlalchemy import text
+    from chat.config.database import get_engine, pool_stats
+
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    engine = get_engine(url, pool_size=1, max_overflow=0, pool_timeout=0.05)
+    assert get_engine(url) is engine
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = pool_stats()[url]
+        assert stats["checked_out"] == 1 and stats["pool_size"] == 1
+        with pytest.raises(Exception):
+            engine.connect()                                      # pool exhausted → timeout
+    stats = pool_stats()[url]
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 1
+    assert stats["checkouts"] == 2 and stats["wait_ms_max"] >= 40
+    engine.dispose()
+
+
+def test_catalog_copies_without_engine_use_the_shared_pool(tmp_path, monkeypatch):
+    import os
+    from chat.config.database import get_engine, pool_stats
+    from chat.config.settings import Settings
+    from utils import vector_index
+
+    url = f"sqlite:///{tmp_path / 'shared.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    monkeypatch.setenv("VECTOR_INDEX_ENABLED", "true")
+    monkeypatch.setenv("VECTOR_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_index, "_default_index", None)
+
+    index = vector_index.get_vector_index()
+    assert index._engine is get_engine(url)                  # registro por DSN, no un engine propio
+    assert url in pool_stats()
+    if "DB_POOL_SIZE" not in os.environ:                     # prefetch comparte el pool
+        assert Settings.DB_POOL_SIZE == Settings.SEARCH_RACE_WORKERS + Settings.PREFETCH_WORKERS
+    get_engine(url).dispose()
+
+
+# ── Binary pgvector binding ─────────────────────────────────────────
+def test_vector_param_binary_matches_vector_recv_layout():
+    import struct
+    from utils.pgvector_binary import VectorBinaryDumper, VectorParam
+
+    data = VectorBinaryDumper(VectorParam).dump(VectorParam([1.0, -2.5, 0.125]))
+    dim, unused = struct.unpack(">HH", data[:4])
+    assert (dim, unused) == (3, 0)
+    assert list(struct.unpack(">3f", data[4:])) == [1.0, -2.5, 0.125]
+    assert len(data) == 4 + 4 * 3
+
+
+def test_vector_param_falls_back_to_text_literal_without_vector_type():
+    from psycopg.adapt import PyFormat, Transformer
+    from utils.pgvector_binary import VectorParam
+
+    value = VectorParam([0.5, 0.25])
+    assert Transformer().get_dumper(value, PyFormat.AUTO).dump(value) == b"[0.5,0.25]"
+    ids = [1, 2, 3]                                      # id arrays keep the default list adapter
+    assert Transformer().get_dumper(ids, PyFormat.AUTO).dump(ids) != b"[1,2,3]"
+
+
+def test_search_sql_binds_the_embedding_once(monkeypatch):
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+    from utils.pgvector_binary import VectorParam
+
+    captured = []
+
+    class _Conn:
+        def execute(self, sql, params):
+            captured.append((str(sql), params))
+            return type("R", (), {"fetchall": lambda self: []})()
+
+    @contextmanager
+    def _conn():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(node, "_search_connection", _conn)
+    monkeypatch.setattr(node, "_local_trigram_candidates", lambda q: None)
+    monkeypatch.setattr(node, "_local_vector_candidates", lambda e, filtered=False: None)
+    monkeypatch.setattr(query, "generar_embedding", lambda q: [0.1] * 4)
+    monkeypatch.setattr(query.search_cascade, "enabled", False)
+    node._run_hybrid_search("queso", None, None, None, 10, None, "score", [0.1] * 4)
+    node._price_search_rows("queso", None, 10, None, None)
+
+    for sql, params in captured:
+        assert sql.count(":embedding") == 1
+        assert isinstance(params["embedding"], VectorParam)
+
+
+# ── Embedding storage mode ──────────────────────────────────────────
+def test_embedding_storage_types_and_api_dimensions(monkeypatch):
+    from utils import embedding_storage as es
+
+    assert (es.column_type(), es.cosine_opclass(), es.api_dimensions(), es.model_key()) == (
+        "vector(1536)", "vector_cosine_ops", None, "text-embedding-ada-002",
+    )
+    monkeypatch.setattr(es, "EMBEDDING_MODEL", "text-embedding-3-small")
+    monkeypatch.setattr(es, "EMBEDDING_DIMENSIONS", 512)
+    monkeypatch.setattr(es, "EMBEDDING_STORAGE", "halfvec")
+    assert (es.column_type(), es.cosine_opclass(), es.api_dimensions(), es.model_key()) == (
+        "halfvec(512)", "halfvec_cosine_ops", 512, "text-embedding-3-small@512",
+    )
+    monkeypatch.setattr(es, "EMBEDDING_MODEL", "text-embedding-ada-002")
+    with pytest.raises(ValueError):
+        es.api_dimensions()                                   # ada-002 cannot shorten
+
+
+@pytest.mark.parametrize("current, target, plan", [
+    (("vector(1536)", None), ("vector(1536)", "text-embedding-ada-002"), "none"),
+    (("vector(1536)", None), ("halfvec(1536)", "text-embedding-ada-002"), "cast"),
+    (("vector(1536)", "text-embedding-3-small"), ("halfvec(512)", "text-embedding-3-small@512"), "truncate"),
+    (("vector(1536)", None), ("halfvec(512)", "text-embedding-3-small@512"), "reembed"),
+    (("halfvec(512)", "text-embedding-3-small@512"), ("vector(1536)", "text-embedding-3-small"), "reembed"),
+])
+def test_embedding_migration_plan(current, target, plan):
+    from ingest.migrate_embeddings import plan_migration
+
+    assert plan_migration(
+        {"type": current[0], "model": current[1]}, {"type": target[0], "model": target[1]}
+    ) == plan
+
+
+# ── Binary quantization + rerank ────────────────────────────────────
+def test_binary_code_matches_binary_quantize():
+    from utils.embedding_storage import binary_code, binary_column_type
+
+    assert binary_code([0.3, -0.1, 0.0, 1e-9, -2.0]) == "10010"   # > 0 → 1, como pgvector
+    assert binary_code(None) is None
+    assert binary_column_type() == "bit(1536)"
+
+
+def test_binary_rerank_mode_adds_hamming_first_pass(monkeypatch):
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+
+    captured = []
+
+    class _Conn:
+        def execute(self, sql, params):
+            captured.append((str(sql), params))
+            return type("R", (), {"fetchall": lambda self: []})()
+
+    @contextmanager
+    def _conn():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(query.settings, "VECTOR_SEARCH_MODE", "binary_rerank")
+    monkeypatch.setattr(node, "_search_connection", _conn)
+    monkeypatch.setattr(node, "_local_trigram_candidates", lambda q: None)
+    monkeypatch.setattr(node, "_local_vector_candidates", lambda e, filtered=False: None)
+    node._run_hybrid_search("queso", "Lala", None, None, 10, None, "score", [0.1] * 4)
+
+    sql, params = captured[0]
+    assert "embedding_bq <~> binary_quantize" in sql
+    assert "FROM bq JOIN productos p" in sql
+    assert sql.count(":embedding") == 1
+    assert sql.count("LOWER(p.marca) = LOWER(:marca)") == 3        # trgm, bq y vec
+    assert params["bq_candidates"] == query.settings.VECTOR_BQ_CANDIDATES
+
+
+
+def test_binary_codes_and_hamming_index_only_in_binary_rerank_mode(monkeypatch, caplog):
+    from ingest import indexes
+
+    class _Engine:
+        def __init__(self):
+            self.calls = 0
+
+        def begin(self):
+            self.calls += 1
+            raise RuntimeError("function binary_quantize(vector) does not exist")   # pgvector < 0.7
+
+    engine = _Engine()
+    monkeypatch.setattr(indexes, "BINARY_RERANK", False)
+    indexes.ensure_binary_codes(engine)
+    assert engine.calls == 0                                   # modo exact: ni columna ni backfill
+    assert indexes.BINARY_INDEX not in indexes.search_indexes()
+
+    monkeypatch.setattr(indexes, "BINARY_RERANK", True)
+    indexes.ensure_binary_codes(engine)                        # el error se registra, no rompe la ingesta
+    assert engine.calls == 1
+    assert "códigos binarios" in caplog.text
+    assert indexes.search_indexes()[-1] == indexes.BINARY_INDEX
+
+
+# ── Spanish normalization ───────────────────────────────────────────
+@pytest.mark.parametrize("variants", [
+    ("Aceíte", "aceites", "ACEITE"),
+    ("Aceite 1LT", "aceites de 1 litro", "aceite 1 lt"),
+    ("Queso Oaxaca 1 Kilo", "quesos oaxaca 1kg", "QUESO OAXACA 1 KGS"),
+    ("Tortillas de maíz 12 pzas", "tortilla maiz 12 piezas"),
+    ("Nueces", "nuez"),
+    ("Azúcar 2,5 kg", "azucar 2.5 kilos"),
+])
+def test_normalize_text_folds_equivalent_spellings(variants):
+    from utils.spanish_normalizer import normalize_text
+
+    assert len({normalize_text(v) for v in variants}) == 1
+
+
+def test_normalize_text_keeps_meaningful_words():
+    from utils.spanish_normalizer import normalize_text
+
+    assert normalize_text("Leche sin lactosa") == "lech sin lactos"      # "sin" no es vacía
+    assert normalize_text("de la") == "de la"                            # solo vacías: se conservan
+    assert normalize_text(None) == ""
+
+
+def test_result_cache_key_uses_normalized_query():
+    from chat.services.result_cache import SearchResultCache
+
+    assert SearchResultCache.make_key("hybrid", "Aceítes 1LT", top_k=25) == \
+        SearchResultCache.make_key("hybrid", "aceite 1 litro", top_k=25)
+
+
+def test_hybrid_search_matches_normalized_columns(monkeypatch):
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+
+    captured = []
+
+    class _Conn:
+        def execute(self, sql, params):
+            captured.append((str(sql), params))
+            return type("R", (), {"fetchall": lambda self: []})()
+
+    @contextmanager
+    def _conn():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(node, "_search_connection", _conn)
+    monkeypatch.setattr(node, "_local_trigram_candidates", lambda q: None)
+    monkeypatch.setattr(node, "_local_vector_candidates", lambda e, filtered=False: None)
+    node._run_hybrid_search("Aceites de Oliva", None, None, None, 10, None, "score", [0.1] * 4)
+
+    sql, params = captured[0]
+    assert "p.nombre_norm % :q" in sql and "similarity(p.marca_norm, :q)" in sql
+    assert "similarity(p.nombre_producto" not in sql
+    assert params["q"] == "aceit oliv"
+
+
+
+@pytest.mark.parametrize("normalized, kept, dropped", [
+    (True, "ix_prod_nombre_norm_trgm", "ix_prod_nombre_trgm"),
+    (False, "ix_prod_nombre_trgm", "ix_prod_nombre_norm_trgm"),
+])
+def test_only_the_trigram_pair_of_the_search_mode_is_built(monkeypatch, normalized, kept, dropped):
+    from ingest import indexes
+
+    monkeypatch.setattr(indexes, "NORMALIZED_SEARCH", normalized)
+    names = [name for _, name, _ in indexes.search_indexes()]
+    trigram = [n for _, n, d in indexes.search_indexes() if "gin_trgm_ops" in d]
+    assert kept in names and dropped not in names
+    assert len([n for n in trigram if n.startswith("ix_prod_")]) == 2
+
+    conn = _IndexConn({name: True for name in names} | {dropped: True})
+    indexes.ensure_search_indexes(type("E", (), {"connect": lambda self: conn})())
+    assert f"DROP INDEX CONCURRENTLY IF EXISTS {dropped}" in conn.ddl
+    assert not any(sql.startswith("CREATE INDEX") for sql in conn.ddl)
+
+
+# ── Spelling correction ─────────────────────────────────────────────
+_SPELL_CATALOG = [
+    "Mantequilla sin sal 90 g", "Queso mozzarella rallado 1 kg", "Jamón de pavo",
+    "Aceite de oliva extra virgen", "Tortillas de maíz", "Champiñones rebanados",
+] * 3
+
+
+def test_osa_distance_counts_transpositions():
+    from utils.spell_corrector import osa_distance
+
+    assert osa_distance("mozarela", "mozzarella", 2) == 2
+    assert osa_distance("qeuso", "queso", 2) == 1                      # transposición
+    assert osa_distance("aceite", "harina", 2) == 3                    # > max → max + 1
+
+
+def test_symspell_prefers_closest_then_most_frequent():
+    from utils.spell_corrector import SymSpell
+
+    symspell = SymSpell({"queso": 10, "quesos": 1, "pavo": 5, "palo": 50})
+    assert symspell.lookup("qeuso") == ("queso", 1)
+    assert symspell.lookup("pabo", 1) == ("palo", 1)                    # empate: más frecuente
+    assert symspell.lookup("zzzz") is None
+
+
+def test_catalog_spell_corrector_rewrites_unknown_words_only():
+    from utils.spell_corrector import CatalogSpellCorrector, vocabulary_counts
+
+    corrector = CatalogSpellCorrector()
+    assert corrector.correct("mantequia") is None                      # sin cargar → sin cambios
+    corrector.load(1, vocabulary_counts(_SPELL_CATALOG))
+
+    fixed = corrector.correct("mantequia y mozarela")
+    assert fixed["corrected"] == "mantequilla y mozzarella"
+    assert fixed["words"] == [("mantequia", "mantequilla"), ("mozarela", "mozzarella")]
+    assert corrector.correct("jamn de pavo")["corrected"] == "jamón de pavo"   # forma del catálogo
+    assert corrector.correct("jamon") is None                          # sin acento: ya está
+    assert corrector.correct("champinones") is None                    # ya está (sin acentos)
+    assert corrector.correct("aceite 1 kg") is None
+
+
+def test_buscar_productos_searches_corrected_query_only_after_no_results(monkeypatch):
+    from chat.agent import tools
+    from utils.spell_corrector import CatalogSpellCorrector, vocabulary_counts
+
+    corrector = CatalogSpellCorrector()
+    corrector.load(1, vocabulary_counts(_SPELL_CATALOG))
+    searched = []
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: corrector)
+    monkeypatch.setattr(
+        tools._qn, "_execute_plan", lambda plan, min_score=None, top_k=25: searched.append(plan["search_query"]) or []
+    )
+
+    out = tools.buscar_productos.func(producto="mozarela", tool_call_id="t1")
+    assert searched == ["mozarela", "mozzarella"]                      # original primero
+    assert out.startswith("NO_RESULTS") and "¿Quisiste decir mozzarella?" in out
+
+
+def test_spell_correction_never_replaces_a_query_with_results(monkeypatch):
+    from chat.agent import tools
+    from utils.spell_corrector import CatalogSpellCorrector, vocabulary_counts
+
+    corrector = CatalogSpellCorrector()
+    corrector.load(1, vocabulary_counts(["Pulpa de tamarindo", "Pasta corta"] * 3))
+    assert corrector.correct("pulpo")["corrected"] == "pulpa"           # la corrección existe...
+    searched = []
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: corrector)
+    monkeypatch.setattr(
+        tools._qn, "_execute_price_search",
+        lambda q, marca=None, precio_max=None: searched.append(q) or [{
+            "producto": "Pulpo cocido", "marca": "", "presentacion": "", "proveedor": "Mariscos Sol",
+            "precio_formateado": "$300.00 MXN", "precio_unidad": 300.0,
+        }],
+    )
+
+    out = tools.filtrar_por_precio.func(producto="pulpo")
+    assert searched == ["pulpo"]                                       # ...pero no se usa
+    assert "CORRECCIÓN" not in out and "Pulpo cocido" in out
+
+
+# ── Early-exit search cascade ───────────────────────────────────────
+def _cascade_node(monkeypatch, rows_by_stage):
+    """QueryNode whose connection answers each SQL with rows_by_stage[stage]."""
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+
+    executed, embedded = [], []
+
+    class _Conn:
+        def execute(self, sql, params):
+            sql = str(sql)
+            executed.append(sql)
+            if "LIKE :q_prefix" in sql:
+                rows = rows_by_stage.get("exact", [])
+            elif "0.0::float AS vec_sim" in sql:
+                rows = rows_by_stage.get("trigram", [])
+            else:
+                rows = rows_by_stage.get("hybrid", [])
+            return type("R", (), {"fetchall": lambda self: rows})()
+
+    @contextmanager
+    def _conn():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(node, "_search_connection", _conn)
+    monkeypatch.setattr(node, "_local_trigram_candidates", lambda q, threshold=None: None)
+    monkeypatch.setattr(node, "_local_vector_candidates", lambda e, filtered=False: None)
+    monkeypatch.setattr(query, "generar_embedding", lambda q: embedded.append(q) or [0.1] * 4)
+    monkeypatch.setattr(query.search_cascade, "_answered", {})
+    return node, executed, embedded
+
+
+def test_cascade_exact_stage_skips_embedding(monkeypatch):
+    from chat.services.search_cascade import search_cascade
+
+    node, executed, embedded = _cascade_node(monkeypatch, {"exact": ["r1", "r2", "r3"]})
+    assert node._run_hybrid_search("Queso Oaxaca", None, None, None, 25, None, "score", None) == ["r1", "r2", "r3"]
+    assert embedded == [] and len(executed) == 1
+    assert "p.nombre_norm = :q OR p.nombre_norm LIKE :q_prefix" in executed[0]
+    assert search_cascade.stats()["answered"]["hybrid"]["exact"] == 1
+
+
+def test_cascade_trigram_stage_raises_pg_trgm_threshold(monkeypatch):
+    node, executed, embedded = _cascade_node(monkeypatch, {"exact": ["r1"], "trigram": ["a", "b", "c"]})
+    assert node._price_search_rows("queso oaxaca", None, 10, None, None) == ["a", "b", "c"]
+    assert embedded == []
+    assert any("pg_trgm.similarity_threshold', :thr" in sql for sql in executed)
+    assert "ORDER BY precio_unidad ASC" in executed[-1] and "AS relevance_score" in executed[-1]
+
+
+def test_cascade_falls_through_to_embedding_and_records_hybrid(monkeypatch):
+    from chat.services.search_cascade import search_cascade
+
+    node, executed, embedded = _cascade_node(monkeypatch, {"exact": ["r1"], "trigram": ["r1", "r2"]})
+    node._run_hybrid_search("queso", None, None, None, 25, None, "score", None)
+    assert embedded == ["queso"]
+    assert search_cascade.stats()["answered"]["hybrid"] == {"exact": 0, "trigram": 0, "hybrid": 1}
+
+    # top_k smaller than CASCADE_MIN_ROWS: fewer rows are enough
+    node, executed, embedded = _cascade_node(monkeypatch, {"exact": ["r1"]})
+    assert node._run_hybrid_search("queso", None, None, None, 1, None, "score", None) == ["r1"]
+    assert embedded == []
+
+
+# ── Relevance threshold and provider cap in SQL ─────────────────────
+def test_hybrid_sql_filters_score_and_caps_rows_per_provider(monkeypatch):
+    from chat.graph.nodes import query
+
+    monkeypatch.setattr(query.search_cascade, "enabled", False)
+    node, executed, embedded = _cascade_node(monkeypatch, {"hybrid": ["r1"]})
+    node._run_hybrid_search("queso", None, None, None, 25, None, "score", None, 0.55)
+    sql = executed[-1]
+    assert "AND score >= :min_score" in sql
+    assert "ROW_NUMBER() OVER (PARTITION BY s.id_proveedor ORDER BY score DESC)" in sql
+    assert sql.index("provider_rank <= :per_provider") < sql.index("LIMIT :top_k")
+
+    monkeypatch.setattr(query.settings, "SEARCH_ROWS_PER_PROVIDER", 0)
+    node._run_hybrid_search("queso", None, None, None, 25, None, "score", None)
+    assert "PARTITION BY" not in executed[-1] and ":min_score" not in executed[-1]
+
+
+def test_cascade_applies_provider_cap(monkeypatch):
+    node, executed, embedded = _cascade_node(monkeypatch, {"exact": ["r1", "r2", "r3"]})
+    rows = node._lexical_cascade(
+        "hybrid", {"q": "queso", "top_k": 25, "min_score": 0.9, "per_provider": 3},
+        "", "p.id, pr.id_proveedor", "score", "score DESC",
+    )
+    assert rows == ["r1", "r2", "r3"] and embedded == []
+    assert "PARTITION BY s.id_proveedor" in executed[0]
+
+
+def test_buscar_productos_pushes_threshold_into_sql(monkeypatch):
+    from chat.agent import tools
+
+    calls = []
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: None)
+    monkeypatch.setattr(tools._qn, "_execute_plan", lambda plan, min_score=None, top_k=25: calls.append(min_score) or [])
+    tools.buscar_productos.func(producto="aceite de oliva", tool_call_id="t1")
+    assert calls == [tools.settings.RELEVANCE_THRESHOLD]
+
+
+# ── Brand facets ────────────────────────────────────────────────────
+def _facet_row(marca, ids, provider_ids):
+    from collections import namedtuple
+
+    row = namedtuple("FacetRow", "marca productos proveedores ids provider_ids")
+    return row(
+        marca=marca, productos=len(ids), proveedores=len(set(provider_ids)),
+        ids=ids, provider_ids=provider_ids,
+    )
+
+
+def _product_row(id_, marca, proveedor):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(
+        id=id_, id_producto_csv=None, nombre_producto=f"Aceite {marca}", marca=marca,
+        presentacion_venta="1 l", unidad_venta="pza", precio_unidad=50, moneda="MXN", impuesto=None,
+        score=0.8, trgm_sim=0.8, vec_sim=0.0, **vars(_provider_row(proveedor, f"Prov {proveedor}")),
+    )
+
+
+def test_brand_candidate_ids_caps_per_provider():
+    from chat.services.brand_facets import brand_candidate_ids, facet_from_row, format_facets
+
+    facets = [facet_from_row(_facet_row("Capullo", [1, 2, 3, 4], [10, 10, 10, 20]))]
+    assert brand_candidate_ids(facets, "CAPÚLLO", per_provider=2) == [1, 2, 4]
+    assert brand_candidate_ids(facets, "capullo", limit=2) == [1, 2]
+    assert brand_candidate_ids(facets, "Oleica") is None
+    assert format_facets(facets) == "Capullo (4 productos, 2 proveedores)"
+
+
+def test_brand_facets_aggregate_candidate_set_in_sql(monkeypatch):
+    node, executed, embedded = _cascade_node(monkeypatch, {"hybrid": [_facet_row("Capullo", [1], [10])]})
+    rows = node._run_brand_facets("aceite", 0.55)
+    assert len(rows) == 1 and embedded == ["aceite"]
+    sql = executed[-1]
+    assert "AND score >= :min_score" in sql and "LIMIT :facet_limit" in sql
+    assert "array_agg(c.id ORDER BY c.score DESC) AS ids" in sql and "GROUP BY TRIM(c.marca)" in sql
+
+
+def test_buscar_productos_brand_follow_up_filters_cached_facets(monkeypatch):
+    from chat.agent import tools
+    from chat.graph.nodes import query
+    from chat.services.result_cache import SearchResultCache
+
+    monkeypatch.setattr(query, "search_result_cache", SearchResultCache())
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: None)
+    plans, fetched = [], []
+    monkeypatch.setattr(
+        tools._qn, "_execute_plan",
+        lambda plan, min_score=None, top_k=25: plans.append(plan) or [_product_row(1, "Capullo", 10), _product_row(2, "Oleica", 20)],
+    )
+    monkeypatch.setattr(
+        tools._qn, "_run_brand_facets",
+        lambda q, min_score: [_facet_row("Capullo", [1, 3, 5], [10, 30, 30]), _facet_row("Oleica", [2], [20])],
+    )
+    out = tools.buscar_productos.func(producto="aceite", tool_call_id="t1")
+    assert out.startswith("BRANDS_FOUND: Se encontraron 3 proveedores de 'aceite' en 2 marcas")
+    assert "Capullo (3 productos, 2 proveedores), Oleica (1 producto, 1 proveedor)" in out
+
+    monkeypatch.setattr(
+        tools._qn, "_fetch_products_by_ids",
+        lambda ids: fetched.append(ids) or [_product_row(i, "Capullo", p) for i, p in ((1, 10), (3, 30), (5, 30))],
+    )
+    tools.buscar_productos.func(producto="aceite", marca="capullo", tool_call_id="t2")
+    assert fetched == [[1, 3, 5]] and len(plans) == 1
+
+
+# ── Session candidate set ───────────────────────────────────────────
+def test_session_candidates_match_same_concept_and_expire():
+    import time
+
+    from chat.services.session_candidates import SessionCandidateStore
+
+    store = SessionCandidateStore(ttl_seconds=60)
+    rows = [_product_row(1, "Capullo", 10)]
+    store.put("s1", "Aceite de Oliva", rows)
+    assert store.get("s1", "aceites de oliva") == rows         # normalized: same concept
+    assert store.get("s1", "aceite de oliva extra virgen") is None
+    assert store.get("s2", "aceite de oliva") is None
+    assert store.get("s1", "aceite de oliva", now=time.time() + 61) is None
+    assert store.rows_by_ids("s1", [1]) is None                 # expired above
+
+
+def test_session_candidates_broader_query_misses():
+    from chat.services.session_candidates import SessionCandidateStore
+
+    store = SessionCandidateStore()
+    panela = [_product_row(1, "Lala", 10)]
+    store.put("s1", "queso panela", panela)
+    assert store.get("s1", "queso") is None                     # más amplia: a la BD
+    assert store.get("s1", "Quesos Panela") == panela
+
+def test_session_candidates_serve_brand_and_show_more_but_not_prices(monkeypatch):
+    from chat.agent import tools
+    from chat.services.prefetch import SpeculativePrefetcher
+    from chat.services.session_candidates import SessionCandidateStore
+
+    monkeypatch.setattr(tools, "session_candidates", SessionCandidateStore())
+    monkeypatch.setattr(tools, "prefetcher", SpeculativePrefetcher(enabled=False))
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: None)
+    rows = [_product_row(i, "Capullo" if i % 2 else "Oleica", 10 + i) for i in range(1, 9)]
+    for i, row in enumerate(rows):
+        row.precio_unidad = 100 - 10 * i
+    plans = []
+    monkeypatch.setattr(tools._qn, "_execute_plan", lambda plan, **kw: plans.append(kw) or rows)
+    monkeypatch.setattr(tools._qn, "_execute_brand_facets", lambda *a, **kw: [])
+    for name in ("_execute_hybrid_search", "_fetch_products_by_ids", "_execute_brand_search"):
+        monkeypatch.setattr(tools._qn, name, lambda *a, **kw: pytest.fail("searched the catalog again"))
+    price_searches = []
+    monkeypatch.setattr(
+        tools._qn, "_execute_price_search",
+        lambda q, marca=None, precio_max=None: price_searches.append((q, marca, precio_max)) or [
+            tools._transformer.row_to_precio(r) for r in sorted(rows, key=lambda r: r.precio_unidad)
+        ],
+    )
+    state = {"session_id": "s1"}
+
+    out = tools.buscar_productos.func(producto="aceite de oliva", tool_call_id="t1", state=state)
+    assert out.startswith("BRANDS_FOUND")
+
+    cmd = tools.buscar_productos.func(producto="Aceites de oliva", marca="capullo", tool_call_id="t2", state=state)
+    cursor = cmd.update["search_cursor"]
+    assert [pids[0] for pids in cursor["product_ids"]] == [1, 3, 5, 7]
+
+    out = tools.filtrar_por_precio.func(producto="aceite de oliva", state=state)
+    assert price_searches == [("aceite de oliva", None, None)]        # uncapped price search
+    assert out.index("$30.00") < out.index("$100.00") and "Prov 18" in out
+
+    cmd = tools.mostrar_mas_proveedores.func(
+        producto="aceite", state={**state, "search_cursor": cursor}, tool_call_id="t3"
+    )
+    assert "Prov 17" in cmd.update["messages"][0].content
+    assert plans == [{"min_score": tools._RELEVANCE_THRESHOLD, "top_k": tools._SEARCH_TOP_K}]
+
+
+# ── Speculative prefetch ────────────────────────────────────────────
+def test_prefetch_take_waits_for_in_flight_work_and_counts_waste():
+    import threading
+
+    from chat.services.prefetch import SpeculativePrefetcher, prefetch_key
+
+    release = threading.Event()
+    prefetcher = SpeculativePrefetcher(max_workers=1, ttl_seconds=60)
+    assert prefetcher.schedule("s1", "precios", prefetch_key("Aceite", None), lambda: release.wait() and ["p"])
+    assert not prefetcher.schedule("s1", "precios", prefetch_key("aceite ", None), lambda: ["dup"])
+    assert prefetcher.schedule("s1", "detalle", prefetch_key("La Ranita"), lambda: {"card": "x"})
+    release.set()
+    assert prefetcher.take("s1", "precios", prefetch_key("aceite", None)) == ["p"]
+    assert prefetcher.take("s2", "precios", prefetch_key("aceite", None)) is None
+
+    prefetcher.ttl_seconds = 0
+    prefetcher._data[("s1", "detalle", "la ranita")][1].result()
+    assert prefetcher.take("s1", "detalle", prefetch_key("La Ranita")) is None   # expired unused
+    stats = prefetcher.stats()["by_kind"]
+    assert stats["precios"]["hits"] == 1 and stats["precios"]["misses"] == 1
+    assert stats["detalle"]["wasted"] == 1 and stats["detalle"]["hit_rate"] == 0.0
+
+
+def test_prefetch_take_gives_up_on_stuck_work():
+    import threading
+
+    from chat.services.prefetch import SpeculativePrefetcher
+
+    release = threading.Event()
+    prefetcher = SpeculativePrefetcher(max_workers=1, wait_seconds=0.05)
+    prefetcher.schedule("s1", "precios", "aceite", lambda: release.wait() and ["late"])
+    assert prefetcher.take("s1", "precios", "aceite") is None             # no bloquea: el llamador calcula
+    release.set()
+    stats = prefetcher.stats()["by_kind"]["precios"]
+    assert stats["timeouts"] == 1 and stats["wasted"] == 1 and stats["hits"] == 0
+
+
+def test_prefetch_empty_result_is_not_a_hit():
+    from chat.services.prefetch import SpeculativePrefetcher
+
+    prefetcher = SpeculativePrefetcher(max_workers=1)
+    prefetcher.schedule("s1", "detalle", "7", lambda: None)                 # proveedor no encontrado
+    prefetcher.schedule("s1", "precios", "aceite", lambda: 1 / 0)          # falló
+    assert prefetcher.take("s1", "detalle", "7") is None
+    assert prefetcher.take("s1", "precios", "aceite") is None
+    stats = prefetcher.stats()["by_kind"]
+    assert stats["detalle"]["hits"] == 0 and stats["detalle"]["misses"] == 1
+    assert stats["precios"]["hits"] == 0 and stats["precios"]["failed"] == 1
+
+
+def test_buscar_productos_prefetches_prices_for_the_next_turn(monkeypatch):
+    from chat.agent import tools
+    from chat.services.prefetch import SpeculativePrefetcher
+    from chat.services.session_candidates import SessionCandidateStore
+
+    monkeypatch.setattr(tools, "prefetcher", SpeculativePrefetcher())
+    monkeypatch.setattr(tools, "session_candidates", SessionCandidateStore(enabled=False))
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: None)
+    monkeypatch.setattr(tools.provider_directory, "ready", lambda: True)
+    monkeypatch.setattr(tools._qn, "_execute_plan", lambda plan, **kw: [_product_row(1, "Capullo", 10)])
+    price_calls = []
+    precios = [{"producto": "Aceite", "marca": "Capullo", "presentacion": "1 l",
+                "precio_formateado": "$50.00 MXN", "proveedor": "Prov 10"}]
+    monkeypatch.setattr(
+        tools._qn, "_execute_price_search", lambda producto, marca, **kw: price_calls.append(producto) or precios
+    )
+    state = {"session_id": "s1"}
+
+    tools.buscar_productos.func(producto="aceite", tool_call_id="t1", state=state)
+    out = tools.filtrar_por_precio.func(producto="Aceite", state=state)
+    assert "$50.00 MXN — Prov 10" in out
+    assert price_calls == ["aceite"]                 # computed once, in the background
+    assert tools.prefetcher.stats()["by_kind"]["precios"]["hits"] == 1
+
+
+def test_detalle_proveedor_takes_the_card_prefetched_by_id(monkeypatch):
+    from chat.agent import tools
+    from chat.services.prefetch import SpeculativePrefetcher
+    from chat.services.session_candidates import SessionCandidateStore
+
+    monkeypatch.setattr(tools, "prefetcher", SpeculativePrefetcher())
+    monkeypatch.setattr(tools, "session_candidates", SessionCandidateStore(enabled=False))
+    monkeypatch.setattr(tools, "get_spell_corrector", lambda: None)
+    monkeypatch.setattr(tools.provider_directory, "ready", lambda: False)
+    monkeypatch.setattr(tools._qn, "_execute_plan", lambda plan, **kw: [_product_row(1, "Capullo", 10)])
+    monkeypatch.setattr(tools._qn, "_execute_price_search", lambda producto, marca, **kw: [])
+    lookups = []
+    monkeypatch.setattr(
+        tools._qn, "_provider_entry",
+        lambda nombre: lookups.append(nombre) or {"card": f"📋 **{nombre}**", "nombre": nombre},
+    )
+    state = {"session_id": "s1"}
+
+    cmd = tools.buscar_productos.func(producto="aceite", tool_call_id="t1", state=state)
+    state["search_cursor"] = cmd.update["search_cursor"]
+    content, artifact = tools.detalle_proveedor.func(nombre_proveedor="prov 10", state=state)
+    assert artifact["proveedor"] == "Prov 10"
+    assert lookups == ["Prov 10"]                   # looked up once, in the background
+    assert tools.prefetcher.stats()["by_kind"]["detalle"]["hits"] == 1
+
+
+
+# ── Tool call memoization ───────────────────────────────────────────
+def test_tool_memo_short_circuits_repeats_but_not_side_effects():
+    from types import SimpleNamespace
+
+    from langchain_core.messages import ToolMessage
+    from langgraph.types import Command
+
+    from chat.services.tool_memo import ToolCallMemo
+
+    calls = []
+
+    def execute(request):
+        call = request.tool_call
+        calls.append(call["name"])
+        if call["name"] == "buscar_productos":
+            return Command(update={
+                "search_cursor": {"producto": call["args"]["producto"]},
+                "messages": [ToolMessage(content=f"{len(calls)} resultados", tool_call_id=call["id"])],
+            })
+        return ToolMessage(content="enviado", tool_call_id=call["id"])
+
+    memo = ToolCallMemo()
+
+    def run(call_id, name, args, session_id="s1"):
+        request = SimpleNamespace(
+            tool_call={"name": name, "args": args, "id": call_id}, state={"session_id": session_id}
+        )
+        return memo.wrap(request, execute)
+
+    run("c1", "buscar_productos", {"producto": "Aceite  de oliva", "marca": None})
+    command = run("c2", "buscar_productos", {"producto": "aceite de oliva"})
+    assert command.update["search_cursor"] == {"producto": "Aceite  de oliva"}
+    assert command.update["messages"][0].content == "1 resultados"
+    assert command.update["messages"][0].tool_call_id == "c2"
+    run("c3", "buscar_productos", {"producto": "aceite de oliva"}, session_id="s2")   # other session
+    run("c4", "reportar_producto_no_encontrado", {"producto": "x"})
+    run("c5", "reportar_producto_no_encontrado", {"producto": "x"})
+    assert calls == ["buscar_productos", "buscar_productos", "reportar_producto_no_encontrado",
+                     "reportar_producto_no_encontrado"]
+    assert memo.stats()["by_tool"]["buscar_productos"] == {"hits": 1, "misses": 2}
+
+
+# ── Search indexes (ingest) ─────────────────────────────────────────
+class _IndexConn:
+    """Conexión falsa: pg_index según ``states`` y registro de DDL."""
+
+    def __init__(self, states):
+        self.states = states
+        self.ddl = []
+
+    def execution_options(self, **kw):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params):
+        state = self.states.get(params["name"])
+        row = None if state is None else type("Row", (), {"indisvalid": state})()
+        return type("R", (), {"fetchone": lambda self: row})()
+
+    def exec_driver_sql(self, sql):
+        self.ddl.append(sql)
+
+
+def test_search_indexes_cover_vector_trigram_and_brand_lookups():
+    from ingest.indexes import search_indexes
+
+    defs = {name: (table, definition) for table, name, definition in search_indexes()}
+    assert "USING hnsw (embedding vector_cosine_ops)" in defs["ix_prod_embedding_hnsw"][1]
+    assert defs["ix_prod_marca_lower"] == ("productos", "(LOWER(marca))")
+    assert defs["ix_prov_nombre_trgm"] == ("proveedores", "USING gin (nombre_comercial gin_trgm_ops)")
+    assert any("gin_trgm_ops" in d and t == "productos" for t, d in defs.values())
+
+
+def test_ensure_search_indexes_repairs_invalid_and_skips_valid():
+    from ingest.indexes import ensure_search_indexes, search_indexes
+
+    names = [name for _, name, _ in search_indexes()]
+    conn = _IndexConn({names[0]: True, names[1]: False})
+    ensure_search_indexes(type("E", (), {"connect": lambda self: conn})())
+
+    assert not any(names[0] + " " in sql for sql in conn.ddl)               # válido: intacto
+    assert conn.ddl[0] == f"DROP INDEX CONCURRENTLY IF EXISTS {names[1]}"  # INVALID: se recrea
+    assert conn.ddl[1].startswith(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {names[1]} ON ")
+    created = [sql for sql in conn.ddl if sql.startswith("CREATE INDEX")]
+    assert len(created) == len(names) - 1                                   # los que faltan
+
+
+def test_search_connection_sets_per_query_index_settings(monkeypatch):
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+
+    captured = []
+
+    class _Conn:
+        def execute(self, sql, params):
+            captured.append((str(sql), params))
+
+    @contextmanager
+    def _connect():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(node, "engine", type("E", (), {"connect": lambda self: _connect()})())
+    monkeypatch.setattr(query.settings, "HNSW_EF_SEARCH", 10)
+    monkeypatch.setattr(query.settings, "HNSW_ITERATIVE_SCAN", "relaxed_order")
+    with node._search_connection():
+        pass
+
+    (gucs, params), (scan, scan_params) = captured
+    assert "set_config('hnsw.ef_search', :ef, true)" in gucs
+    assert "set_config('pg_trgm.similarity_threshold', :trgm, true)" in gucs
+    assert params == {
+        "ef": str(query.settings.DEFAULT_KNN_LIMIT),          # nunca por debajo de knn_limit
+        "trgm": str(query.settings.TRGM_SIMILARITY_THRESHOLD),
+    }
+    assert "hnsw.iterative_scan" in scan and scan_params == {"mode": "relaxed_order"}
+
+
+# ── Price search (candidates + rerank) ──────────────────────────────
+def test_price_search_pushes_filters_into_candidates_and_keeps_format(monkeypatch):
+    from collections import namedtuple
+    from contextlib import contextmanager
+    from chat.graph.nodes import query
+
+    PriceRow = namedtuple("PriceRow", [
+        "id", "nombre_producto", "marca", "presentacion_venta", "precio_unidad", "moneda",
+        "impuesto", "id_proveedor", "nombre_comercial", "nivel_membresia",
+        "trgm_sim", "vec_sim", "relevance_score",
+    ])
+    row = PriceRow(1, "Aceite de oliva 1 L", "Carbonell", "Botella", 189.5, "PMX", "IVA 16%",
+                   7, "Abarrotes Roma", "oro", 0.8, 0.9, 0.84)
+    captured = []
+
+    class _Conn:
+        def execute(self, sql, params):
+            captured.append((str(sql), params))
+            return type("R", (), {"fetchall": lambda self: [row]})()
+
+    @contextmanager
+    def _conn():
+        yield _Conn()
+
+    node = query._query_node
+    monkeypatch.setattr(node, "_search_connection", _conn)
+    monkeypatch.setattr(query, "generar_embedding", lambda q: [0.1] * 4)
+    monkeypatch.setattr(query.search_cascade, "enabled", False)
+    monkeypatch.setattr(query.search_result_cache, "enabled", False)
+    precios = node._execute_price_search("aceite de oliva", "Carbonell", precio_max=200, precio_min=50)
+
+    sql, params = captured[0]
+    ann, trgm = sql.split("ann AS (")[1].split("trgm AS (")
+    trgm = trgm.split("candidates AS (")[0]
+    for leg in (ann, trgm):                                  # filtros dentro de cada pierna
+        assert "LOWER(p.marca) = LOWER(:marca)" in leg
+        assert "p.precio_unidad <= :precio_max" in leg and "p.precio_unidad >= :precio_min" in leg
+    assert "ORDER BY precio_unidad ASC" in sql.split("FROM scored")[1]
+    assert (params["marca"], params["precio_max"], params["precio_min"]) == ("Carbonell", 200, 50)
+
+    assert precios == [{
+        "proveedor": "Abarrotes Roma",
+        "proveedor_id": 7,
+        "producto": "Aceite de oliva 1 L",
+        "marca": "Carbonell",
+        "presentacion": "Botella",
+        "precio_formateado": "$189.50 MXN + IVA",
+        "precio_unidad": 189.5,
+        "grava_iva": True,
+    }]
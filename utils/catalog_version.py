@@ -0,0 +1,187 @@
+"""
+Versión del catálogo de productos.
+
+Fila única en la tabla ``catalog_version`` que la ingesta incrementa cada
+vez que cambian productos. Los procesos del servidor la consultan para
+saber si sus copias locales del catálogo (índice vectorial mmap, cachés)
+siguen vigentes, por sondeo o con LISTEN sobre el canal ``catalog_version``
+(la ingesta hace NOTIFY en la misma transacción del incremento).
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "catalog_version"
+
+_CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS catalog_version (
+        id         SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version    BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_catalog_version_table(engine) -> None:
+    """Crea la tabla y su fila única si no existen (idempotente)."""
+    with engine.begin() as conn:
+        conn.execute(text(_CREATE_SQL))
+        conn.execute(text("INSERT INTO catalog_version (id) VALUES (1) ON CONFLICT (id) DO NOTHING"))
+
+
+def get_catalog_version(conn_or_engine) -> int:
+    """Versión actual (0 si la tabla aún no existe)."""
+    sql = text("SELECT version FROM catalog_version WHERE id = 1")
+    try:
+        if isinstance(conn_or_engine, Engine):
+            with conn_or_engine.connect() as conn:
+                row = conn.execute(sql).fetchone()
+        else:
+            row = conn_or_engine.execute(sql).fetchone()
+    except Exception as e:
+        logger.warning(f"⚠️  catalog_version no disponible: {e}")
+        return 0
+    return int(row.version) if row else 0
+
+
+def bump_catalog_version(engine) -> int:
+    """Incrementa la versión del catálogo y devuelve la nueva."""
+    ensure_catalog_version_table(engine)
+    with engine.begin() as conn:
+        version = conn.execute(
+            text("""
+                UPDATE catalog_version
+                SET version = version + 1, updated_at = now()
+                WHERE id = 1
+                RETURNING version
+            """)
+        ).scalar_one()
+        # Aviso inmediato a los servidores que escuchan (ver listen_catalog_version)
+        conn.execute(text("SELECT pg_notify(:channel, :v)"), {"channel": NOTIFY_CHANNEL, "v": str(version)})
+    logger.info(f"📦 Catálogo en versión {version}")
+    return int(version)
+
+
+def listen_catalog_version(database_url: str, callback: Callable[[int], None]) -> threading.Thread:
+    """
+    Hilo daemon con LISTEN catalog_version: llama a ``callback(version)``
+    en cada NOTIFY. Se reconecta solo si la conexión se cae.
+    """
+    import psycopg
+
+    dsn = database_url.replace("postgresql+psycopg://", "postgresql://", 1)
+
+    def run() -> None:
+        while True:
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    logger.info("👂 LISTEN catalog_version activo")
+                    for notify in conn.notifies():
+                        try:
+                            callback(int(notify.payload))
+                        except Exception as e:
+                            logger.warning(f"⚠️  NOTIFY catalog_version no procesado: {e}")
+            except Exception as e:
+                logger.warning(f"⚠️  LISTEN catalog_version caído ({e}); reintento en 30s")
+                time.sleep(30)
+
+    thread = threading.Thread(target=run, daemon=True, name="catalog-version-listen")
+    thread.start()
+    return thread
+
+
+class CatalogSnapshot(ABC):
+    """
+    Base para copias en memoria del catálogo (índices, directorios).
+
+    ``refresh()`` sondea catalog_version cada ``refresh_seconds`` y, si la
+    copia cargada es de otra versión, la reconstruye en un hilo de fondo
+    con ``_load_snapshot``. Mientras no esté al día, ``_current_state()``
+    devuelve None y el llamador usa la base de datos.
+
+    Las subclases guardan su estado en ``self._state`` como una tupla cuyo
+    primer elemento es la versión (se sustituye de una vez, sin mezclas).
+    """
+
+    _thread_name = "catalog-snapshot-build"
+
+    def __init__(self, engine=None, refresh_seconds: float = 30):
+        self.refresh_seconds = refresh_seconds
+        self._engine = engine
+        self._state = None
+        self._catalog_version = None
+        self._last_check = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._counters = {"stale_fallbacks": 0, "builds": 0, "build_errors": 0}
+        self._last_build_seconds = 0.0
+
+    @abstractmethod
+    def _load_snapshot(self, engine, version: int) -> None:
+        """Lee la foto de la BD y llama a ``self._state = (version, ...)``."""
+
+    def _rebuild(self) -> None:
+        try:
+            # La versión se lee antes que la foto: si la ingesta escribe en
+            # medio, la copia queda etiquetada como vieja y se reconstruye.
+            version = get_catalog_version(self._engine)
+            t0 = time.perf_counter()
+            self._load_snapshot(self._engine, version)
+            self._last_build_seconds = round(time.perf_counter() - t0, 3)
+            self._counters["builds"] += 1
+        except Exception as e:
+            self._counters["build_errors"] += 1
+            logger.error(f"❌ Error construyendo {self.__class__.__name__}: {e}")
+        finally:
+            self._building = False
+
+    def refresh(self, force: bool = False) -> None:
+        """Comprueba la versión del catálogo y reconstruye en segundo plano si cambió."""
+        if self._engine is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and self._last_check is not None and now - self._last_check < self.refresh_seconds:
+                return
+            self._last_check = now
+            self._catalog_version = get_catalog_version(self._engine)
+            if self.loaded_version != self._catalog_version and not self._building:
+                self._building = True
+                threading.Thread(target=self._rebuild, daemon=True, name=self._thread_name).start()
+
+    @property
+    def loaded_version(self):
+        return self._state[0] if self._state else None
+
+    def is_current(self) -> bool:
+        """True si hay una copia cargada y coincide con la versión del catálogo."""
+        if self._state is None:
+            return False
+        return self._catalog_version is None or self._state[0] == self._catalog_version
+
+    def _current_state(self):
+        self.refresh()
+        if not self.is_current():
+            self._counters["stale_fallbacks"] += 1
+            return None
+        return self._state
+
+    def snapshot_stats(self):
+        c = dict(self._counters)
+        c.update(
+            loaded_version=self.loaded_version,
+            catalog_version=self._catalog_version,
+            current=self.is_current(),
+            last_build_seconds=self._last_build_seconds,
+        )
+        return c
@@ -0,0 +1,263 @@
+"""
+Caché de embeddings en dos niveles.
+
+1. Memoria: LRU acotada por bytes y con TTL (lookup sub-milisegundo).
+2. Persistente (opcional): tabla Postgres ``embedding_cache`` compartida
+   entre workers del servidor y la ingesta.
+
+La clave es sha256(modelo + texto normalizado), así "Aceite de oliva" y
+"  aceite   de OLIVA " comparten entrada.
+
+Variables de entorno:
+    EMBEDDING_CACHE_MAX_MB   Tamaño máximo del nivel en memoria (def. 64)
+    EMBEDDING_CACHE_TTL      TTL en segundos del nivel en memoria (def. 86400)
+    EMBEDDING_CACHE_PERSIST  "true" para activar el nivel Postgres
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+
+
+class _PostgresEmbeddingStore:
+    """Nivel persistente: tabla ``embedding_cache`` (clave → REAL[])."""
+
+    _CREATE_SQL = """
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            cache_key  TEXT PRIMARY KEY,
+            model      TEXT NOT NULL,
+            embedding  REAL[] NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """
+
+    def __init__(self, database_url: str, engine=None):
+        self._database_url = database_url
+        self._shared_engine = engine
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def _get_engine(self):
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    from sqlalchemy import text
+                    from utils.normalize_db_url import normalize_db_url
+
+                    engine = self._shared_engine
+                    if engine is None:
+                        from chat.config.database import get_engine
+
+                        engine = get_engine(normalize_db_url(self._database_url))
+                    with engine.begin() as conn:
+                        conn.execute(text(self._CREATE_SQL))
+                    self._engine = engine
+        return self._engine
+
+    def get(self, key: str) -> Optional[List[float]]:
+        from sqlalchemy import text
+
+        with self._get_engine().connect() as conn:
+            row = conn.execute(
+                text("SELECT embedding FROM embedding_cache WHERE cache_key = :k"),
+                {"k": key},
+            ).fetchone()
+        return list(row.embedding) if row else None
+
+    def put(self, key: str, model: str, embedding: List[float]) -> None:
+        from sqlalchemy import text
+
+        with self._get_engine().begin() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO embedding_cache (cache_key, model, embedding)
+                    VALUES (:k, :m, :e)
+                    ON CONFLICT (cache_key) DO NOTHING
+                """),
+                {"k": key, "m": model, "e": list(embedding)},
+            )
+
+
+class EmbeddingCache:
+    """
+    LRU en memoria acotada por bytes + TTL, con nivel persistente opcional.
+
+    Los vectores se guardan como ``array('d')`` (8 bytes por dimensión) y se
+    devuelven como ``list`` nueva en cada hit para que el llamador pueda
+    mutarla sin corromper la caché.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        persistent: Optional[_PostgresEmbeddingStore] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._persistent = persistent
+        self._data: "OrderedDict[str, Tuple[float, array]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "persistent_errors": 0,
+        }
+
+    # ── Claves ──────────────────────────────────────────────────────
+    @staticmethod
+    def normalize(texto: str) -> str:
+        """Normaliza el texto para la clave (NFC, espacios, casefold)."""
+        s = unicodedata.normalize("NFC", str(texto))
+        return _WS.sub(" ", s).strip().casefold()
+
+    @classmethod
+    def make_key(cls, texto: str, model: str) -> str:
+        """Hash estable de (modelo, texto normalizado)."""
+        raw = f"{model}\x00{cls.normalize(texto)}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()
+
+    # ── Nivel en memoria ────────────────────────────────────────────
+    def _mem_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            stored_at, vec = entry
+            if self.ttl_seconds and time.monotonic() - stored_at > self.ttl_seconds:
+                self._drop(key)
+                self._counters["expirations"] += 1
+                return None
+            self._data.move_to_end(key)
+            return vec.tolist()
+
+    def _mem_put(self, key: str, embedding: List[float]) -> None:
+        vec = array("d", embedding)
+        size = vec.itemsize * len(vec)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic(), vec)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._data:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self._counters["evictions"] += 1
+
+    def _incr(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _drop(self, key: str) -> None:
+        _, vec = self._data.pop(key)
+        self._bytes -= vec.itemsize * len(vec)
+
+    # ── API pública ─────────────────────────────────────────────────
+    def get(self, texto: str, model: str) -> Optional[List[float]]:
+        """Busca en memoria y después en el nivel persistente."""
+        key = self.make_key(texto, model)
+        vec = self._mem_get(key)
+        if vec is not None:
+            self._incr("memory_hits")
+            return vec
+
+        if self._persistent is not None:
+            try:
+                vec = self._persistent.get(key)
+            except Exception as e:
+                self._incr("persistent_errors")
+                logger.warning(f"⚠️  embedding_cache (Postgres) no disponible: {e}")
+                vec = None
+            if vec is not None:
+                self._incr("persistent_hits")
+                self._mem_put(key, vec)
+                return vec
+
+        self._incr("misses")
+        return None
+
+    def put(self, texto: str, model: str, embedding: List[float]) -> None:
+        """Guarda en ambos niveles (errores del persistente no se propagan)."""
+        key = self.make_key(texto, model)
+        self._mem_put(key, embedding)
+        if self._persistent is not None:
+            try:
+                self._persistent.put(key, model, embedding)
+            except Exception as e:
+                self._incr("persistent_errors")
+                logger.warning(f"⚠️  No se pudo persistir embedding: {e}")
+
+    def get_or_compute(
+        self,
+        texto: str,
+        model: str,
+        compute: Callable[[str], Optional[List[float]]],
+    ) -> Optional[List[float]]:
+        """Devuelve el embedding cacheado o lo calcula con ``compute`` y lo guarda."""
+        vec = self.get(texto, model)
+        if vec is not None:
+            return vec
+        vec = compute(texto)
+        if vec is not None:
+            self.put(texto, model, vec)
+        return vec
+
+    def clear(self) -> None:
+        """Vacía el nivel en memoria (el persistente no se toca)."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de hits/misses y ocupación del nivel en memoria."""
+        c = dict(self._counters)
+        hits = c["memory_hits"] + c["persistent_hits"]
+        total = hits + c["misses"]
+        c.update(
+            entries=len(self._data),
+            bytes=self._bytes,
+            max_bytes=self.max_bytes,
+            hit_ratio=round(hits / total, 4) if total else 0.0,
+            persistent_enabled=self._persistent is not None,
+        )
+        return c
+
+
+# ── Singleton ───────────────────────────────────────────────────────
+_default_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache(engine=None) -> EmbeddingCache:
+    """
+    Obtiene (o crea) la caché de embeddings del proceso.
+
+    ``engine`` (el pool compartido del servidor) solo se usa al crearla.
+    """
+    global _default_cache
+    if _default_cache is None:
+        persistent = None
+        database_url = os.getenv("DATABASE_URL")
+        if os.getenv("EMBEDDING_CACHE_PERSIST", "").lower() == "true" and database_url:
+            persistent = _PostgresEmbeddingStore(database_url, engine=engine)
+        _default_cache = EmbeddingCache(
+            max_bytes=int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL", "86400")),
+            persistent=persistent,
+        )
+    return _default_cache
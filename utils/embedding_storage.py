@@ -0,0 +1,96 @@
+"""
+Modelo y formato de almacenamiento de los embeddings de productos.
+
+La ingesta (columna ``productos.embedding``, índice HNSW) y el servidor
+(embedding de la consulta, CAST en el SQL) leen la misma configuración:
+
+    EMBEDDING_MODEL        Modelo de OpenAI (def. text-embedding-ada-002)
+    EMBEDDING_DIMENSIONS   Dimensiones (def. las nativas del modelo). Los
+                           modelos text-embedding-3-* admiten menos
+                           (p.ej. 512) con el parámetro ``dimensions``.
+    EMBEDDING_STORAGE      vector (float32) | halfvec (float16, pgvector ≥ 0.7)
+
+Ejemplo: text-embedding-3-small + 512 + halfvec ocupa 1 KB por fila frente
+a los 6 KB de ada-002 en vector(1536), tanto en la tabla como en el índice.
+
+Cambiar la configuración con datos existentes requiere migrar la columna:
+``python -m ingest.migrate_embeddings``.
+
+Con VECTOR_SEARCH_MODE=binary_rerank cada producto guarda además un código
+binario (``embedding_bq``, bit(N): 1 si la componente es > 0, como
+``binary_quantize`` de pgvector) para la primera pasada por distancia de
+Hamming. En el modo ``exact`` (por defecto) ni la columna ni su índice existen.
+"""
+import os
+from typing import Optional, Sequence
+
+LEGACY_MODEL = "text-embedding-ada-002"
+
+_NATIVE_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+# Tipo de columna → operator class HNSW para distancia coseno
+STORAGE_OPCLASS = {
+    "vector": "vector_cosine_ops",
+    "halfvec": "halfvec_cosine_ops",
+}
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", LEGACY_MODEL)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS") or _NATIVE_DIMENSIONS.get(EMBEDDING_MODEL, 1536))
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector").lower()
+# Columna embedding_bq + índice Hamming solo en este modo (mismo env que settings)
+BINARY_RERANK = os.getenv("VECTOR_SEARCH_MODE", "exact").lower() == "binary_rerank"
+
+
+def storage_type() -> str:
+    """Tipo pgvector de la columna (y del CAST de la consulta): vector | halfvec."""
+    if EMBEDDING_STORAGE not in STORAGE_OPCLASS:
+        raise ValueError(f"EMBEDDING_STORAGE no soportado: {EMBEDDING_STORAGE!r} (vector | halfvec)")
+    return EMBEDDING_STORAGE
+
+
+def column_type() -> str:
+    """Tipo SQL completo de ``productos.embedding``, p.ej. ``halfvec(512)``."""
+    return f"{storage_type()}({EMBEDDING_DIMENSIONS})"
+
+
+def cosine_opclass() -> str:
+    return STORAGE_OPCLASS[storage_type()]
+
+
+def api_dimensions() -> Optional[int]:
+    """
+    Valor del parámetro ``dimensions`` de la API, o None si se usan las
+    dimensiones nativas. ada-002 no admite reducirlas.
+    """
+    native = _NATIVE_DIMENSIONS.get(EMBEDDING_MODEL)
+    if EMBEDDING_DIMENSIONS == native:
+        return None
+    if not EMBEDDING_MODEL.startswith("text-embedding-3"):
+        raise ValueError(f"{EMBEDDING_MODEL} no admite EMBEDDING_DIMENSIONS={EMBEDDING_DIMENSIONS}")
+    return EMBEDDING_DIMENSIONS
+
+
+def binary_column_type() -> str:
+    """Tipo SQL de ``productos.embedding_bq``: un bit por dimensión."""
+    return f"bit({EMBEDDING_DIMENSIONS})"
+
+
+def binary_code(embedding: Optional[Sequence[float]]) -> Optional[str]:
+    """Código binario como literal de bit ('1011...'), igual que ``binary_quantize``."""
+    if embedding is None:
+        return None
+    return "".join("1" if x > 0 else "0" for x in embedding)
+
+
+def model_key() -> str:
+    """
+    Identifica el espacio de embeddings: modelo, más ``@dims`` si se
+    reducen. Se usa en la clave de la caché de embeddings y como comentario
+    de la columna (para saber qué contiene al migrar).
+    """
+    dims = api_dimensions()
+    return EMBEDDING_MODEL if dims is None else f"{EMBEDDING_MODEL}@{dims}"
@@ -1,19 +1,39 @@
-import os
 import logging
-from openai import OpenAI
+from utils.embedding_cache import get_embedding_cache
+from utils.embedding_storage import EMBEDDING_MODEL, api_dimensions, model_key
+from utils.llm_clients import get_llm_clients
 
 # Silenciar logs HTTP del cliente OpenAI (solo mostrar errores)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("openai").setLevel(logging.WARNING)
 
-# Carga la API key desde variables de entorno
-openai_api_key = os.getenv("OPENAI_API_KEY")
-openai_client = OpenAI(api_key=openai_api_key)
+# Cliente OpenAI sobre el pool HTTP compartido (ver utils/llm_clients.py);
+# la API key sale de OPENAI_API_KEY
+openai_client = get_llm_clients().openai()
+
+
+def _embed_remoto(s: str) -> list:
+    """Llamada directa a la API de embeddings (sin caché)."""
+    # Modelo/dimensiones configurables: ver utils/embedding_storage.py
+    kwargs = {}
+    dims = api_dimensions()
+    if dims is not None:
+        kwargs["dimensions"] = dims
+    response = openai_client.embeddings.create(
+        model=EMBEDDING_MODEL,
+        input=s,
+        **kwargs
+    )
+    return response.data[0].embedding
+
 
 def generar_embedding(texto: str) -> list:
     """
     Genera un embedding desde un string usando OpenAI.
 
+    Pasa por la caché de dos niveles (memoria + Postgres opcional), así que
+    textos repetidos no vuelven a llamar a la API. Ver utils/embedding_cache.py.
+
     Args:
         texto (str): Texto para embebido.
 
@@ -29,11 +49,7 @@ def generar_embedding(texto: str) -> list:
         if not s:
             return None
 
-        response = openai_client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=s
-        )
-        return response.data[0].embedding
+        return get_embedding_cache().get_or_compute(s, model_key(), _embed_remoto)
     except Exception as e:
         logging.error(f"Error generando embedding para '{texto}': {e}")
         return None
@@ -0,0 +1,264 @@
+"""
+Registro compartido de clientes LLM (servidor + ingesta).
+
+Cada nodo y herramienta construía su propio ``ChatOpenAI`` en cada llamada,
+y ``utils/embedding_utils`` otro ``OpenAI``: un pool HTTP por instancia, así
+que cada turno repetía handshakes TLS y perdía el keep-alive.
+
+``LLMClientRegistry`` mantiene un único ``httpx.Client`` y un único
+``httpx.AsyncClient`` afinados (límites de conexiones, keep-alive, HTTP/2 si
+el paquete ``h2`` está instalado) y sobre ellos:
+
+- ``chat(model, **params)``: ``ChatOpenAI`` cacheado por (modelo, params);
+  ``invoke`` usa el cliente síncrono y ``ainvoke`` el asíncrono.
+- ``openai()``: el cliente ``OpenAI`` del SDK (embeddings).
+
+Los hooks de httpx cuentan, por modelo, peticiones, errores (HTTP ≥ 400) y
+un histograma de latencias hasta la respuesta; ``stats()`` los expone.
+
+Variables de entorno:
+    LLM_MAX_CONNECTIONS       Conexiones simultáneas máximas (def. 20)
+    LLM_MAX_KEEPALIVE         Conexiones ociosas que se conservan (def. 10)
+    LLM_KEEPALIVE_EXPIRY      Segundos que vive una conexión ociosa (def. 60)
+    LLM_TIMEOUT_SECONDS       Timeout de cada petición (def. 60)
+    LLM_CONNECT_TIMEOUT       Timeout de conexión (def. 5)
+    LLM_HTTP2                 "false" para forzar HTTP/1.1 (def. true)
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de cada cubeta del histograma; la última es "+inf"
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_T0 = "llm_clients_t0"
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _request_model(request: httpx.Request) -> str:
+    """Modelo del cuerpo JSON de la petición (``unknown`` si no se puede leer)."""
+    try:
+        return str(json.loads(request.content).get("model") or "unknown")
+    except Exception:
+        return "unknown"
+
+
+class _ModelMetrics:
+    """Contadores e histograma de latencias de un modelo."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float, error: bool) -> None:
+        self.requests += 1
+        self.errors += int(error)
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        labels = [f"le_{b}ms" for b in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else 0.0,
+            "max_ms": round(self.max_ms, 1),
+            "latency_histogram": dict(zip(labels, self.buckets)),
+        }
+
+
+class LLMClientRegistry:
+    """Clientes HTTP compartidos + ChatOpenAI cacheados por (modelo, params)."""
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive: int = 10,
+        keepalive_expiry: float = 60,
+        timeout: float = 60,
+        connect_timeout: float = 5,
+        http2: bool = True,
+        api_key: Optional[str] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2 and _http2_available()
+        if http2 and not self.http2:
+            logger.info("ℹ️  LLM clients: 'h2' not installed, using HTTP/1.1")
+        self.api_key = api_key
+        self._lock = threading.Lock()
+        self._sync: Optional[httpx.Client] = None
+        self._async: Optional[httpx.AsyncClient] = None
+        self._openai = None
+        self._chat_models: Dict[Tuple[str, str], Any] = {}
+        self._metrics: Dict[str, _ModelMetrics] = {}
+
+    # ── Métricas (hooks de httpx) ───────────────────────────────────
+    def _on_request(self, request: httpx.Request) -> None:
+        request.extensions[_T0] = time.perf_counter()
+
+    def _on_response(self, response: httpx.Response) -> None:
+        t0 = response.request.extensions.get(_T0)
+        if t0 is None:
+            return
+        self.record(
+            _request_model(response.request),
+            (time.perf_counter() - t0) * 1000,
+            error=response.status_code >= 400,
+        )
+
+    async def _on_request_async(self, request: httpx.Request) -> None:
+        self._on_request(request)
+
+    async def _on_response_async(self, response: httpx.Response) -> None:
+        self._on_response(response)
+
+    def record(self, model: str, elapsed_ms: float, error: bool = False) -> None:
+        """Registra una petición de ``model`` (lo llaman los hooks)."""
+        with self._lock:
+            self._metrics.setdefault(model, _ModelMetrics()).observe(elapsed_ms, error)
+
+    # ── Clientes ────────────────────────────────────────────────────
+    def http_client(self) -> httpx.Client:
+        """Cliente httpx síncrono del proceso (pool compartido)."""
+        if self._sync is None:
+            with self._lock:
+                if self._sync is None:
+                    self._sync = httpx.Client(
+                        http2=self.http2,
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                    )
+        return self._sync
+
+    def http_async_client(self) -> httpx.AsyncClient:
+        """Cliente httpx asíncrono del proceso (pool compartido)."""
+        if self._async is None:
+            with self._lock:
+                if self._async is None:
+                    self._async = httpx.AsyncClient(
+                        http2=self.http2,
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        event_hooks={
+                            "request": [self._on_request_async],
+                            "response": [self._on_response_async],
+                        },
+                    )
+        return self._async
+
+    def openai(self):
+        """Cliente ``OpenAI`` del SDK sobre el pool compartido (embeddings)."""
+        if self._openai is None:
+            from openai import OpenAI
+
+            client = OpenAI(api_key=self.api_key, http_client=self.http_client())
+            with self._lock:
+                if self._openai is None:
+                    self._openai = client
+        return self._openai
+
+    def chat(self, model: str, **params: Any):
+        """
+        ``ChatOpenAI`` para (model, params), creado una sola vez.
+
+        Los params son los de ``ChatOpenAI`` (temperature, max_tokens,
+        model_kwargs, ...); dos llamadas con los mismos comparten instancia.
+        """
+        key = (model, json.dumps(params, sort_keys=True, default=str))
+        llm = self._chat_models.get(key)
+        if llm is not None:
+            return llm
+        from langchain_openai import ChatOpenAI
+
+        llm = ChatOpenAI(
+            model=model,
+            http_client=self.http_client(),
+            http_async_client=self.http_async_client(),
+            **params,
+        )
+        with self._lock:
+            return self._chat_models.setdefault(key, llm)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_model = {m: v.as_dict() for m, v in self._metrics.items()}
+            chat_models = len(self._chat_models)
+        return {
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive": self.limits.max_keepalive_connections,
+            "chat_models": chat_models,
+            "by_model": by_model,
+        }
+
+    def close(self) -> None:
+        """Cierra el cliente síncrono (el asíncrono se cierra con ``aclose``)."""
+        with self._lock:
+            sync, self._sync = self._sync, None
+            self._openai = None
+            self._chat_models.clear()
+        if sync is not None:
+            sync.close()
+
+    async def aclose(self) -> None:
+        with self._lock:
+            client, self._async = self._async, None
+        if client is not None:
+            await client.aclose()
+        self.close()
+
+
+# ── Singleton ───────────────────────────────────────────────────────
+_default_registry: Optional[LLMClientRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_llm_clients() -> LLMClientRegistry:
+    """Registro del proceso, configurado desde el entorno."""
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                _default_registry = LLMClientRegistry(
+                    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+                    max_keepalive=int(os.getenv("LLM_MAX_KEEPALIVE", "10")),
+                    keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60")),
+                    timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+                    connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5")),
+                    http2=os.getenv("LLM_HTTP2", "true").lower() == "true",
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                )
+    return _default_registry
+
+
+def get_chat_model(model: str, **params: Any):
+    """Atajo: ``get_llm_clients().chat(model, **params)``."""
+    return get_llm_clients().chat(model, **params)
@@ -0,0 +1,91 @@
+"""
+Envío binario de embeddings a pgvector (psycopg 3).
+
+Sin adaptador, un embedding viaja como texto: ``str(embedding)`` ("[0.01,
+...]") o, si se pasa la lista, como literal ``float8[]`` ("{0.01,...}") que
+Postgres parsea y luego convierte con ``CAST(... AS vector)``. Con 1536
+dimensiones son ~20-30 KB de decimales por consulta.
+
+``VectorParam`` envuelve el embedding y se adapta así:
+
+- En conexiones donde existe el tipo ``vector`` (``register_vector_binary``
+  en el evento ``connect`` del engine): formato binario de ``vector_recv``
+  (int16 dim, int16 sin uso, dim × float4 big-endian) = 4 + 4·dim bytes, sin
+  parseo de texto en el servidor.
+- En cualquier otra: literal de texto de pgvector ("[1.0,2.0]") con OID
+  desconocido, que ``CAST(:embedding AS vector)`` resuelve igual.
+
+Solo los parámetros envueltos cambian: las listas de ids/similitudes
+(``CAST(:ids AS int[])``) siguen siendo arrays.
+"""
+import logging
+import struct
+from typing import Any, Sequence
+
+import numpy as np
+from psycopg import adapters as _global_adapters
+from psycopg.adapt import Dumper
+from psycopg.pq import Format, TransactionStatus
+from psycopg.types import TypeInfo
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">HH")
+
+
+class VectorParam:
+    """Embedding como parámetro ``vector`` de pgvector."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: Sequence[float]):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __repr__(self) -> str:
+        return f"VectorParam(dim={len(self.values)})"
+
+
+class VectorTextDumper(Dumper):
+    """Literal de texto de pgvector (OID desconocido)."""
+
+    format = Format.TEXT
+
+    def dump(self, obj: VectorParam) -> bytes:
+        return ("[" + ",".join(str(x) for x in obj.values) + "]").encode()
+
+
+class VectorBinaryDumper(Dumper):
+    """Formato binario de ``vector_recv``; el OID se fija al registrar."""
+
+    format = Format.BINARY
+
+    def dump(self, obj: VectorParam) -> bytes:
+        values = obj.values.astype(">f4", copy=False)
+        return _HEADER.pack(len(values), 0) + values.tobytes()
+
+
+# Texto por defecto en todas las conexiones psycopg del proceso
+_global_adapters.register_dumper(VectorParam, VectorTextDumper)
+
+
+def register_vector_binary(dbapi_connection: Any, connection_record: Any = None) -> bool:
+    """
+    Registra el envío binario en una conexión psycopg si la extensión
+    ``vector`` está instalada. Pensado para ``event.listen(engine, "connect", ...)``.
+    """
+    try:
+        info = TypeInfo.fetch(dbapi_connection, "vector")
+    except Exception as e:
+        logger.warning(f"⚠️  No se pudo consultar el tipo vector: {e}")
+        info = None
+    finally:
+        if dbapi_connection.info.transaction_status == TransactionStatus.INTRANS:
+            dbapi_connection.rollback()
+    if info is None:
+        return False
+    dumper = type("VectorBinaryDumper", (VectorBinaryDumper,), {"oid": info.oid})
+    dbapi_connection.adapters.register_dumper(VectorParam, dumper)
+    return True
@@ -0,0 +1,105 @@
+"""
+Normalización de texto en español para la búsqueda por trigramas.
+
+pg_trgm compara el texto tal cual: "Aceíte", "aceites" y "ACEITE 1LT" dan
+similitudes distintas contra el mismo producto, y las claves de caché de
+búsquedas equivalentes no coinciden. ``normalize_text`` aplica, en orden:
+
+1. Plegado de acentos (como ``unaccent``: á→a, ü→u, ñ→n) y minúsculas.
+2. Separación número/unidad ("1.5lt" → "1.5 lt") y coma decimal → punto.
+3. Unidades y abreviaturas canónicas ("kgs", "kilos" → "kg"; "lts",
+   "litro" → "l"; "pzas", "pieza" → "pza"; ...).
+4. Eliminación de palabras vacías (artículos, preposiciones). "sin" se
+   conserva: "sin azúcar" no es "azúcar".
+5. Stemming ligero: plurales (-s, -es, -ces → -z) y vocal final de
+   género (-a/-o/-e) en palabras de más de 4 letras.
+
+El resultado solo se usa para comparar (columnas ``nombre_norm`` /
+``marca_norm`` de productos y el texto de la consulta): lo que se muestra
+y lo que se embebe sigue siendo el texto original.
+
+La ingesta y el servidor deben normalizar igual. Si cambian las reglas se
+incrementa NORMALIZER_VERSION y ``ensure_normalized_columns``
+(ingest/indexes.py) recalcula las columnas.
+
+Variables de entorno:
+    SEARCH_NORMALIZATION   "false" para buscar sobre las columnas originales (def. true)
+"""
+import os
+import re
+import unicodedata
+from typing import Any, List
+
+NORMALIZER_VERSION = "es-1"
+
+NORMALIZED_SEARCH = os.getenv("SEARCH_NORMALIZATION", "true").lower() == "true"
+
+UNITS = {
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "kilogramo": "kg", "kilogramos": "kg",
+    "g": "g", "gr": "g", "grs": "g", "grm": "g", "gramo": "g", "gramos": "g",
+    "mg": "mg", "miligramo": "mg", "miligramos": "mg",
+    "l": "l", "lt": "l", "lts": "l", "ltr": "l", "ltrs": "l", "litro": "l", "litros": "l",
+    "ml": "ml", "mililitro": "ml", "mililitros": "ml",
+    "oz": "oz", "onza": "oz", "onzas": "oz",
+    "gal": "gal", "galon": "gal", "galones": "gal",
+    "pza": "pza", "pzas": "pza", "pz": "pza", "pzs": "pza", "pieza": "pza", "piezas": "pza",
+    "paq": "paq", "pqt": "paq", "paquete": "paq", "paquetes": "paq",
+    "cja": "caja", "caja": "caja", "cajas": "caja",
+    "doc": "doc", "docena": "doc", "docenas": "doc",
+    "cm": "cm", "mt": "m", "mts": "m", "metro": "m", "metros": "m",
+}
+
+STOPWORDS = frozenset({
+    "a", "al", "con", "de", "del", "e", "el", "en", "la", "las", "lo", "los",
+    "o", "para", "por", "que", "su", "sus", "u", "un", "una", "unas", "unos", "y",
+})
+
+_NUMBER_UNIT = re.compile(r"(?<=\d)(?=[a-z])|(?<=[a-z])(?=\d)")
+_DECIMAL_COMMA = re.compile(r"(?<=\d),(?=\d)")
+_TOKEN = re.compile(r"\d+(?:\.\d+)?|[a-z]+")
+_VOWELS = frozenset("aeiou")
+
+
+def fold_accents(value: Any) -> str:
+    """Minúsculas sin diacríticos (equivalente a ``lower(unaccent(x))``)."""
+    s = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(c for c in s if not unicodedata.combining(c)).lower()
+
+
+def fold_text(value: Any) -> str:
+    """``fold_accents`` con espacios colapsados: para comparar nombres tal cual."""
+    return " ".join(fold_accents(value).split())
+
+
+def stem(word: str) -> str:
+    """Stemming ligero: plural y vocal final de género."""
+    if len(word) > 4 and word.endswith("ces"):
+        word = word[:-3] + "z"                        # nueces → nuez
+    elif len(word) > 4 and word.endswith("es") and word[-3] not in _VOWELS:
+        word = word[:-2]                              # limones → limon
+    elif len(word) > 3 and word.endswith("s"):
+        word = word[:-1]                              # papas → papa
+    if len(word) > 4 and word[-1] in "aoe":
+        word = word[:-1]                              # aceite → aceit
+    return word
+
+
+def tokens(value: Any) -> List[str]:
+    """Tokens normalizados de ``value`` (ver docstring del módulo)."""
+    s = _DECIMAL_COMMA.sub(".", fold_accents(value))
+    words = _TOKEN.findall(_NUMBER_UNIT.sub(" ", s))
+    kept = [w for w in words if w not in STOPWORDS] or words
+    out = []
+    for w in kept:
+        if w in UNITS:
+            out.append(UNITS[w])
+        elif w[0].isdigit():
+            out.append(w)
+        else:
+            out.append(stem(w))
+    return out
+
+
+def normalize_text(value: Any) -> str:
+    """Texto normalizado para trigramas y claves de caché ("" si no hay tokens)."""
+    return " ".join(tokens(value))
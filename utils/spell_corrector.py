@@ -0,0 +1,281 @@
+"""
+Corrector ortográfico de consultas de producto (SymSpell) a partir del catálogo.
+
+"mantequia" o "mozarela" no pasan el umbral trigram y acaban en Text-to-SQL,
+búsqueda híbrida, reintento y, a menudo, ``reportar_producto_no_encontrado``.
+Si la consulta tal cual no encuentra nada, las herramientas reintentan con
+la corrección (sin llamadas a modelos); una palabra bien escrita que el
+catálogo no tiene ("pulpo") nunca sustituye a una búsqueda con resultados:
+
+- Vocabulario: palabras de nombre_producto, marca, categoria_1 y categoria_2
+  (sin acentos, minúsculas) con su frecuencia en el catálogo. La ingesta lo
+  guarda en la tabla ``catalog_vocabulary`` (``build_catalog_vocabulary``)
+  antes de incrementar catalog_version.
+- Diccionario SymSpell: cada palabra indexada por todos sus borrados (hasta
+  ``max_distance`` caracteres, sobre los primeros ``prefix_length``). Una
+  búsqueda genera los borrados de la palabra escrita, une las listas y
+  verifica los candidatos con distancia Damerau-Levenshtein (OSA). Con
+  20k palabras: ~7 µs por palabra conocida, ~170 µs por palabra a corregir.
+- Solo se corrigen palabras que no están en el vocabulario (≥ 4 letras, ni
+  números, ni unidades, ni palabras vacías): distancia 1 hasta 5 letras, 2
+  a partir de 6. Entre candidatos gana la menor distancia y, a igualdad,
+  la palabra más frecuente.
+
+CatalogSpellCorrector se recarga en segundo plano cuando cambia
+catalog_version (ver utils/catalog_version.CatalogSnapshot); mientras no
+esté al día, ``correct`` devuelve None y la consulta se busca tal cual.
+
+Variables de entorno:
+    SPELL_CORRECTION_ENABLED           "false" para desactivarlo (def. true)
+    SPELL_CORRECTION_REFRESH_SECONDS   Cada cuánto se comprueba la versión (def. 30)
+"""
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, TypedDict
+
+from sqlalchemy import text
+
+from utils.catalog_version import CatalogSnapshot
+from utils.spanish_normalizer import STOPWORDS, UNITS, fold_accents
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[^\W\d_]+")  # solo letras
+_MIN_WORD = 4
+
+VOCABULARY_COLUMNS = ("nombre_producto", "marca", "categoria_1", "categoria_2")
+
+
+class SpellCorrection(TypedDict):
+    """Consulta reescrita por CatalogSpellCorrector.correct."""
+    original: str
+    corrected: str
+    words: List[Tuple[str, str]]   # (escrita, sugerida)
+
+
+# ── Vocabulario ─────────────────────────────────────────────────────
+def vocabulary_counts(texts: Iterable[Any]) -> Dict[str, Tuple[str, int]]:
+    """
+    palabra sin acentos → (forma más común en el catálogo, frecuencia).
+    La forma conserva los acentos para sugerirla al usuario ("jamón").
+    """
+    counts: Counter = Counter()
+    forms: Dict[str, Counter] = {}
+    for value in texts:
+        for word in _WORD.findall(str(value or "").lower()):
+            key = fold_accents(word)
+            if len(key) < 3 or key in STOPWORDS:
+                continue
+            counts[key] += 1
+            forms.setdefault(key, Counter())[word] += 1
+    return {key: (forms[key].most_common(1)[0][0], n) for key, n in counts.items()}
+
+
+def build_catalog_vocabulary(engine, batch_size: int = 10000) -> int:
+    """Recalcula ``catalog_vocabulary`` desde productos (ingesta). Devuelve nº de palabras."""
+    columns = ", ".join(VOCABULARY_COLUMNS)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            text(f"SELECT {columns} FROM productos")
+        )
+        vocabulary = vocabulary_counts(value for row in result for value in row)
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS catalog_vocabulary (
+                word    text PRIMARY KEY,
+                display text NOT NULL,
+                freq    integer NOT NULL
+            )
+        """))
+        conn.execute(text("TRUNCATE catalog_vocabulary"))
+        if vocabulary:
+            conn.execute(
+                text("INSERT INTO catalog_vocabulary (word, display, freq) VALUES (:w, :d, :f)"),
+                [{"w": w, "d": d, "f": f} for w, (d, f) in vocabulary.items()],
+            )
+    logger.info(f"🔤 Vocabulario del catálogo: {len(vocabulary)} palabras")
+    return len(vocabulary)
+
+
+# ── SymSpell ────────────────────────────────────────────────────────
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """``word`` y todas las cadenas que resultan de borrarle hasta max_distance caracteres."""
+    out = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - out
+        out |= frontier
+    return out
+
+
+def osa_distance(a: str, b: str, max_distance: int) -> int:
+    """Damerau-Levenshtein (optimal string alignment); max_distance + 1 si lo supera."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1] if prev[-1] <= max_distance else max_distance + 1
+
+
+class SymSpell:
+    """Diccionario de borrados precalculados sobre un vocabulario con frecuencias."""
+
+    def __init__(self, words: Dict[str, int], max_distance: int = 2, prefix_length: int = 7):
+        self.words = words
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes: Dict[str, List[str]] = {}
+        for word in words:
+            for d in _deletes(word[:prefix_length], max_distance):
+                self.deletes.setdefault(d, []).append(word)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def lookup(self, word: str, max_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """(palabra del vocabulario, distancia) más cercana, o None si no hay ninguna."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if word in self.words:
+            return word, 0
+        best: Optional[Tuple[int, int, str]] = None   # (distancia, -frecuencia, palabra)
+        seen: Set[str] = set()
+        for d in _deletes(word[:self.prefix_length], max_distance):
+            for candidate in self.deletes.get(d, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                dist = osa_distance(word, candidate, max_distance)
+                if dist > max_distance:
+                    continue
+                key = (dist, -self.words[candidate], candidate)
+                if best is None or key < best:
+                    best = key
+        return None if best is None else (best[2], best[0])
+
+
+# ── Corrector del catálogo ──────────────────────────────────────────
+class CatalogSpellCorrector(CatalogSnapshot):
+    """SymSpell sobre ``catalog_vocabulary`` para una versión del catálogo."""
+
+    _thread_name = "spell-corrector-build"
+
+    def __init__(self, engine=None, refresh_seconds: float = 30):
+        super().__init__(engine=engine, refresh_seconds=refresh_seconds)
+        # (versión, SymSpell, palabra → forma con acentos)
+        self._state: Optional[Tuple[int, SymSpell, Dict[str, str]]] = None
+        self._counters.update(queries=0, corrected=0, lookup_us_total=0.0)
+
+    def load(self, version: int, vocabulary: Dict[str, Tuple[str, int]]) -> None:
+        """Construye desde ``vocabulary_counts`` (palabra → (forma, frecuencia))."""
+        t0 = time.perf_counter()
+        symspell = SymSpell({w: f for w, (_, f) in vocabulary.items()})
+        self._state = (int(version), symspell, {w: d for w, (d, _) in vocabulary.items()})
+        logger.info(
+            f"🔤 Corrector v{version}: {len(symspell)} palabras, {len(symspell.deletes)} borrados "
+            f"en {time.perf_counter() - t0:.2f}s"
+        )
+
+    def _load_snapshot(self, engine, version: int) -> None:
+        with engine.connect() as conn:
+            if conn.execute(text("SELECT to_regclass('catalog_vocabulary')")).scalar() is None:
+                # Aún sin ingesta que lo genere: se calcula desde productos
+                columns = ", ".join(VOCABULARY_COLUMNS)
+                rows = conn.execute(text(f"SELECT {columns} FROM productos")).fetchall()
+                vocabulary = vocabulary_counts(value for row in rows for value in row)
+            else:
+                rows = conn.execute(text("SELECT word, display, freq FROM catalog_vocabulary")).fetchall()
+                vocabulary = {r.word: (r.display, int(r.freq)) for r in rows}
+        self.load(version, vocabulary)
+
+    def correct(self, query: str) -> Optional[SpellCorrection]:
+        """
+        Consulta con las palabras desconocidas sustituidas por su corrección.
+
+        None si no hay nada que corregir o el corrector no está disponible.
+        """
+        state = self._current_state()
+        if state is None or not query:
+            return None
+        _, symspell, display = state
+        t0 = time.perf_counter()
+        words: List[Tuple[str, str]] = []
+        pieces: List[str] = []
+        last = 0
+        for match in _WORD.finditer(query):
+            typed = match.group(0)
+            key = fold_accents(typed)
+            if len(key) < _MIN_WORD or key in STOPWORDS or key in UNITS or key in symspell.words:
+                continue
+            found = symspell.lookup(key, 1 if len(key) <= 5 else 2)
+            if found is None:
+                continue
+            suggestion = display[found[0]]
+            words.append((typed, suggestion))
+            pieces.append(query[last:match.start()] + suggestion)
+            last = match.end()
+        self._counters["queries"] += 1
+        self._counters["lookup_us_total"] += (time.perf_counter() - t0) * 1e6
+        if not words:
+            return None
+        self._counters["corrected"] += 1
+        corrected = "".join(pieces) + query[last:]
+        logger.info(f"🔤 Corrección: '{query}' → '{corrected}'")
+        return {"original": query, "corrected": corrected, "words": words}
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.snapshot_stats()
+        state = self._state
+        us_total = c.pop("lookup_us_total")
+        c["lookup_us_avg"] = round(us_total / c["queries"], 1) if c["queries"] else 0.0
+        c.update(
+            words=len(state[1]) if state else 0,
+            deletes=len(state[1].deletes) if state else 0,
+        )
+        return c
+
+
+# ── Singleton ───────────────────────────────────────────────────────
+_default_corrector: Optional[CatalogSpellCorrector] = None
+_default_lock = threading.Lock()
+
+
+def get_spell_corrector(engine=None) -> Optional[CatalogSpellCorrector]:
+    """
+    Corrector del proceso, o None si SPELL_CORRECTION_ENABLED="false".
+
+    ``engine`` (el pool compartido del servidor) solo se usa al crearlo;
+    sin él se usa el pool compartido de DATABASE_URL (chat/config/database.py).
+    """
+    global _default_corrector
+    if os.getenv("SPELL_CORRECTION_ENABLED", "true").lower() != "true":
+        return None
+    if _default_corrector is None:
+        with _default_lock:
+            if _default_corrector is None:
+                database_url = os.getenv("DATABASE_URL")
+                if engine is None and database_url:
+                    from chat.config.database import get_engine
+                    from utils.normalize_db_url import normalize_db_url
+
+                    engine = get_engine(normalize_db_url(database_url))
+                _default_corrector = CatalogSpellCorrector(
+                    engine=engine,
+                    refresh_seconds=float(os.getenv("SPELL_CORRECTION_REFRESH_SECONDS", "30")),
+                )
+                _default_corrector.refresh()  # primera construcción en segundo plano al arrancar
+    return _default_corrector
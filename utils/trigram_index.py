@@ -0,0 +1,269 @@
+"""
+Índice invertido de trigramas en proceso (compatible con pg_trgm).
+
+Reproduce ``similarity()`` de pg_trgm sin ir a la base de datos:
+
+- Texto en minúsculas, partido en palabras alfanuméricas.
+- Cada palabra se rellena con dos espacios delante y uno detrás
+  ("  cat " → "  c", " ca", "cat", "at ").
+- similarity(a, b) = comunes / (|A| + |B| - comunes) sobre los conjuntos
+  de trigramas, en float4 como Postgres.
+
+Las listas de postings viven en arrays NumPy contiguos (formato CSR:
+``offsets`` + ``postings``), indexando los textos distintos. Cada texto
+distinto apunta a los ids que lo comparten (muchas filas con la misma marca
+cuestan una sola entrada).
+
+CatalogTrigramIndex construye, a partir de una foto compacta de
+``productos`` (id, nombre_norm, marca_norm; sin SEARCH_NORMALIZATION,
+nombre_producto y marca) y ``proveedores`` (id,
+nombre_comercial), los índices que usa QueryNode para la pierna trigram de
+la búsqueda híbrida y para resolver nombres de proveedor. Se reconstruye en
+segundo plano cuando cambia ``catalog_version``; mientras no esté al día,
+los métodos devuelven None y QueryNode usa pg_trgm.
+
+Variables de entorno:
+    TRGM_INDEX_ENABLED           "true" para activar el índice local
+    TRGM_INDEX_REFRESH_SECONDS   Cada cuánto se comprueba la versión (def. 30)
+"""
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from utils.catalog_version import CatalogSnapshot
+from utils.spanish_normalizer import NORMALIZED_SEARCH
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[^\W_]+")  # alfanuméricos (pg_trgm: KEEPONLYALNUM)
+
+_EMPTY = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+
+def trigrams(value: str) -> Set[str]:
+    """Conjunto de trigramas de pg_trgm (equivale a ``show_trgm``)."""
+    out: Set[str] = set()
+    for word in _WORD.findall(str(value or "").lower()):
+        padded = f"  {word} "
+        out.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return out
+
+
+def similarity(a: str, b: str) -> float:
+    """``similarity(a, b)`` de pg_trgm."""
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 0.0
+    common = len(ta & tb)
+    return float(np.float32(common) / np.float32(len(ta) + len(tb) - common))
+
+
+class TrigramIndex:
+    """Índice invertido de trigramas sobre una lista de (texto, id)."""
+
+    def __init__(self, texts: Sequence[str], ids: Sequence[int]):
+        groups: Dict[str, List[int]] = {}
+        for value, row_id in zip(texts, ids):
+            groups.setdefault(value or "", []).append(int(row_id))
+
+        vocab: Dict[str, int] = {}
+        tids, docs, counts = array("I"), array("I"), array("I")
+        owner_ids, owner_offsets = array("q"), array("q", [0])
+        for doc, (value, owners) in enumerate(groups.items()):
+            grams = trigrams(value)
+            counts.append(len(grams))
+            for gram in grams:
+                tids.append(vocab.setdefault(gram, len(vocab)))
+                docs.append(doc)
+            owner_ids.extend(owners)
+            owner_offsets.append(len(owner_ids))
+
+        tids_np = np.frombuffer(tids, dtype=np.uint32) if tids else np.empty(0, dtype=np.uint32)
+        docs_np = np.frombuffer(docs, dtype=np.uint32) if docs else np.empty(0, dtype=np.uint32)
+        order = np.argsort(tids_np, kind="stable")
+        self._vocab = vocab
+        self._postings = docs_np[order]
+        self._offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tids_np, minlength=len(vocab)), out=self._offsets[1:])
+        self._ntrgm = np.array(counts, dtype=np.int64)
+        self._owner_ids = np.array(owner_ids, dtype=np.int64)
+        self._owner_offsets = np.array(owner_offsets, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self._owner_ids)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes de los arrays de postings (sin el vocabulario)."""
+        return sum(a.nbytes for a in (
+            self._postings, self._offsets, self._ntrgm, self._owner_ids, self._owner_offsets,
+        ))
+
+    def search(self, query: str, threshold: float = 0.3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ids con ``similarity(texto, query) >= threshold`` (el operador ``%``).
+
+        Devuelve (ids, similitudes) ordenados por similitud descendente.
+        """
+        grams = trigrams(query)
+        nq = len(grams)
+        slices = []
+        for gram in grams:
+            t = self._vocab.get(gram)
+            if t is not None:
+                slices.append(self._postings[self._offsets[t]:self._offsets[t + 1]])
+        if not slices:
+            return _EMPTY
+        hits = np.concatenate(slices)
+
+        # Conteo de trigramas comunes: bincount si los hits cubren buena parte
+        # del índice, unique (ordenación) si son pocos.
+        if len(hits) * 8 > len(self._ntrgm):
+            counts = np.bincount(hits, minlength=len(self._ntrgm))
+            docs = np.flatnonzero(counts)
+            common = counts[docs]
+        else:
+            docs, common = np.unique(hits, return_counts=True)
+
+        sims = common.astype(np.float32) / (self._ntrgm[docs] + nq - common).astype(np.float32)
+        keep = sims.astype(np.float64) >= threshold
+        docs, sims = docs[keep], sims[keep]
+        if not len(docs):
+            return _EMPTY
+
+        # Expande cada texto distinto a los ids que lo comparten
+        starts = self._owner_offsets[docs]
+        lens = self._owner_offsets[docs + 1] - starts
+        idx = np.repeat(starts - np.cumsum(lens) + lens, lens) + np.arange(lens.sum())
+        ids = self._owner_ids[idx]
+        sims = np.repeat(sims, lens)
+        order = np.argsort(-sims, kind="stable")
+        return ids[order], sims[order]
+
+
+class CatalogTrigramIndex(CatalogSnapshot):
+    """Índices de nombre_producto, marca y nombre_comercial para una versión del catálogo."""
+
+    _thread_name = "trgm-index-build"
+
+    def __init__(self, engine=None, refresh_seconds: float = 30):
+        super().__init__(engine=engine, refresh_seconds=refresh_seconds)
+        # (versión, productos.nombre, productos.marca, proveedores.nombre)
+        self._state: Optional[Tuple[int, TrigramIndex, TrigramIndex, TrigramIndex]] = None
+        self._counters.update(product_searches=0, provider_lookups=0)
+
+    # ── Construcción ────────────────────────────────────────────────
+    def load(self, version: int, productos: Sequence[Tuple], proveedores: Sequence[Tuple]) -> None:
+        """Construye desde filas (id, nombre, marca) y (id, nombre_comercial)."""
+        t0 = time.perf_counter()
+        prod_ids = [r[0] for r in productos]
+        state = (
+            int(version),
+            TrigramIndex([r[1] for r in productos], prod_ids),
+            TrigramIndex([r[2] for r in productos], prod_ids),
+            TrigramIndex([r[1] for r in proveedores], [r[0] for r in proveedores]),
+        )
+        self._state = state
+        logger.info(
+            f"🔤 Índice trigram v{version}: {len(productos)} productos, "
+            f"{len(proveedores)} proveedores en {time.perf_counter() - t0:.2f}s"
+        )
+
+    def _load_snapshot(self, engine, version: int) -> None:
+        with engine.connect() as conn:
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+            # Mismas columnas que la pierna trigram en SQL (ver QueryNode)
+            name, brand = ("nombre_norm", "marca_norm") if NORMALIZED_SEARCH else ("nombre_producto", "marca")
+            productos = conn.execute(
+                text(f"SELECT id, COALESCE({name}, ''), COALESCE({brand}, '') FROM productos")
+            ).fetchall()
+            proveedores = conn.execute(
+                text("SELECT id_proveedor, COALESCE(nombre_comercial, '') FROM proveedores")
+            ).fetchall()
+        self.load(version, productos, proveedores)
+
+    # ── Consultas ───────────────────────────────────────────────────
+    def search_products(self, query: str, threshold: float = 0.3) -> Optional[Tuple[List[int], List[float]]]:
+        """
+        Productos con ``nombre_producto % q OR COALESCE(marca, '') % q`` y su
+        ``GREATEST(similarity(nombre), similarity(marca))``.
+
+        None si el índice no está disponible (usar pg_trgm).
+        """
+        state = self._current_state()
+        if state is None:
+            return None
+        _, by_name, by_brand, _ = state
+        n_ids, n_sims = by_name.search(query, threshold)
+        b_ids, b_sims = by_brand.search(query, threshold)
+        ids = np.concatenate([n_ids, b_ids])
+        sims = np.concatenate([n_sims, b_sims])
+        # GREATEST por id: si solo pasó un campo, el otro está por debajo del umbral
+        order = np.lexsort((-sims, ids))
+        ids, sims = ids[order], sims[order]
+        first = np.ones(len(ids), dtype=bool)
+        first[1:] = ids[1:] != ids[:-1]
+        self._counters["product_searches"] += 1
+        return ids[first].tolist(), sims[first].astype(float).tolist()
+
+    def resolve_provider(self, nombre: str, threshold: float = 0.3) -> Optional[List[Tuple[int, float]]]:
+        """
+        Proveedores con ``nombre_comercial % nombre`` por similitud descendente.
+
+        Lista vacía si no hay ninguno; None si el índice no está disponible.
+        """
+        state = self._current_state()
+        if state is None:
+            return None
+        ids, sims = state[3].search(nombre, threshold)
+        self._counters["provider_lookups"] += 1
+        return list(zip(ids.tolist(), sims.astype(float).tolist()))
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.snapshot_stats()
+        state = self._state
+        c.update(
+            productos=len(state[1]) if state else 0,
+            proveedores=len(state[3]) if state else 0,
+            bytes=sum(ix.nbytes for ix in state[1:]) if state else 0,
+        )
+        return c
+
+
+# ── Singleton ───────────────────────────────────────────────────────
+_default_index: Optional[CatalogTrigramIndex] = None
+_default_lock = threading.Lock()
+
+
+def get_trigram_index(engine=None) -> Optional[CatalogTrigramIndex]:
+    """
+    Índice del proceso, o None si TRGM_INDEX_ENABLED no está activo.
+
+    ``engine`` (el pool compartido del servidor) solo se usa al crearlo;
+    sin él se usa el pool compartido de DATABASE_URL (chat/config/database.py).
+    """
+    global _default_index
+    if os.getenv("TRGM_INDEX_ENABLED", "").lower() != "true":
+        return None
+    if _default_index is None:
+        with _default_lock:
+            if _default_index is None:
+                database_url = os.getenv("DATABASE_URL")
+                if engine is None and database_url:
+                    from chat.config.database import get_engine
+                    from utils.normalize_db_url import normalize_db_url
+
+                    engine = get_engine(normalize_db_url(database_url))
+                _default_index = CatalogTrigramIndex(
+                    engine=engine,
+                    refresh_seconds=float(os.getenv("TRGM_INDEX_REFRESH_SECONDS", "30")),
+                )
+                _default_index.refresh()  # primera construcción en segundo plano al arrancar
+    return _default_index
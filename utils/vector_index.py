@@ -0,0 +1,300 @@
+"""
+Índice vectorial en proceso sobre ficheros mmap.
+
+La ingesta exporta los embeddings de ``productos`` como una matriz contigua
+(float32 o float16, filas normalizadas L2) más un array de ids, en ficheros
+``.npy`` versionados con la versión del catálogo (utils/catalog_version.py).
+Cada worker del servidor los abre con ``np.load(mmap_mode="r")``: el mapeo
+es de solo lectura y compartido, así que todos los workers usan las mismas
+páginas de la caché del sistema operativo (cero copias).
+
+La pierna vectorial de la búsqueda híbrida se resuelve aquí con productos
+punto por bloques (similitud coseno exacta, sin red) y a Postgres solo se
+le piden las filas por id.
+
+Refresco atómico: ``manifest.json`` apunta a los ficheros de la versión
+vigente y se sustituye con ``os.replace``. Si la versión del catálogo en
+Postgres es más nueva que la del manifest (p.ej. la ingesta corrió en otra
+máquina), el índice deja de usarse y se reconstruye en segundo plano, con
+un ``flock`` para que solo un worker lo haga. Mientras tanto ``search()``
+devuelve None y QueryNode usa pgvector.
+
+Variables de entorno:
+    VECTOR_INDEX_ENABLED           "true" para activar el índice local
+    VECTOR_INDEX_DIR               Directorio de los ficheros (def. /tmp/vector_index)
+    VECTOR_INDEX_DTYPE             float32 | float16 (def. float32)
+    VECTOR_INDEX_REFRESH_SECONDS   Cada cuánto se comprueba la versión (def. 30)
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
+from utils.catalog_version import CatalogSnapshot
+from utils.embedding_storage import EMBEDDING_DIMENSIONS
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+_LOCK_FILE = ".lock"
+_CHUNK_ROWS = 65536  # filas por bloque en el producto punto (acota memoria temporal)
+
+
+def _parse_vector(value: str) -> np.ndarray:
+    """'[0.1,0.2,...]' (salida textual de pgvector) → float32."""
+    return np.array(value.strip("[]").split(","), dtype=np.float32)
+
+
+def _read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"⚠️  Manifest del índice vectorial ilegible: {e}")
+        return None
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def export_vector_index(
+    engine,
+    directory: str,
+    version: int,
+    dtype: str = "float32",
+    batch_size: int = 5000,
+) -> Dict[str, Any]:
+    """
+    Exporta los embeddings de ``productos`` y publica la versión.
+
+    Lee en streaming dentro de una transacción REPEATABLE READ (count y scan
+    ven la misma foto), escribe los ``.npy`` en ficheros temporales y al
+    final sustituye el manifest de forma atómica. Conserva la versión
+    anterior para los workers que aún la estén abriendo.
+    """
+    os.makedirs(directory, exist_ok=True)
+    np_dtype = np.dtype(dtype)
+    vectors_name = f"vectors-v{version}.npy"
+    ids_name = f"ids-v{version}.npy"
+    t0 = time.perf_counter()
+
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        count = conn.execute(
+            text("SELECT count(*) FROM productos WHERE embedding IS NOT NULL")
+        ).scalar_one()
+        first = conn.execute(
+            text("SELECT embedding::text AS e FROM productos WHERE embedding IS NOT NULL LIMIT 1")
+        ).fetchone()
+        dim = len(_parse_vector(first.e)) if first else EMBEDDING_DIMENSIONS
+
+        vectors_tmp = os.path.join(directory, vectors_name + ".tmp")
+        matrix = np.lib.format.open_memmap(vectors_tmp, mode="w+", dtype=np_dtype, shape=(count, dim))
+        ids = np.empty(count, dtype=np.int64)
+
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+            text("SELECT id, embedding::text AS e FROM productos WHERE embedding IS NOT NULL ORDER BY id")
+        )
+        n = 0
+        for row in result:
+            vec = _parse_vector(row.e)
+            norm = float(np.linalg.norm(vec))
+            matrix[n] = vec / norm if norm else vec
+            ids[n] = row.id
+            n += 1
+        matrix.flush()
+        del matrix
+
+    ids_tmp = os.path.join(directory, ids_name + ".tmp")
+    with open(ids_tmp, "wb") as f:
+        np.save(f, ids[:n])
+    os.replace(vectors_tmp, os.path.join(directory, vectors_name))
+    os.replace(ids_tmp, os.path.join(directory, ids_name))
+
+    previous = _read_manifest(directory)
+    manifest = {
+        "version": int(version),
+        "dtype": np_dtype.name,
+        "count": n,
+        "dim": dim,
+        "vectors": vectors_name,
+        "ids": ids_name,
+        "built_at": time.time(),
+    }
+    _write_atomic(os.path.join(directory, MANIFEST), json.dumps(manifest).encode("utf-8"))
+
+    # Limpieza: se conservan la versión nueva y la inmediatamente anterior
+    keep = {vectors_name, ids_name, MANIFEST, _LOCK_FILE}
+    if previous:
+        keep |= {previous.get("vectors"), previous.get("ids")}
+    for name in os.listdir(directory):
+        if name not in keep and (name.startswith("vectors-v") or name.startswith("ids-v")):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+    logger.info(
+        f"📐 Índice vectorial v{version} exportado: {n} vectores × {dim} "
+        f"({np_dtype.name}) en {time.perf_counter() - t0:.1f}s"
+    )
+    return manifest
+
+
+class MmapVectorIndex(CatalogSnapshot):
+    """
+    Búsqueda coseno exacta sobre la matriz mmap de la versión vigente.
+
+    El estado cargado (versión, matriz, ids) es una tupla que se sustituye
+    de una vez, así que un ``search()`` concurrente nunca ve una mezcla de
+    dos versiones. Sin engine solo se mapea lo que publique el manifest.
+    """
+
+    _thread_name = "vector-index-build"
+
+    def __init__(
+        self,
+        directory: str,
+        refresh_seconds: float = 30,
+        engine=None,
+        dtype: str = "float32",
+    ):
+        super().__init__(engine=engine, refresh_seconds=refresh_seconds)
+        self.directory = directory
+        self.dtype = dtype
+        self._state: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+        self._manifest_check: Optional[float] = None
+        self._counters.update(searches=0, loads=0)
+
+    # ── Carga / refresco ────────────────────────────────────────────
+    def _map(self, manifest: Dict[str, Any]) -> None:
+        vectors = np.load(os.path.join(self.directory, manifest["vectors"]), mmap_mode="r")
+        ids = np.load(os.path.join(self.directory, manifest["ids"]), mmap_mode="r")
+        self._state = (int(manifest["version"]), vectors, ids)
+        self._counters["loads"] += 1
+        logger.info(f"📐 Índice vectorial v{manifest['version']} mapeado ({len(ids)} vectores)")
+
+    def refresh(self, force: bool = False) -> None:
+        """Mapea la versión publicada en el manifest y comprueba la del catálogo."""
+        now = time.monotonic()
+        if force or self._manifest_check is None or now - self._manifest_check >= self.refresh_seconds:
+            self._manifest_check = now
+            # Otro worker (o la ingesta) pudo publicar ya una versión nueva
+            manifest = _read_manifest(self.directory)
+            if manifest and manifest["version"] != self.loaded_version:
+                try:
+                    self._map(manifest)
+                except Exception as e:
+                    logger.warning(f"⚠️  No se pudo mapear el índice vectorial: {e}")
+        super().refresh(force=force)
+
+    def _load_snapshot(self, engine, version: int) -> None:
+        """Exporta ``version`` si nadie la publicó y la mapea (un solo proceso a la vez gracias al flock)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, _LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                manifest = _read_manifest(self.directory)
+                if not manifest or manifest["version"] != version:
+                    manifest = export_vector_index(engine, self.directory, version, dtype=self.dtype)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self._map(manifest)
+
+    # ── Búsqueda ────────────────────────────────────────────────────
+    def search(self, embedding: List[float], k: int) -> Optional[Tuple[List[int], List[float]]]:
+        """
+        Top-k por similitud coseno.
+
+        Devuelve (ids, similitudes) en orden descendente, o None si el
+        índice no está disponible o está desfasado respecto al catálogo.
+        """
+        if embedding is None:
+            self._counters["stale_fallbacks"] += 1
+            return None
+        state = self._current_state()
+        if state is None:
+            return None
+        _, vectors, ids = state
+        n = len(ids)
+        if n == 0 or k <= 0:
+            return [], []
+
+        q = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm:
+            q = q / norm
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _CHUNK_ROWS):
+            block = vectors[start:start + _CHUNK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ q
+
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        self._counters["searches"] += 1
+        return ids[top].tolist(), scores[top].astype(float).tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.snapshot_stats()
+        state = self._state
+        c.update(directory=self.directory, vectors=len(state[2]) if state else 0)
+        return c
+
+
+# ── Singleton ───────────────────────────────────────────────────────
+_default_index: Optional[MmapVectorIndex] = None
+_default_lock = threading.Lock()
+
+
+def vector_index_settings() -> Dict[str, Any]:
+    """Configuración del índice local leída del entorno."""
+    return {
+        "enabled": os.getenv("VECTOR_INDEX_ENABLED", "").lower() == "true",
+        "directory": os.getenv("VECTOR_INDEX_DIR", "/tmp/vector_index"),
+        "dtype": os.getenv("VECTOR_INDEX_DTYPE", "float32"),
+        "refresh_seconds": float(os.getenv("VECTOR_INDEX_REFRESH_SECONDS", "30")),
+    }
+
+
+def get_vector_index(engine=None) -> Optional[MmapVectorIndex]:
+    """
+    Índice del proceso, o None si VECTOR_INDEX_ENABLED no está activo.
+
+    ``engine`` (el pool compartido del servidor) solo se usa al crearlo;
+    sin él se usa el pool compartido de DATABASE_URL (chat/config/database.py).
+    """
+    global _default_index
+    cfg = vector_index_settings()
+    if not cfg["enabled"]:
+        return None
+    if _default_index is None:
+        with _default_lock:
+            if _default_index is None:
+                database_url = os.getenv("DATABASE_URL")
+                if engine is None and database_url:
+                    from chat.config.database import get_engine
+                    from utils.normalize_db_url import normalize_db_url
+
+                    engine = get_engine(normalize_db_url(database_url))
+                _default_index = MmapVectorIndex(
+                    cfg["directory"],
+                    refresh_seconds=cfg["refresh_seconds"],
+                    engine=engine,
+                    dtype=cfg["dtype"],
+                )
+    return _default_index
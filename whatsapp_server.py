@@ -466,6 +466,47 @@ async def list_sessions():
     }
 
 
+@app.get("/stats")
+async def search_stats():
+    """Search-layer cache counters (for monitoring)."""
+    from utils.embedding_cache import get_embedding_cache
+    from utils.llm_clients import get_llm_clients
+    from chat.services.query_planner import query_planner
+    from chat.services.plan_cache import sql_plan_cache
+    from chat.services.search_race import search_racer
+    from chat.services.search_cascade import search_cascade
+    from chat.services.result_cache import search_result_cache
+    from chat.services.provider_directory import provider_directory
+    from chat.services.session_candidates import session_candidates
+    from chat.services.prefetch import prefetcher
+    from chat.services.tool_memo import tool_memo
+    from chat.config.database import pool_stats
+    from utils.spell_corrector import get_spell_corrector
+    from utils.trigram_index import get_trigram_index
+    from utils.vector_index import get_vector_index
+
+    vector_index = get_vector_index()
+    trigram_index = get_trigram_index()
+    spell_corrector = get_spell_corrector()
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "query_planner": query_planner.stats(),
+        "sql_plan_cache": sql_plan_cache.stats(),
+        "search_race": search_racer.stats(),
+        "search_cascade": search_cascade.stats(),
+        "result_cache": search_result_cache.stats(),
+        "vector_index": vector_index.stats() if vector_index else {"enabled": False},
+        "trigram_index": trigram_index.stats() if trigram_index else {"enabled": False},
+        "provider_directory": provider_directory.stats(),
+        "session_candidates": session_candidates.stats(),
+        "prefetch": prefetcher.stats(),
+        "tool_memo": tool_memo.stats(),
+        "spell_corrector": spell_corrector.stats() if spell_corrector else {"enabled": False},
+        "db_pools": pool_stats(),
+        "llm_clients": get_llm_clients().stats(),
+    }
+
+
 @app.delete("/sessions/{phone}")
 async def reset_session(phone: str):
     """Reset a specific session (for debugging)."""